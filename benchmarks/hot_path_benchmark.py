@@ -0,0 +1,230 @@
+"""
+Benchmarks of the load, transform and render hot paths on synthetic tracking plays.
+
+Every benchmark reports its time per play (or per field, or per frame for animate_frameId) and the peak memory allocated
+by one call, measured separately with tracemalloc so it does not slow down the timings.
+
+Usage, from the directory containing the CastleDefense checkout:
+    python CastleDefense/benchmarks/hot_path_benchmark.py --plays 5 --frames 60 --json baseline.json
+    python CastleDefense/benchmarks/hot_path_benchmark.py --compare baseline.json --tolerance 0.25
+With --compare, exits with status 1 when a benchmark's median time regressed by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+repository_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(repository_path))
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from CastleDefense.utils.extractPlayDataUtils import load_play, load_play_data, load_teams_from_play, \
+    get_play_by_id, assign_player_display_identifier, adjust_frameIds_for_initial_zoom, \
+    adjust_frameIds_for_zoom_effect  # noqa: E402
+from CastleDefense.utils.visualizeFieldUtils import create_football_field, plt  # noqa: E402
+from CastleDefense.utils.animatePlayUtils import animate_frameId, build_play_blocker_index  # noqa: E402
+from CastleDefense.utils.playTensorUtils import build_play_tensor  # noqa: E402
+from synthetic_tracking import preload_synthetic_week  # noqa: E402
+
+
+def measure(function, setup=None, repeat=3, teardown=None):
+    """
+    Times function(*setup()) repeat times. setup and teardown run outside the timed section.
+    Returns:
+        List of seconds per call
+    """
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown(result)
+    return timings
+
+
+def peak_memory(function, setup=None, teardown=None):
+    """
+    Returns the peak number of bytes allocated while running function(*setup()) once.
+    """
+    args = setup() if setup is not None else ()
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if teardown is not None:
+        teardown(result)
+    return peak
+
+
+def summarize(name, unit, timings, peaks):
+    timings_ms = sorted(seconds * 1000 for seconds in timings)
+    return {'benchmark': name, 'unit': unit, 'n': len(timings_ms),
+            'mean_ms': statistics.mean(timings_ms),
+            'median_ms': statistics.median(timings_ms),
+            'p95_ms': timings_ms[min(len(timings_ms) - 1, int(round(0.95 * (len(timings_ms) - 1))))],
+            'peak_kib': max(peaks) / 1024}
+
+
+def close_figure(result):
+    plt.close(result[0])
+
+
+def draw_figure(fig, ax):
+    fig.canvas.draw()
+    return fig, ax
+
+
+def benchmark_play(play_key, repeat):
+    """
+    Runs the per play benchmarks on one play.
+    Returns:
+        Dictionary of benchmark name to (unit, timings, peaks)
+    """
+    gameId, playId, week = play_key
+    play = get_play_by_id(gameId, playId)
+    play_df = load_play_data(playId, gameId, week)
+    offense, defense, football = load_play(playId, gameId, week)
+
+    def team_copies():
+        return offense.copy(), defense.copy(), football.copy(), {}
+
+    benchmarks = {
+        'load_play': (lambda: load_play(playId, gameId, week), None, None),
+        'load_teams_from_play': (lambda: load_teams_from_play(play_df, play, gameId), None, None),
+        'assign_player_display_identifier[jersey]': (
+            lambda o, d: assign_player_display_identifier(o, d, display_position=False),
+            lambda: (offense.copy(), defense.copy()), None),
+        'assign_player_display_identifier[position]': (
+            lambda o, d: assign_player_display_identifier(o, d, display_position=True),
+            lambda: (offense.copy(), defense.copy()), None),
+        'adjust_frameIds_for_initial_zoom': (adjust_frameIds_for_initial_zoom, team_copies, None),
+        'adjust_frameIds_for_zoom_effect': (adjust_frameIds_for_zoom_effect, team_copies, None),
+        'create_football_field': (lambda: create_football_field(), None, close_figure),
+        'create_football_field[vector]': (lambda: create_football_field(cached_background=False), None, close_figure),
+        # One frame's redraw of the static field, cached raster against vector markings
+        'draw_football_field': (draw_figure, lambda: create_football_field(), close_figure),
+        'draw_football_field[vector]': (draw_figure, lambda: create_football_field(cached_background=False),
+                                        close_figure),
+    }
+
+    results = {}
+    for name, (function, setup, teardown) in benchmarks.items():
+        unit = 'field' if 'football_field' in name else 'play'
+        timings = measure(function, setup, repeat, teardown)
+        results[name] = (unit, timings, [peak_memory(function, setup, teardown)])
+    return results
+
+
+def benchmark_frames(play_key, plot_blockers=True):
+    """
+    Times animate_frameId on every frame of one play, alone and followed by drawing the canvas, like one frame of
+    animate_func_play without zoom effects.
+    Returns:
+        Dictionary of benchmark name to (unit, timings, peaks)
+    """
+    gameId, playId, week = play_key
+    offense, defense, football = load_play(playId, gameId, week)
+    offense, defense = assign_player_display_identifier(offense, defense, display_position=False)
+    offense_tensor, defense_tensor, football_tensor = [build_play_tensor(df) for df in [offense, defense, football]]
+    blocker_index = build_play_blocker_index(offense_tensor) if plot_blockers else None
+
+    fig, ax = create_football_field()
+    fig.canvas.draw()
+
+    def animate(frameId):
+        return animate_frameId(ax, frameId, offense_tensor, defense_tensor, football_tensor,
+                               plot_blockers=plot_blockers, blockers=blocker_index)
+
+    def remove(patch):
+        # ax.plot returns lists of lines
+        for artist in patch:
+            [line.remove() for line in artist] if isinstance(artist, list) else artist.remove()
+
+    timings, draw_timings, peaks = [], [], []
+    for frameId in offense_tensor.frame_ids:
+        start = time.perf_counter()
+        patch = animate(frameId)
+        timings.append(time.perf_counter() - start)
+        fig.canvas.draw()
+        draw_timings.append(time.perf_counter() - start)
+        remove(patch)
+
+    # Peak memory of one frame in the middle of the play
+    middle_frameId = offense_tensor.frame_ids[len(offense_tensor.frame_ids) // 2]
+    peaks.append(peak_memory(lambda: animate(middle_frameId), teardown=remove))
+
+    plt.close(fig)
+    return {'animate_frameId': ('frame', timings, peaks),
+            'animate_frameId+draw': ('frame', draw_timings, peaks)}
+
+
+def run_benchmarks(n_plays=5, n_frames=60, repeat=3, only=None):
+    """
+    Runs every benchmark on n_plays synthetic plays of n_frames frames.
+    Returns:
+        List of summary rows, one per benchmark
+    """
+    play_keys = preload_synthetic_week(n_plays=n_plays, n_frames=n_frames)
+    collected = {}
+    for play_key in play_keys:
+        play_results = dict(benchmark_play(play_key, repeat), **benchmark_frames(play_key))
+        for name, (unit, timings, peaks) in play_results.items():
+            if only and name not in only:
+                continue
+            entry = collected.setdefault(name, (unit, [], []))
+            entry[1].extend(timings)
+            entry[2].extend(peaks)
+
+    return [summarize(name, unit, timings, peaks) for name, (unit, timings, peaks) in collected.items()]
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Returns the benchmarks whose median time is more than tolerance slower than the baseline.
+    """
+    baseline_medians = {row['benchmark']: row['median_ms'] for row in baseline}
+    return [(row['benchmark'], baseline_medians[row['benchmark']], row['median_ms']) for row in results
+            if row['benchmark'] in baseline_medians
+            and row['median_ms'] > baseline_medians[row['benchmark']] * (1 + tolerance)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the load, transform and render hot paths.')
+    parser.add_argument('--plays', type=int, default=5, help='Number of synthetic plays')
+    parser.add_argument('--frames', type=int, default=60, help='Frames per synthetic play')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed calls per play and benchmark')
+    parser.add_argument('--only', nargs='*', default=None, help='Benchmarks to report')
+    parser.add_argument('--json', default=None, help='Writes the results to this json file')
+    parser.add_argument('--compare', default=None, help='Baseline json file written by --json')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.plays, args.frames, args.repeat, args.only)
+
+    print(f"{'benchmark':<46}{'unit':>6}{'n':>6}{'mean ms':>10}{'median ms':>11}{'p95 ms':>9}{'peak KiB':>10}")
+    for row in results:
+        print(f"{row['benchmark']:<46}{row['unit']:>6}{row['n']:>6}{row['mean_ms']:>10.2f}{row['median_ms']:>11.2f}"
+              f"{row['p95_ms']:>9.2f}{row['peak_kib']:>10.0f}")
+
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.tolerance)
+        for name, baseline_ms, median_ms in regressions:
+            print(f'REGRESSION {name}: {baseline_ms:.2f} ms -> {median_ms:.2f} ms')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
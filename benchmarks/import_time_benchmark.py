@@ -0,0 +1,107 @@
+"""
+Import time benchmark for the utils modules.
+
+Imports every module in a fresh interpreter, reports the median import time and checks that importing it:
+    - does not load matplotlib (plotting modules load it lazily, data loaders never need it), except the modules of
+      ALLOWED_IMPORTS
+    - does not load scipy
+    - does not create, modify or delete files in the repository
+
+Usage, from the directory containing the CastleDefense checkout:
+    python CastleDefense/benchmarks/import_time_benchmark.py --repeat 5 --max-seconds 1.5
+Exits with status 1 when a check fails or a module is slower than --max-seconds.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+repository_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Every module of utils, so new modules are guarded without editing this list
+MODULES = sorted(os.path.splitext(os.path.basename(path))[0]
+                 for path in glob.glob(os.path.join(repository_path, 'utils', '*.py'))
+                 if not os.path.basename(path).startswith('__'))
+
+FORBIDDEN_MODULES = ['matplotlib', 'scipy']
+
+# Forbidden modules a utils module may load. fieldRasterUtils subclasses matplotlib's Artist at import time and is only
+# imported lazily by visualizeFieldUtils, the first time a field is drawn
+ALLOWED_IMPORTS = {
+    'fieldRasterUtils': ['matplotlib'],
+}
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import CastleDefense.utils.{module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+
+def snapshot_files(path=repository_path):
+    """
+    Returns the mtime of every file in the repository, ignoring bytecode caches and git internals.
+    """
+    files = {}
+    for root, directories, file_names in os.walk(path):
+        directories[:] = [d for d in directories if d not in ('.git', '__pycache__')]
+        for file_name in file_names:
+            file_path = os.path.join(root, file_name)
+            files[file_path] = os.stat(file_path).st_mtime_ns
+    return files
+
+
+def time_import(module, repeat):
+    """
+    Imports a utils module in `repeat` fresh interpreters.
+    Returns:
+        Tuple of the median import time in seconds and the forbidden modules that were loaded
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(repository_path), MPLBACKEND='Agg')
+    script = IMPORT_SCRIPT.format(module=module, forbidden=FORBIDDEN_MODULES)
+    timings, loaded = [], set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        loaded.update(result['loaded'])
+    return statistics.median(timings), sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark and guard the import of the utils modules.')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per module')
+    parser.add_argument('--max-seconds', type=float, default=None, help='Fails modules slower than this')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args(argv)
+
+    failures = []
+    files_before = snapshot_files()
+    print(f"{'module':<24}{'seconds':>10}  loaded")
+    for module in args.modules:
+        seconds, loaded = time_import(module, args.repeat)
+        print(f"{module:<24}{seconds:>10.3f}  {', '.join(loaded) or '-'}")
+        forbidden = [name for name in loaded if name not in ALLOWED_IMPORTS.get(module, [])]
+        if forbidden:
+            failures.append(f'{module} imports {", ".join(forbidden)}')
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            failures.append(f'{module} takes {seconds:.3f}s to import (max {args.max_seconds}s)')
+
+    files_after = snapshot_files()
+    changed_files = sorted(path for path in set(files_before) | set(files_after)
+                           if files_before.get(path) != files_after.get(path))
+    if changed_files:
+        failures.append('importing changed files: ' + ', '.join(changed_files))
+
+    for failure in failures:
+        print('FAIL', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
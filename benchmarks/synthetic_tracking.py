@@ -0,0 +1,137 @@
+"""
+Synthetic tracking fixtures for the benchmarks.
+
+Builds tracking rows with the exact columns and dtypes of tracking_week_N.csv for real plays of overview_data, so the
+loaders, the metadata lookups (games, plays, players) and the plots run on them unchanged. Players are drawn from
+players.csv by position, move with a smooth random walk and the play has the usual events (ball_snap, handoff,
+first_contact, tackle).
+"""
+import numpy as np
+import pandas as pd
+from CastleDefense.utils.metadataUtils import get_metadata_repository
+from CastleDefense.utils.schemaUtils import TRACKING_DTYPES
+from CastleDefense.utils.trackingStoreUtils import preload_tracking_dataframe
+
+# Week number the synthetic plays are served under. No real week uses it
+SYNTHETIC_WEEK = 99
+
+TRACKING_COLUMNS = ['gameId', 'playId', 'nflId', 'displayName', 'frameId', 'time', 'jerseyNumber', 'club',
+                    'playDirection', 'x', 'y', 's', 'a', 'dis', 'o', 'dir', 'event']
+
+OFFENSE_POSITIONS = ['QB', 'RB', 'WR', 'WR', 'WR', 'TE', 'T', 'T', 'G', 'G', 'C']
+DEFENSE_POSITIONS = ['CB', 'CB', 'SS', 'FS', 'OLB', 'OLB', 'ILB', 'DE', 'DE', 'DT', 'NT']
+
+
+def _pick_players(players_df, positions, rng):
+    """
+    Returns one distinct player row per position, falling back to any player for positions missing from players.csv.
+    """
+    picked = []
+    for position in positions:
+        candidates = players_df[(players_df['position'] == position) & ~players_df['nflId'].isin(picked)]
+        if candidates.empty:
+            candidates = players_df[~players_df['nflId'].isin(picked)]
+        picked.append(int(candidates['nflId'].iloc[rng.integers(len(candidates))]))
+    return players_df.set_index('nflId').loc[picked].reset_index()
+
+
+def generate_play_tracking(gameId, playId, n_frames=60, seed=0):
+    """
+    Generates the tracking rows of one play: 22 players and the football for n_frames frames.
+    Args:
+        gameId: Game of the play in games.csv
+        playId: Play in plays.csv
+        n_frames: Number of frames. Real plays have 40 to 120
+        seed: Random seed
+    Returns:
+        pandas.DataFrame with the tracking csv columns and schemaUtils.TRACKING_DTYPES
+    """
+    rng = np.random.default_rng(seed)
+    repository = get_metadata_repository()
+    play = repository.get_play(gameId, playId).iloc[0]
+    players_df = repository.players
+
+    play_direction = rng.choice(['left', 'right'])
+    forward = 1 if play_direction == 'right' else -1
+    line_of_scrimmage = float(play['absoluteYardlineNumber'])
+    frame_ids = np.arange(1, n_frames + 1)
+    events = {1: 'ball_snap', n_frames // 4: 'handoff', n_frames // 2: 'first_contact', n_frames - 5: 'tackle'}
+
+    team_dfs = []
+    for club, positions, side in [(play['possessionTeam'], OFFENSE_POSITIONS, -1),
+                                  (play['defensiveTeam'], DEFENSE_POSITIONS, 1)]:
+        team_players = _pick_players(players_df, positions, rng)
+        n_players = len(team_players)
+
+        # Smooth random walk starting on each side of the line of scrimmage
+        start_x = line_of_scrimmage + forward * side * rng.uniform(1, 10, n_players)
+        start_y = rng.uniform(5, 48, n_players)
+        steps = rng.normal(0, 0.15, (n_frames, n_players, 2)) + np.array([forward * 0.2, 0])
+        positions_xy = np.stack([start_x, start_y], axis=-1) + np.cumsum(steps, axis=0)
+
+        team_dfs.append(pd.DataFrame({
+            'nflId': np.tile(team_players['nflId'].to_numpy(), n_frames),
+            'displayName': np.tile(team_players['displayName'].to_numpy(), n_frames),
+            'frameId': np.repeat(frame_ids, n_players),
+            'jerseyNumber': np.tile(rng.choice(np.arange(1, 100), n_players, replace=False), n_frames),
+            'club': club,
+            'x': positions_xy[:, :, 0].ravel(),
+            'y': positions_xy[:, :, 1].ravel(),
+            's': rng.uniform(0, 8, n_frames * n_players),
+            'a': rng.uniform(0, 4, n_frames * n_players),
+            'dis': rng.uniform(0, 0.8, n_frames * n_players),
+            'o': rng.uniform(0, 360, n_frames * n_players),
+            'dir': rng.uniform(0, 360, n_frames * n_players),
+        }))
+
+    football_x = line_of_scrimmage + forward * np.cumsum(np.full(n_frames, 0.25))
+    team_dfs.append(pd.DataFrame({
+        'nflId': np.nan, 'displayName': 'football', 'frameId': frame_ids, 'jerseyNumber': np.nan, 'club': 'football',
+        'x': football_x, 'y': 26.65 + np.cumsum(rng.normal(0, 0.1, n_frames)), 's': 5.0, 'a': 1.0, 'dis': 0.5,
+        'o': np.nan, 'dir': np.nan,
+    }))
+
+    play_df = pd.concat(team_dfs, ignore_index=True)
+    play_df['gameId'] = gameId
+    play_df['playId'] = playId
+    play_df['playDirection'] = play_direction
+    play_df['time'] = (pd.Timestamp('2022-09-08 20:25:08') + pd.to_timedelta(play_df['frameId'] * 100, unit='ms')) \
+        .dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+    play_df['event'] = play_df['frameId'].map(events)
+
+    return play_df[TRACKING_COLUMNS].astype(TRACKING_DTYPES)
+
+
+def select_fixture_plays(n_plays, seed=0):
+    """
+    Picks n_plays (gameId, playId) keys of plays.csv whose game is in games.csv.
+    """
+    repository = get_metadata_repository()
+    plays_df = repository.plays[repository.plays['gameId'].isin(repository.games['gameId'])]
+    plays_df = plays_df.sample(n=min(n_plays, len(plays_df)), random_state=seed)
+    return [(int(gameId), int(playId)) for gameId, playId in zip(plays_df['gameId'], plays_df['playId'])]
+
+
+def preload_synthetic_week(n_plays=10, n_frames=60, seed=0, week=SYNTHETIC_WEEK):
+    """
+    Generates synthetic plays and preloads them in memory as a tracking week, so load_play(playId, gameId, week) and
+    the other loaders serve them without any file.
+    Returns:
+        List of (gameId, playId, week) keys of the synthetic plays
+    """
+    play_keys = select_fixture_plays(n_plays, seed)
+    week_df = pd.concat([generate_play_tracking(gameId, playId, n_frames=n_frames, seed=seed + i)
+                         for i, (gameId, playId) in enumerate(play_keys)], ignore_index=True)
+    preload_tracking_dataframe(week, week_df.astype(TRACKING_DTYPES))
+    return [(gameId, playId, week) for gameId, playId in play_keys]
+
+
+def write_synthetic_week_csv(path, n_plays=10, n_frames=60, seed=0):
+    """
+    Writes synthetic plays as a tracking_week_N.csv file, e.g. to benchmark ingestion.
+    """
+    play_keys = select_fixture_plays(n_plays, seed)
+    week_df = pd.concat([generate_play_tracking(gameId, playId, n_frames=n_frames, seed=seed + i)
+                         for i, (gameId, playId) in enumerate(play_keys)], ignore_index=True)
+    week_df.to_csv(path, index=False)
+    return path
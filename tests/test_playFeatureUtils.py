@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from CastleDefense.utils.playFeatureUtils import extract_play_features
+from CastleDefense.utils.kinematicsUtils import NFL_FIELD_LENGTH, NFL_FIELD_WIDTH
+
+# Run from the directory holding the CastleDefense package: python -m pytest CastleDefense/tests
+
+OFFENSE_IDS = [46096, 29550, 30842, 35472, 37118, 38553]  # overview_data/players.csv ids, the RB carries the ball
+DEFENSE_IDS = [35493, 37075, 37078]
+
+
+def make_right_play():
+    """
+    Returns a small synthetic play moving right with its plays.csv row.
+    """
+    rows = []
+    for frame_id, event in zip(range(1, 7), ['ball_snap', np.nan, 'handoff', 'first_contact', np.nan, 'tackle']):
+        for i, nfl_id in enumerate(OFFENSE_IDS):
+            rows.append([nfl_id, 'CLE', frame_id, event, 30.0 + i % 2 + frame_id * (i == 0), 20.0 + 2.5 * i, 90.0])
+        for i, nfl_id in enumerate(DEFENSE_IDS):
+            rows.append([nfl_id, 'NYJ', frame_id, event, 36.0 - 0.5 * frame_id, 22.0 + 4.0 * i, 270.0])
+        rows.append([np.nan, 'football', frame_id, event, 30.0 + frame_id, 25.0, 90.0])
+
+    play_df = pd.DataFrame(rows, columns=['nflId', 'club', 'frameId', 'event', 'x', 'y', 'dir'])
+    play_df['jerseyNumber'] = play_df['nflId'] % 100
+    play_df['o'] = play_df['dir']
+    play_df['s'] = 1.0 + play_df['frameId'] * 0.5
+    play_df['playDirection'] = 'right'
+    play = pd.DataFrame({'possessionTeam': ['CLE'], 'defensiveTeam': ['NYJ'], 'ballCarrierId': [OFFENSE_IDS[0]],
+                         'yardsToGo': [7], 'yardlineNumber': [20], 'absoluteYardlineNumber': [30]})
+    return play_df, play
+
+
+def mirror_play(play_df, play):
+    """
+    Returns the same play moving left, as the tracking data records it.
+    """
+    play_df, play = play_df.copy(), play.copy()
+    play_df['x'] = NFL_FIELD_LENGTH - play_df['x']
+    play_df['y'] = NFL_FIELD_WIDTH - play_df['y']
+    play_df['dir'] = (play_df['dir'] + 180) % 360
+    play_df['o'] = (play_df['o'] + 180) % 360
+    play_df['playDirection'] = 'left'
+    play['absoluteYardlineNumber'] = NFL_FIELD_LENGTH - play['absoluteYardlineNumber']
+    return play_df, play
+
+
+def test_left_play_features_match_mirrored_right_play():
+    right_df, right_play = make_right_play()
+    left_df, left_play = mirror_play(right_df, right_play)
+
+    right_features = extract_play_features(right_df, right_play, 2022091800)
+    left_features = extract_play_features(left_df, left_play, 2022091800)
+
+    assert right_features['line_of_scrimmage'] == 20
+    assert right_features.keys() == left_features.keys()
+    for name, value in right_features.items():
+        assert left_features[name] == pytest.approx(value, nan_ok=True, abs=1e-4), name
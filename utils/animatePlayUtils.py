@@ -1,157 +1,337 @@
 from CastleDefense.utils.extractPlayDataUtils import *
 from CastleDefense.utils.visualizeFieldUtils import *
-import matplotlib.pyplot as plt
-from matplotlib.markers import MarkerStyle
-from matplotlib import animation
-from matplotlib.animation import FFMpegWriter, FuncAnimation
-import warnings
-warnings.filterwarnings('ignore')
+from CastleDefense.utils.playTensorUtils import build_play_tensor, build_blocker_index
+from CastleDefense.utils.kinematicsUtils import velocity_components
+from CastleDefense.utils.lazyImportUtils import lazy_import
+from CastleDefense.utils.profilingUtils import timed_stage, stage_timer, count, is_profiling
+from CastleDefense.utils.frameEncoderUtils import encode_frames
+from CastleDefense.utils.playCacheUtils import load_prepared_play
+from CastleDefense.utils.eventIndexUtils import get_play_event_frames
+from CastleDefense.utils.playTimelineUtils import ZOOMABLE_EVENTS
+
+# matplotlib is imported the first time something is drawn
+plt = lazy_import('matplotlib.pyplot')
+mmarkers = lazy_import('matplotlib.markers')
+mtransforms = lazy_import('matplotlib.transforms')
+mcollections = lazy_import('matplotlib.collections')
+animation = lazy_import('matplotlib.animation')
 
 WINDOW_DISPLAY_SIZE = 6
+ANIMATION_FPS = 10
 
 
 ###################
 # Animating PLayers Movement: https://www.kaggle.com/code/ar2017/nfl-big-data-bowl-2021-animating-players-movement
 ###################
-def create_plot_statements_at_frameId(ax, frameId, team_df, team_color, plot_blockers=False):
+def create_plot_statements_at_frameId(ax, frameId, team_tensor, team_color, plot_blockers=False, blocker_index=None):
     """
     Generate the plot statements for each player's location, velocity vector, jersey number, orientation for a given
     team at a specific integer timestep.
     Args:
         ax: Matplotlib axis
         frameId: Frame integer timestep of play
-        team_df: DataFrame with only the players on a specific team
+        team_tensor: PlayTensor with only the players on a specific team
         team_color: Color of the circle representing the player
         plot_blockers: Whether to plot the blocking formation
+        blocker_index: BlockerIndex of the blocking players. Built from team_tensor when not provided
     Returns:
         List of plotting statements
     """
     patch = []
 
-    player_data = team_df.query('frameId == ' + str(frameId))
-    play_direction = player_data['playDirection'].iloc[0]
+    player_features, player_labels = team_tensor.at_frame(frameId)
+    play_direction = team_tensor.play_direction
 
     if plot_blockers:
-        blockers_df = get_blocking_players(team_df)
-        patch.extend(create_plot_statements_blocking_formation(ax, frameId, blockers_df))
+        if blocker_index is None:
+            blocker_index = build_play_blocker_index(team_tensor)
+        patch.extend(create_plot_statements_blocking_formation(ax, frameId, blocker_index))
 
-    for _, player in player_data.iterrows():
+    for (x, y, s, direction, o), label in zip(player_features, player_labels):
         # Use Text to display the player's jersey number or position as identifier
-        patch.append(ax.text(player['x'], player['y'], player['playerDisplayIdentifier'], va='center', ha='center', color='white', fontsize=10, label='playerDisplayIdentifier'))
+        patch.append(ax.text(x, y, label, va='center', ha='center', color='white', fontsize=10, label='playerDisplayIdentifier'))
 
-        player_orientation_degree = player['o'] if play_direction == 'left' else player['o'] + 180
+        player_orientation_degree = o if play_direction == 'left' else o + 180
 
         # Use a custom marker to display the player's orientation
         # TODO: Create/import svg file for the player marker. Insipiration: https://twitter.com/SethWalder
-        custom_player_marker = MarkerStyle(r'$D$')
+        custom_player_marker = mmarkers.MarkerStyle(r'$D$')
         custom_player_marker._transform.rotate_deg(player_orientation_degree-90)  # Marker has right facing standar orientation
 
-        patch.append(ax.plot(player['x'], player['y'], "ro", marker=custom_player_marker, c=team_color, ms=14, label='PlayerCircle'))
+        patch.append(ax.plot(x, y, linestyle='none', marker=custom_player_marker, c=team_color, ms=14, label='PlayerCircle'))
 
         # Calculate and plot players' velocity vectors
-        dx, dy = calculate_dx_dy(player['s'], player['dir'])
+        dx, dy = calculate_dx_dy(s, direction)
         dx *= 0.5
         dy *= 0.5  # Scale down the velocity vector to make it more visible
-        patch.append(ax.arrow(player['x'], player['y'], dx, dy, color='grey', width=0.15, shape='full', alpha=0.5, label='VelocityVector'))
+        patch.append(ax.arrow(x, y, dx, dy, color='grey', width=0.15, shape='full', alpha=0.5, label='VelocityVector'))
 
     return patch
 
 
-def create_plot_statements_blocking_formation(ax, frameId, blockers_df, line_color='red'):
+def build_play_blocker_index(team_tensor):
     """
-    Creates the plot statements for the blocking formation.
+    Builds the BlockerIndex of the blocking players (TE, G, C, T) from an offense PlayTensor, once per play.
+    Args:
+        team_tensor: Should only use for Offensive team.
+    """
+    players_df = get_players_by_ids(team_tensor.nfl_ids)
+    blocker_ids = players_df[players_df['position'].isin(BLOCKING_POSITIONS)]['nflId']
+    return build_blocker_index(team_tensor, blocker_ids)
+
+
+def create_plot_statements_blocking_formation(ax, frameId, blocker_index, line_color='red'):
+    """
+    Creates the plot statements for the blocking formation. Draws one LineCollection between laterally adjacent
+    blockers.
     Args:
         ax: Matplotlib axis
         frameId: integer timestep of play
-        blockers_df: DataFrame with only the blocking players
+        blocker_index: BlockerIndex of the blocking players
         line_color: Red is best for visibility
     """
-    plot_statements = []
-    blocker_df = blockers_df[blockers_df['frameId'] == frameId]
-    blocker_df = blocker_df.sort_values(by=['y'], ascending=[True])
+    blocking_lines = mcollections.LineCollection(blocker_index.segments_at(frameId), colors=line_color,
+                                                 label='BlockingLine')
+    return [ax.add_collection(blocking_lines)]
 
-    for i in range(len(blocker_df) - 1):
-        blocker = blocker_df.iloc[i]
-        next_blocker = blocker_df.iloc[i + 1]
 
-        if next_blocker is not None:
-            plot_statements.extend(
-                ax.plot([blocker['x'], next_blocker['x']], [blocker['y'], next_blocker['y']], color=line_color, label='BlockingLine'))
-
-    return plot_statements
-
-
-def center_view_on_football(ax, football_data, window_size=WINDOW_DISPLAY_SIZE):
+def center_view_on_football(ax, football_location, window_size=WINDOW_DISPLAY_SIZE):
     """
     Centers the view on the football through set_xlim() methods.
     Args:
         ax: Matplotlib axis
-        football_data: DataFrame with only the football
+        football_location: (x, y) coordinates of the football
         window_size: The size of the window to display around the football
     """
-    x_min = football_data['x'].iloc[0] - window_size
-    x_max = football_data['x'].iloc[0] + window_size
-    y_min = football_data['y'].iloc[0] - window_size
-    y_max = football_data['y'].iloc[0] + window_size
+    x_min = football_location[0] - window_size
+    x_max = football_location[0] + window_size
+    y_min = football_location[1] - window_size
+    y_max = football_location[1] + window_size
 
     ax.set_xlim(x_min, x_max)
     ax.set_ylim(y_min, y_max)
     return ax
 
 
-def zoom_effect(ax, frameId, football_data, event_frameIds, window_size=WINDOW_DISPLAY_SIZE):
+def zoom_effect(ax, frameId, football_location, event_frameIds, window_size=WINDOW_DISPLAY_SIZE):
     """
     Zooms out and back in to give context of the play.
     Args:
         ax:
         frameId:
-        football_data:
+        football_location:
         event_frameIds:
         window_size:
     """
     window_size += event_frameIds[frameId][0]
-    return center_view_on_football(ax, football_data, window_size=window_size)
+    return center_view_on_football(ax, football_location, window_size=window_size)
 
 
+@timed_stage()
 def animate_frameId(ax, frameId, offense, defense, football, event_frameIds=None, plot_blockers=False,
-                    center_on_football=False):
+                    center_on_football=False, blockers=None, timeline=None):
     """
     Updates the animation at a specific timestep.
     Args:
         ax: Matplotlib axis
         frameId: integer timestep of play
-        offense:
-        defense:
-        football:
+        offense: PlayTensor for the offense
+        defense: PlayTensor for the defense
+        football: PlayTensor for the football
         plot_blockers: Plots the blocking formation with red lines
         center_on_football: Allows camera to follow the football
+        blockers: BlockerIndex of the offense's blocking players, built once per play
+        timeline: PlayTimeline mapping frameId to the source frameId of the tensors, used by zoom effects
     """
     patch = []
-    football_data = football[football['frameId'] == frameId]
+    source_frameId = timeline.source_frame(frameId) if timeline is not None else frameId
+    football_features, _ = football.at_frame(source_frameId)
+    football_location = football_features[0, :2] if len(football_features) else None
 
     # Centers the display window on the football like a rolling birds eye view
-    if center_on_football:
+    if center_on_football and football_location is not None:
         if event_frameIds and frameId in event_frameIds.keys():
-            zoom_effect(ax, frameId, football_data, event_frameIds)  # Zoom out and back in to give context of the play
+            zoom_effect(ax, frameId, football_location, event_frameIds)  # Zoom out and back in to give context of the play
             return patch
-        elif frameId == football['frameId'].min():
-            center_view_on_football(ax, football_data, window_size=INITIAL_ZOOM_OUT_WINDOW)
+        elif frameId == football.frame_ids[0]:
+            center_view_on_football(ax, football_location, window_size=INITIAL_ZOOM_OUT_WINDOW)
         else:
-            center_view_on_football(ax, football_data)  # Center the view on the football
+            center_view_on_football(ax, football_location)  # Center the view on the football
 
     # Plot home players
-    patch.extend(create_plot_statements_at_frameId(ax, frameId, offense, 'orangered', plot_blockers=plot_blockers))
+    patch.extend(create_plot_statements_at_frameId(ax, source_frameId, offense, 'orangered',
+                                                   plot_blockers=plot_blockers, blocker_index=blockers))
 
     # Plot away players
-    patch.extend(create_plot_statements_at_frameId(ax, frameId, defense, 'blue'))
+    patch.extend(create_plot_statements_at_frameId(ax, source_frameId, defense, 'blue'))
 
     # Plot football
-    patch.extend(ax.plot(football_data['x'], football_data['y'], 'D', c='brown', ms=10, data=football_data['club'],
-                         label="Football"))
+    patch.extend(ax.plot(football_features[:, 0], football_features[:, 1], 'D', c='brown', ms=10, label="Football"))
 
+    count('frames')
+    count('artists', len(patch))
     return patch
 
 
+def create_team_artists(ax, team_tensor, team_color):
+    """
+    Creates one reusable artist set for a team: a scatter collection for the player markers, a quiver for the velocity
+    vectors and one text object per player. Artists are updated in place each frame by update_team_artists().
+    Args:
+        ax: Matplotlib axis
+        team_tensor: PlayTensor with only the players on a specific team
+        team_color: Color of the marker representing the player
+    Returns:
+        Dictionary of artists for the team
+    """
+    n_players = team_tensor.n_players
+    zeros = np.zeros(n_players)
+
+    markers = ax.scatter(zeros, zeros, s=14 ** 2, marker=mmarkers.MarkerStyle(r'$D$'), c=team_color, label='PlayerCircle')
+    vectors = ax.quiver(zeros, zeros, zeros, zeros, angles='xy', scale_units='xy', scale=1, units='xy', width=0.15,
+                        headwidth=3, headlength=4.5, headaxislength=4.5, color='grey', alpha=0.5, label='VelocityVector')
+    labels = [ax.text(0, 0, label, va='center', ha='center', color='white', fontsize=10, label='playerDisplayIdentifier')
+              for label in team_tensor.labels]
+
+    return {'markers': markers, 'vectors': vectors, 'labels': labels}
+
+
+def update_team_artists(team_artists, frameId, team_tensor):
+    """
+    Moves a team's artists to their locations at a specific integer timestep. Players missing from the frame are hidden.
+    Args:
+        team_artists: Dictionary of artists from create_team_artists()
+        frameId: Frame integer timestep of play
+        team_tensor: PlayTensor with only the players on a specific team
+    Returns:
+        List of updated artists
+    """
+    position = team_tensor.frame_position(frameId)
+    if position is None:
+        return []
+
+    x, y, s, direction, o = team_tensor.features[position].T
+    present = ~np.isnan(x)
+
+    # Rotate the marker of each player to its orientation. Marker has right facing standard orientation
+    orientation = o if team_tensor.play_direction == 'left' else o + 180
+    marker = mmarkers.MarkerStyle(r'$D$')
+    marker_path = marker.get_path().transformed(marker.get_transform())
+    team_artists['markers'].set_paths([marker_path.transformed(mtransforms.Affine2D().rotate_deg(angle - 90))
+                                       for angle in np.nan_to_num(orientation)])
+    team_artists['markers'].set_offsets(np.column_stack([x, y]))
+
+    # Scale down the velocity vector to make it more visible
+    dx, dy = velocity_components(s * 0.5, direction)
+    team_artists['vectors'].set_offsets(np.column_stack([np.where(present, x, 0), np.where(present, y, 0)]))
+    team_artists['vectors'].set_UVC(np.where(present, dx, 0), np.where(present, dy, 0))
+
+    for text, player_x, player_y, is_present in zip(team_artists['labels'], x, y, present):
+        text.set_visible(is_present)
+        if is_present:
+            text.set_position((player_x, player_y))
+
+    return [team_artists['markers'], team_artists['vectors']] + team_artists['labels']
+
+
+def create_play_artists(ax, offense, defense, football, plot_blockers=False):
+    """
+    Creates every reusable artist for a play once, before the animation starts.
+    Args:
+        ax: Matplotlib axis
+        offense: PlayTensor for the offense
+        defense: PlayTensor for the defense
+        football: PlayTensor for the football
+        plot_blockers: Creates a line for the blocking formation
+    Returns:
+        Dictionary of artists for the play
+    """
+    return {
+        'offense': create_team_artists(ax, offense, 'orangered'),
+        'defense': create_team_artists(ax, defense, 'blue'),
+        'football': ax.plot([], [], 'D', c='brown', ms=10, label='Football')[0],
+        'blockers': ax.add_collection(mcollections.LineCollection([], colors='red', label='BlockingLine'))
+        if plot_blockers else None,
+    }
+
+
+def get_play_artist_list(play_artists):
+    """
+    Flattens the dictionary of create_play_artists() into a list of artists.
+    """
+    artists = [play_artists['football']]
+    for team in ['offense', 'defense']:
+        artists.extend([play_artists[team]['markers'], play_artists[team]['vectors']] + play_artists[team]['labels'])
+    if play_artists['blockers'] is not None:
+        artists.append(play_artists['blockers'])
+    return artists
+
+
+def create_blit_draw(fig, ax, artists):
+    """
+    Returns a draw function for encode_frames() that restores a cached background and draws only the given artists,
+    instead of redrawing the whole field each frame. Only valid while the axis limits do not change.
+    """
+    [artist.set_animated(True) for artist in artists]  # Animated artists are left out of the background
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    def draw():
+        fig.canvas.restore_region(background)
+        [ax.draw_artist(artist) for artist in artists]
+
+    return draw
+
+
+@timed_stage()
+def update_play_artists(ax, play_artists, frameId, offense, defense, football, event_frameIds=None, blockers=None,
+                        center_on_football=False, timeline=None):
+    """
+    Updates the reusable artists of a play at a specific timestep. Counterpart of animate_frameId() that moves existing
+    artists instead of creating new ones.
+    Args:
+        ax: Matplotlib axis
+        play_artists: Dictionary of artists from create_play_artists()
+        frameId: integer timestep of play
+        offense: PlayTensor for the offense
+        defense: PlayTensor for the defense
+        football: PlayTensor for the football
+        event_frameIds: Dictionary with the frameId as the key and the zoom out amount as the value
+        blockers: BlockerIndex of the offense's blocking players
+        center_on_football: Allows camera to follow the football
+        timeline: PlayTimeline mapping frameId to the source frameId of the tensors, used by zoom effects
+    Returns:
+        List of updated artists
+    """
+    source_frameId = timeline.source_frame(frameId) if timeline is not None else frameId
+    football_features, _ = football.at_frame(source_frameId)
+    football_location = football_features[0, :2] if len(football_features) else None
+
+    if center_on_football and football_location is not None:
+        if event_frameIds and frameId in event_frameIds.keys():
+            zoom_effect(ax, frameId, football_location, event_frameIds)  # Play is stopped, only the view changes
+            return []
+        elif frameId == football.frame_ids[0]:
+            center_view_on_football(ax, football_location, window_size=INITIAL_ZOOM_OUT_WINDOW)
+        else:
+            center_view_on_football(ax, football_location)
+
+    updated_artists = update_team_artists(play_artists['offense'], source_frameId, offense)
+    updated_artists.extend(update_team_artists(play_artists['defense'], source_frameId, defense))
+
+    play_artists['football'].set_data(football_features[:, 0], football_features[:, 1])
+    updated_artists.append(play_artists['football'])
+
+    if play_artists['blockers'] is not None and blockers is not None:
+        play_artists['blockers'].set_segments(blockers.segments_at(source_frameId))
+        updated_artists.append(play_artists['blockers'])
+
+    count('frames')
+    count('artists', len(updated_artists))
+    return updated_artists
+
+
+@timed_stage()
 def save_animation(anim, animation_path):
     """
     Saves the animation to a file. May need ffmpeg installed and added to system PATH.
@@ -159,39 +339,67 @@ def save_animation(anim, animation_path):
     :param animation_path:
     :return:
     """
-    anim.save(animation_path, writer=FFMpegWriter(fps=10))
+    writer = animation.FFMpegWriter(fps=ANIMATION_FPS)
+    if is_profiling():
+        # grab_frame draws the figure and pipes its pixels to ffmpeg
+        writer.grab_frame = timed_stage('draw_and_encode_frame')(writer.grab_frame)
+    anim.save(animation_path, writer=writer)
     return
 
 
 def animate_func_play(playId, gameId, weekNumber, zoomed_view=False, plot_blockers=False, center_on_football=False,
-                      zoom_effect_on_events=False, display_position=False, animation_path='animation.mp4'):
+                      zoom_effect_on_events=False, display_position=False, animation_path='animation.mp4',
+                      reuse_artists=False, blit=False, show_animation=True, direct_encoding=False,
+                      use_cache=True):
     """
     Animates the movement of players and the football for a given play using FuncAnimation.
+    With direct_encoding, FuncAnimation is bypassed: each frame is drawn on the Agg canvas and its pixels are encoded by a
+    background thread (ffmpeg pipe for videos, Pillow for .gif, PNG files for a path without extension) while the next
+    frame is drawn. Nothing is shown and None is returned.
+    With reuse_artists, one artist set per player is created up front and only its data is updated each frame instead of
+    removing and recreating every artist. blit only applies with reuse_artists and a fixed view (not center_on_football),
+    since moving the axis limits invalidates the blitted background.
+    show_animation=False skips plt.show() and closes the figure after saving, for batch rendering.
+    Wrap the call in profilingUtils.profile_play() for a per stage timing breakdown of the render.
+    The prepared play is served from the play cache (see playCacheUtils) unless use_cache=False.
     """
     plt.close()
 
-    # Load play dataframes
-    offense, defense, football = load_play(playId, gameId, weekNumber)
-    play = get_play_by_id(gameId, playId)
-    yardlineNumber, yardsToGo = get_los_details(play, offense)
-
-    # Assign player display identifier
-    offense, defense = assign_player_display_identifier(offense, defense, display_position=display_position)
+    # Load play dataframes with their player display identifier and line of scrimmage details
+    prepared = load_prepared_play(playId, gameId, weekNumber, display_position=display_position, use_cache=use_cache)
+    offense, defense, football, play = prepared.offense, prepared.defense, prepared.football, prepared.play
+    yardlineNumber, yardsToGo = prepared.line_of_scrimmage, prepared.yards_to_go
 
+    # Zoom effects hold frames through a timeline mapping each animation frameId to a source frameId of the play
     event_frameIds = {}  # Key: frameId, Value: (window_size_increase, event_name)
+    timeline = None
     if zoom_effect_on_events:
-        offense, defense, football, event_frameIds = adjust_frameIds_for_initial_zoom(offense, defense, football, event_frameIds)
-        offense, defense, football, event_frameIds = adjust_frameIds_for_zoom_effect(offense, defense, football, event_frameIds)
+        with stage_timer('build_play_timeline'):
+            # Event frames come from the event index built at ingest. Plays missing from it are scanned
+            event_frames = get_play_event_frames(gameId, playId, weekNumber, ZOOMABLE_EVENTS)
+            if event_frames is None:
+                event_frames = get_zoom_event_frames(offense['frameId'], offense['event'])
+            timeline = build_play_timeline(offense['frameId'], event_frames, initial_zoom=True)
+            event_frameIds = timeline.event_frameIds
 
     # Display window
     boxed_view = get_player_max_locations(offense, defense, football) if zoomed_view and not center_on_football else None
 
+    # Frame indexed arrays built once so each animation frame indexes them instead of querying DataFrames
+    with stage_timer('build_play_tensors'):
+        offense_tensor, defense_tensor, football_tensor = [build_play_tensor(df) for df in [offense, defense, football]]
+        blocker_index = build_play_blocker_index(offense_tensor) if plot_blockers else None
+
     # Create field to animate upon
-    fig, ax = create_football_field(boxed_view=boxed_view, line_of_scrimmage=yardlineNumber, yards_to_go=yardsToGo)
+    with stage_timer('create_football_field'):
+        # The field raster is rendered for a fixed view, so the vector markings are kept when the view follows the ball
+        fig, ax = create_football_field(boxed_view=boxed_view, line_of_scrimmage=yardlineNumber, yards_to_go=yardsToGo,
+                                        cached_background=not center_on_football)
     playDesc = play['playDescription'].item()
     ax.set_title(f'Game # {gameId} Play # {playId} \n {playDesc}')
 
-    def update(frameId, ax, offense, defense, football, plot_blockers, center_on_football=False, event_frameIds=None):
+    def update(frameId, ax, offense, defense, football, plot_blockers, center_on_football=False, event_frameIds=None,
+               blockers=None, timeline=None):
         """
         Function used to update each animation timestep (frameId) from FuncAnimation.
         """
@@ -199,22 +407,63 @@ def animate_func_play(playId, gameId, weekNumber, zoomed_view=False, plot_blocke
         is_zoom_event = center_on_football and event_frameIds and frameId+1 in event_frameIds.keys()
         if not is_zoom_event:  # Do not remove the previous frame locations during zoom effect since the play is stopped
             # Remove all texts, circles, arrows, and footballs from the previous frame on regular time-consuming events.
-            artists_to_remove = ax.findobj(match=lambda x: x.get_label() in ['Football', 'PlayerCircle', 'playerDisplayIdentifier', 'BlockingLine', 'VelocityVector'])
-            [artist.remove() for artist in artists_to_remove]
+            with stage_timer('remove_artists'):
+                artists_to_remove = ax.findobj(match=lambda x: x.get_label() in ['Football', 'PlayerCircle', 'playerDisplayIdentifier', 'BlockingLine', 'VelocityVector'])
+                [artist.remove() for artist in artists_to_remove]
 
         animate_frameId(ax, frameId + 1, offense=offense, defense=defense, football=football,
                         event_frameIds=event_frameIds, plot_blockers=plot_blockers,
-                        center_on_football=center_on_football)
+                        center_on_football=center_on_football, blockers=blockers, timeline=timeline)
+
+    def update_reused_artists(frameId, ax, play_artists, offense, defense, football, center_on_football=False,
+                              event_frameIds=None, blockers=None, timeline=None):
+        """
+        Function used to update the reused artists at each animation timestep (frameId) from FuncAnimation.
+        """
+        return update_play_artists(ax, play_artists, frameId + 1, offense, defense, football,
+                                   event_frameIds=event_frameIds, blockers=blockers,
+                                   center_on_football=center_on_football, timeline=timeline)
 
     # Create FuncAnimation
-    frames = len(range(int(offense['frameId'].min()), int(offense['frameId'].max())))
-    anim = FuncAnimation(fig, update, frames=frames,
-                         fargs=(ax, offense, defense, football, plot_blockers, center_on_football, event_frameIds),
-                         repeat=False)
+    last_frameId = timeline.output_frame_ids[-1] if timeline is not None else offense['frameId'].max()
+    frames = len(range(int(offense['frameId'].min()), int(last_frameId)))
+    if direct_encoding:
+        draw = None
+        if reuse_artists:
+            play_artists = create_play_artists(ax, offense_tensor, defense_tensor, football_tensor, plot_blockers=plot_blockers)
+            if blit and not center_on_football:
+                draw = create_blit_draw(fig, ax, get_play_artist_list(play_artists))
+
+            def render_frame(frameId):
+                update_reused_artists(frameId, ax, play_artists, offense_tensor, defense_tensor, football_tensor,
+                                      center_on_football, event_frameIds, blocker_index, timeline)
+        else:
+            def render_frame(frameId):
+                update(frameId, ax, offense_tensor, defense_tensor, football_tensor, plot_blockers, center_on_football,
+                       event_frameIds, blocker_index, timeline)
+
+        encode_frames(fig, render_frame, range(frames), animation_path, fps=ANIMATION_FPS, draw=draw)
+        plt.close(fig)
+        return None
+
+    if reuse_artists:
+        play_artists = create_play_artists(ax, offense_tensor, defense_tensor, football_tensor, plot_blockers=plot_blockers)
+        anim = animation.FuncAnimation(fig, update_reused_artists, frames=frames,
+                             fargs=(ax, play_artists, offense_tensor, defense_tensor, football_tensor, center_on_football,
+                                    event_frameIds, blocker_index, timeline),
+                             blit=blit and not center_on_football, repeat=False)
+    else:
+        anim = animation.FuncAnimation(fig, update, frames=frames,
+                             fargs=(ax, offense_tensor, defense_tensor, football_tensor, plot_blockers, center_on_football,
+                                    event_frameIds, blocker_index, timeline),
+                             repeat=False)
 
     # Save animation
-    anim.save(animation_path, writer=FFMpegWriter(fps=10))
-    plt.show()  # Display the animation
+    save_animation(anim, animation_path)
+    if show_animation:
+        plt.show()  # Display the animation
+    else:
+        plt.close(fig)
 
     return anim
 
@@ -0,0 +1,201 @@
+import pandas as pd
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from CastleDefense.utils.metadataUtils import get_metadata_repository
+from CastleDefense.utils.trackingStoreUtils import preload_tracking_week, release_preloaded_weeks, \
+    is_week_preloaded, has_stored_game, get_tracking_week_csv_path
+from CastleDefense.utils.profilingUtils import profile_play
+from CastleDefense.utils.frameEncoderUtils import VIDEO_EXTENSIONS, GIF_EXTENSIONS
+
+output_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output'))
+
+REPORT_COLUMNS = ['gameId', 'playId', 'week', 'status', 'seconds', 'frames_per_second', 'animation_path', 'error']
+
+
+def select_play_keys(week=None, game_ids=None, query=None):
+    """
+    Selects (gameId, playId, week) keys from plays.csv, joined with the week of each game from games.csv.
+    Args:
+        week: Only plays of this week (or list of weeks). Default is every week
+        game_ids: Only plays of these games. Default is every game
+        query: Optional pandas query string on plays.csv columns, e.g. "passResult == 'C'"
+    Returns:
+        List of (gameId, playId, week) tuples sorted by week, gameId and playId
+    """
+    repository = get_metadata_repository()
+    plays_df = repository.plays.merge(repository.games[['gameId', 'week']], on='gameId', how='inner')
+
+    if week is not None:
+        weeks = week if isinstance(week, (list, tuple, set)) else [week]
+        plays_df = plays_df[plays_df['week'].isin(weeks)]
+    if game_ids is not None:
+        plays_df = plays_df[plays_df['gameId'].isin(game_ids)]
+    if query is not None:
+        plays_df = plays_df.query(query)
+
+    plays_df = plays_df.sort_values(by=['week', 'gameId', 'playId'])
+    return [(int(g), int(p), int(w)) for g, p, w in zip(plays_df['gameId'], plays_df['playId'], plays_df['week'])]
+
+
+def get_animation_output_path(output_dir, gameId, playId, week, suffix='.mp4'):
+    """
+    Returns the deterministic path of a play's animation: <output_dir>/week_<week>/<gameId>_<playId><suffix>
+    Args:
+        suffix: Extension of the animation file, e.g. '.mp4' or '.gif'. '' for the directory of a PNG image sequence
+    """
+    return os.path.join(output_dir, 'week_' + str(week), str(gameId) + '_' + str(playId) + suffix)
+
+
+def _init_render_worker(weeks):
+    """
+    Process pool initializer. Switches matplotlib to the Agg backend and preloads the weeks of the batch slice that
+    are not in the tracking store. A week preloaded by the parent before forking is shared and not read again.
+    """
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+
+    for week in weeks:
+        preload_tracking_week(week)
+
+
+def get_profile_output_path(animation_path):
+    """
+    Returns the path of the timing profile written next to a play's animation: <gameId>_<playId>.profile.json
+    """
+    return os.path.splitext(animation_path)[0] + '.profile.json'
+
+
+def _render_play(gameId, playId, week, animation_path, animation_options, profile=False):
+    """
+    Renders one play in a worker process and returns its report row.
+    """
+    from CastleDefense.utils.animatePlayUtils import animate_func_play
+
+    start = time.perf_counter()
+    frames_per_second = None
+    try:
+        os.makedirs(os.path.dirname(animation_path), exist_ok=True)
+        if profile:
+            with profile_play(f'{gameId}_{playId}', json_path=get_profile_output_path(animation_path)) as play_profile:
+                animate_func_play(playId, gameId, week, animation_path=animation_path, show_animation=False,
+                                  **animation_options)
+            frames_per_second = play_profile.summary()['frames_per_second']
+        else:
+            animate_func_play(playId, gameId, week, animation_path=animation_path, show_animation=False,
+                              **animation_options)
+        status, error = 'success', None
+    except Exception:
+        status, error = 'failed', traceback.format_exc()
+
+    return {'gameId': gameId, 'playId': playId, 'week': week, 'status': status,
+            'seconds': time.perf_counter() - start, 'frames_per_second': frames_per_second,
+            'animation_path': animation_path, 'error': error}
+
+
+def _get_report_row(gameId, playId, week, animation_path, status, error=None, seconds=0.0):
+    return {'gameId': gameId, 'playId': playId, 'week': week, 'status': status, 'seconds': seconds,
+            'frames_per_second': None, 'animation_path': animation_path, 'error': error}
+
+
+def _render_in_pool(pending_keys, weeks, max_workers, animation_options, profile=False, verbose=True):
+    """
+    Renders plays in a process pool and returns their report rows. When a worker process dies (e.g. killed when out
+    of memory, or a crash in ffmpeg or Agg), the pool breaks and every play not finished yet is reported as failed.
+    """
+    report_rows = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_render_worker, initargs=(weeks,)) as executor:
+        futures = {executor.submit(_render_play, gameId, playId, week, animation_path, animation_options, profile):
+                   (gameId, playId, week, animation_path) for gameId, playId, week, animation_path in pending_keys}
+
+        for future in as_completed(futures):
+            try:
+                report_row = future.result()
+            except BrokenProcessPool:
+                report_row = _get_report_row(*futures[future], status='failed', error=traceback.format_exc())
+            report_rows.append(report_row)
+            if verbose:
+                print(f"{report_row['status']:>7} Game # {report_row['gameId']} Play # {report_row['playId']} "
+                      f"({report_row['seconds']:.1f}s)")
+    return report_rows
+
+
+def render_plays(play_keys, output_dir=output_path, max_workers=None, skip_existing=False, report_path=None,
+                 verbose=True, profile=False, animation_format='.mp4', **animation_options):
+    """
+    Renders the animation of many plays in a process pool with the Agg backend.
+    Workers read the plays of ingested games from the tracking store partitions. Weeks only available as tracking csv
+    are rendered one at a time, each loaded once in the parent before its workers fork and released afterwards.
+    A crashed worker fails the plays it left unfinished and the report is still written.
+    Args:
+        play_keys: List of (gameId, playId, week) tuples, e.g. from select_play_keys()
+        output_dir: Root directory of the animations. Files are written to
+            <output_dir>/week_<week>/<gameId>_<playId><animation_format>
+        max_workers: Number of worker processes. Default is the number of cores
+        skip_existing: Does not re-render plays whose animation file already exists
+        report_path: Optional csv path to write the report to
+        verbose: Prints one line per finished play
+        profile: Writes the per stage timings of each play to <gameId>_<playId>.profile.json next to its animation
+        animation_format: '.mp4' or another video extension, '.gif', or '' for a directory of PNG frames. GIFs and
+            image sequences are written by the frame encoder, so they need direct_encoding=True
+        **animation_options: Keyword arguments forwarded to animate_func_play, e.g. center_on_football=True
+    Returns:
+        pandas.DataFrame: One row per play with status ('success', 'failed' or 'skipped'), seconds, frames_per_second
+        (with profile), animation_path and the error traceback of failed plays
+    """
+    if animation_format not in VIDEO_EXTENSIONS + GIF_EXTENSIONS + ['']:
+        raise ValueError(f'Unsupported animation format {animation_format!r}. Use one of '
+                         f'{VIDEO_EXTENSIONS + GIF_EXTENSIONS} or \'\' for an image sequence')
+    if animation_format not in VIDEO_EXTENSIONS and not animation_options.get('direct_encoding'):
+        raise ValueError(f'animation_format {animation_format!r} needs direct_encoding=True')
+
+    report_rows = []
+    pending_keys = []
+    for gameId, playId, week in play_keys:
+        animation_path = get_animation_output_path(output_dir, gameId, playId, week, suffix=animation_format)
+        if skip_existing and os.path.exists(animation_path):
+            report_rows.append(_get_report_row(gameId, playId, week, animation_path, status='skipped'))
+        else:
+            pending_keys.append((gameId, playId, week, animation_path))
+
+    # Games in the tracking store are read by the workers from their partitions. Weeks not ingested yet are preloaded
+    # one at a time, each with its own pool, and released before the next week
+    week_slices = {None: []}
+    for pending_key in pending_keys:
+        gameId, _, week, _ = pending_key
+        csv_week = not has_stored_game(gameId, week) and os.path.exists(get_tracking_week_csv_path(week))
+        week_slices.setdefault(week if csv_week else None, []).append(pending_key)
+
+    batch_start = time.perf_counter()
+    for week, slice_keys in week_slices.items():
+        if not slice_keys:
+            continue
+        preloaded = week is None or is_week_preloaded(week)
+        try:
+            if not preloaded:
+                preload_tracking_week(week)
+            report_rows.extend(_render_in_pool(slice_keys, [] if week is None else [week], max_workers,
+                                               animation_options, profile, verbose))
+        finally:
+            if not preloaded:
+                release_preloaded_weeks([week])
+
+    report_df = pd.DataFrame(report_rows, columns=REPORT_COLUMNS).sort_values(by=['week', 'gameId', 'playId'])
+    report_df = report_df.reset_index(drop=True)
+
+    if verbose:
+        n_success = (report_df['status'] == 'success').sum()
+        elapsed = time.perf_counter() - batch_start
+        print(f'Rendered {n_success}/{len(pending_keys)} plays in {elapsed:.1f}s')
+
+    if report_path is not None:
+        report_df.to_csv(report_path, index=False)
+
+    return report_df
+
+
+# play_keys = select_play_keys(week=1)
+# render_plays(play_keys, center_on_football=True, zoom_effect_on_events=True)
+# render_plays(play_keys, animation_format='.gif', direct_encoding=True, skip_existing=True)
@@ -1,59 +1,300 @@
-import pandas as pd
+import argparse
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from CastleDefense.utils.ingestManifestUtils import read_manifest, write_manifest, record_file, is_file_unchanged, \
+    file_sha256, SPLIT_FILES_SECTION
 
 seperated_data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data', 'seperated_data'))
 tracking_data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data'))
 
-def split_tracking_data():
-    list_of_csvs = sorted([f for f in os.listdir(tracking_data_path) if f.endswith(".csv")])
+DEFAULT_N_PARTS = 2
 
-    for tracking_week_csv in list_of_csvs:
-        tracking_week_path = os.path.join(tracking_data_path, tracking_week_csv)
-        tracking_week_df = pd.read_csv(tracking_week_path)
+# Plays are never cut in half. 'game' keeps whole games in one part
+SPLIT_BOUNDARIES = {'play': 2, 'game': 1}
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def get_part_csv_name(tracking_week_csv, part_number):
+    """
+    Returns the file name of a part: tracking_week_1.csv -> tracking_week_1_part<part_number>.csv
+    """
+    return tracking_week_csv.replace('.csv', '_part' + str(part_number) + '.csv')
+
+
+def get_parts_manifest_path(tracking_week_csv, output_dir=seperated_data_path):
+    """
+    Returns the path of the json file describing the parts of a split csv: tracking_week_1_parts.json
+    """
+    return os.path.join(output_dir, tracking_week_csv.replace('.csv', '_parts.json'))
+
+
+def _read_header(csv_file, boundary):
+    """
+    Reads the header line of a tracking csv and returns it with the positions of the key columns of the boundary.
+    """
+    header = csv_file.readline()
+    columns = header.rstrip(b'\r\n').split(b',')
+    key_columns = [b'gameId', b'playId'][:SPLIT_BOUNDARIES[boundary]]
+    return header, [columns.index(column) for column in key_columns]
+
+
+def split_tracking_csv(csv_path, output_dir=seperated_data_path, n_parts=DEFAULT_N_PARTS, boundary='play'):
+    """
+    Streams a tracking csv into n_parts csvs of about equal size, starting a new part only where the gameId (and playId)
+    changes so no play is cut in half. Lines are copied without being parsed, so memory stays bounded by one line and
+    the parts concatenate back to the exact original bytes. Every part repeats the header.
+    Args:
+        csv_path: Path to a tracking_week_N.csv
+        output_dir: Directory of the parts and their json description
+        n_parts: Target number of parts. Fewer are written when the csv has fewer plays (or games)
+        boundary: 'play' or 'game'
+    Returns:
+        Dictionary describing the split: sha256, size and rows of the original, and the file name, sha256, rows and
+        first/last key of each part. Also written next to the parts as tracking_week_N_parts.json
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tracking_week_csv = os.path.basename(csv_path)
+
+    # Parts of a previous split may outnumber the new ones
+    if os.path.exists(get_parts_manifest_path(tracking_week_csv, output_dir)):
+        for part in read_split(tracking_week_csv, output_dir)['parts']:
+            if os.path.exists(os.path.join(output_dir, part['file'])):
+                os.remove(os.path.join(output_dir, part['file']))
+
+    target_part_size = os.path.getsize(csv_path) / n_parts
+
+    original_hash = hashlib.sha256()
+    parts = []
+    part_file, part_hash = None, None
+
+    def close_part():
+        part_file.close()
+        parts[-1]['sha256'] = part_hash.hexdigest()
+        parts[-1]['size'] = os.path.getsize(os.path.join(output_dir, parts[-1]['file']))
+
+    with open(csv_path, 'rb') as csv_file:
+        header, key_positions = _read_header(csv_file, boundary)
+        original_hash.update(header)
+        last_key, part_size = None, 0
+
+        for line in csv_file:
+            original_hash.update(line)
+            values = line.split(b',', max(key_positions) + 1)
+            key = tuple(values[position] for position in key_positions)
+
+            # A new part starts at the first key change after the current part reached its share of the file
+            if part_file is None or (key != last_key and part_size >= target_part_size and len(parts) < n_parts):
+                if part_file is not None:
+                    close_part()
+                parts.append({'file': get_part_csv_name(tracking_week_csv, len(parts) + 1), 'rows': 0,
+                              'first_key': [value.decode() for value in key]})
+                part_file = open(os.path.join(output_dir, parts[-1]['file']), 'wb', buffering=WRITE_BUFFER_SIZE)
+                part_hash = hashlib.sha256()
+                part_file.write(header)
+                part_hash.update(header)
+                part_size = len(header)
 
-        # Calculate the midpoint index for splitting the dataframe
-        midpoint = len(tracking_week_df) // 2
+            part_file.write(line)
+            part_hash.update(line)
+            part_size += len(line)
+            parts[-1]['rows'] += 1
+            parts[-1]['last_key'] = [value.decode() for value in key]
+            last_key = key
 
-        # Split the dataframe into two halves
-        first_half = tracking_week_df.iloc[:midpoint]
-        second_half = tracking_week_df.iloc[midpoint:]
+    if part_file is not None:
+        close_part()
 
-        # Define new filenames for the two halves
-        first_half_filename = tracking_week_csv.replace(".csv", "_part1.csv")
-        second_half_filename = tracking_week_csv.replace(".csv", "_part2.csv")
+    split = {'source': tracking_week_csv, 'sha256': original_hash.hexdigest(), 'size': os.path.getsize(csv_path),
+             'rows': sum(part['rows'] for part in parts), 'boundary': boundary, 'header': header.decode(),
+             'parts': parts}
+    with open(get_parts_manifest_path(tracking_week_csv, output_dir), 'w') as parts_manifest_file:
+        json.dump(split, parts_manifest_file, indent=1)
+    return split
 
-        # Save the first and second halves as separate CSV files
-        first_half.to_csv(os.path.join(seperated_data_path, first_half_filename), index=False)
-        second_half.to_csv(os.path.join(seperated_data_path, second_half_filename), index=False)
 
-        # # Delete the original CSV file
-        # os.remove(tracking_week_path)
+def read_split(tracking_week_csv, output_dir=seperated_data_path):
+    """
+    Reads the json description of a split csv written by split_tracking_csv().
+    """
+    with open(get_parts_manifest_path(tracking_week_csv, output_dir)) as parts_manifest_file:
+        return json.load(parts_manifest_file)
+
+
+def _has_parts(tracking_week_csv, output_dir=seperated_data_path):
+    """
+    True when the split description and every part it lists exist with their recorded size.
+    """
+    if not os.path.exists(get_parts_manifest_path(tracking_week_csv, output_dir)):
+        return False
+    return all(os.path.exists(os.path.join(output_dir, part['file'])) and
+               os.path.getsize(os.path.join(output_dir, part['file'])) == part['size']
+               for part in read_split(tracking_week_csv, output_dir)['parts'])
+
+
+def verify_tracking_parts(tracking_week_csv, output_dir=seperated_data_path):
+    """
+    Checks the sha256 of every part of a split csv against its description, without parsing them.
+    Returns:
+        List of the file names of parts that are missing or whose checksum does not match
+    """
+    split = read_split(tracking_week_csv, output_dir)
+    bad_parts = []
+    for part in split['parts']:
+        part_path = os.path.join(output_dir, part['file'])
+        if not os.path.exists(part_path) or file_sha256(part_path) != part['sha256']:
+            bad_parts.append(part['file'])
+    return bad_parts
+
+
+def combine_tracking_parts(tracking_week_csv, parts_dir=seperated_data_path, output_dir=tracking_data_path):
+    """
+    Streams the parts of a split csv back into one csv, dropping the repeated headers. The combined bytes are hashed
+    while they are written and must match the sha256 of the original csv, otherwise the output is discarded.
+    Args:
+        tracking_week_csv: File name of the original csv, e.g. tracking_week_1.csv
+        parts_dir: Directory of the parts
+        output_dir: Directory of the combined csv
+    Returns:
+        Path of the combined csv
+    Raises:
+        ValueError: If a part is missing or corrupted, or the combined csv does not match the original
+    """
+    split = read_split(tracking_week_csv, parts_dir)
+    bad_parts = verify_tracking_parts(tracking_week_csv, parts_dir)
+    if bad_parts:
+        raise ValueError(f'Missing or corrupted parts of {tracking_week_csv}: {bad_parts}')
+
+    combined_path = os.path.join(output_dir, tracking_week_csv)
+    combined_hash = hashlib.sha256()
+    with open(combined_path + '.tmp', 'wb', buffering=WRITE_BUFFER_SIZE) as combined_file:
+        for i, part in enumerate(split['parts']):
+            with open(os.path.join(parts_dir, part['file']), 'rb') as part_file:
+                header = part_file.readline()
+                if i == 0:
+                    combined_file.write(header)
+                    combined_hash.update(header)
+                for block in iter(lambda: part_file.read(WRITE_BUFFER_SIZE), b''):
+                    combined_file.write(block)
+                    combined_hash.update(block)
+
+    if combined_hash.hexdigest() != split['sha256']:
+        os.remove(combined_path + '.tmp')
+        raise ValueError(f'Combined {tracking_week_csv} does not match the checksum of the original csv')
+
+    os.replace(combined_path + '.tmp', combined_path)
+    return combined_path
+
+
+def _list_tracking_csvs(directory, suffix):
+    if not os.path.isdir(directory):
+        hint = ', split the tracking csvs first' if directory == seperated_data_path else ''
+        raise FileNotFoundError(f'Directory {directory} does not exist{hint}')
+    return sorted(f for f in os.listdir(directory) if f.startswith('tracking_week_') and f.endswith(suffix))
+
+
+def _run_concurrently(function, arguments, max_workers):
+    """
+    Runs function on each argument tuple, in a process pool when there is more than one.
+    """
+    if max_workers == 1 or len(arguments) <= 1:
+        return [function(*argument) for argument in arguments]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, *zip(*arguments)))
+
+
+def split_tracking_data(n_parts=DEFAULT_N_PARTS, boundary='play', max_workers=None, force=False):
+    """
+    Splits every tracking_week_N.csv of tracking_data into parts in seperated_data, one week per worker process.
+    Weeks whose csv is unchanged since it was last split with the same settings are skipped (see ingestManifestUtils).
+    Args:
+        n_parts: Target number of parts per week
+        boundary: 'play' or 'game'
+        max_workers: Number of worker processes. Default is the number of cores
+        force: Splits every week again
+    Returns:
+        List of split descriptions of the weeks that were split
+    """
+    manifest = read_manifest()
+    pending_arguments = []
+    for tracking_week_csv in _list_tracking_csvs(tracking_data_path, '.csv'):
+        tracking_week_path = os.path.join(tracking_data_path, tracking_week_csv)
+        entry = manifest[SPLIT_FILES_SECTION].get(tracking_week_csv)
+        if not force and entry is not None and entry.get('n_parts') == n_parts and \
+                entry.get('boundary') == boundary and is_file_unchanged(entry, tracking_week_path) and \
+                _has_parts(tracking_week_csv):
+            continue
+        pending_arguments.append((tracking_week_path, seperated_data_path, n_parts, boundary))
 
+    splits = _run_concurrently(split_tracking_csv, pending_arguments, max_workers)
 
-def combine_tracking_data():
-    list_of_csvs = sorted([f for f in os.listdir(tracking_data_path) if f.endswith("_part1.csv")])
+    for split in splits:
+        record_file(manifest, SPLIT_FILES_SECTION, split['source'], os.path.join(tracking_data_path, split['source']),
+                    rows=split['rows'], n_parts=n_parts, boundary=boundary)
+    write_manifest(manifest)
+    return splits
 
-    for part1_csv in list_of_csvs:
-        # Generate the corresponding part2 filename
-        part2_csv = part1_csv.replace("_part1.csv", "_part2.csv")
 
-        # Read both halves into dataframes
-        part1_df = pd.read_csv(os.path.join(seperated_data_path, part1_csv))
-        part2_df = pd.read_csv(os.path.join(seperated_data_path, part2_csv))
+def combine_tracking_data(max_workers=None, force=False):
+    """
+    Combines the parts in seperated_data back into tracking_week_N.csv files in tracking_data, one week per worker
+    process, verifying each against the checksum of its original csv. Weeks whose combined csv already matches the
+    original are skipped.
+    Args:
+        max_workers: Number of worker processes. Default is the number of cores
+        force: Combines every week again
+    Returns:
+        List of paths of the combined csvs
+    Raises:
+        FileNotFoundError: seperated_data does not exist, e.g. because the csvs were never split
+    """
+    pending_arguments = []
+    for parts_manifest_file in _list_tracking_csvs(seperated_data_path, '_parts.json'):
+        tracking_week_csv = parts_manifest_file.replace('_parts.json', '.csv')
+        combined_path = os.path.join(tracking_data_path, tracking_week_csv)
+        split = read_split(tracking_week_csv)
+        if not force and os.path.exists(combined_path) and os.path.getsize(combined_path) == split['size'] and \
+                file_sha256(combined_path) == split['sha256']:
+            continue
+        pending_arguments.append((tracking_week_csv, seperated_data_path, tracking_data_path))
 
-        # Combine both halves
-        combined_df = pd.concat([part1_df, part2_df], ignore_index=True)
+    return _run_concurrently(combine_tracking_parts, pending_arguments, max_workers)
 
-        # Define a new filename for the combined CSV
-        combined_filename = part1_csv.replace("_part1.csv", ".csv")
 
-        # Save the combined dataframe as a single CSV file
-        combined_df.to_csv(os.path.join(tracking_data_path, combined_filename), index=False)
+def main(argv=None):
+    """
+    Command line interface:
+        python -m CastleDefense.utils.dataSplitCombineUtils split --parts 4 --boundary game
+        python -m CastleDefense.utils.dataSplitCombineUtils combine
+        python -m CastleDefense.utils.dataSplitCombineUtils verify
+    """
+    parser = argparse.ArgumentParser(description='Split tracking csvs into parts and combine them back.')
+    parser.add_argument('command', choices=['split', 'combine', 'verify'])
+    parser.add_argument('--parts', type=int, default=DEFAULT_N_PARTS, help='Number of parts per week')
+    parser.add_argument('--boundary', choices=list(SPLIT_BOUNDARIES), default='play',
+                        help='Never split inside a play or a game')
+    parser.add_argument('--workers', type=int, default=None, help='Number of weeks processed concurrently')
+    parser.add_argument('--force', action='store_true', help='Process unchanged weeks again')
+    args = parser.parse_args(argv)
 
-        # # Delete the original split files
-        # os.remove(os.path.join(tracking_data_path, part1_csv))
-        # os.remove(os.path.join(tracking_data_path, part2_csv))
+    if args.command == 'split':
+        for split in split_tracking_data(args.parts, args.boundary, args.workers, args.force):
+            print(f"{split['source']}: {split['rows']} rows in {len(split['parts'])} parts")
+    elif args.command == 'combine':
+        for combined_path in combine_tracking_data(args.workers, args.force):
+            print(f'Combined {combined_path}')
+    else:
+        n_bad = 0
+        for parts_manifest_file in _list_tracking_csvs(seperated_data_path, '_parts.json'):
+            tracking_week_csv = parts_manifest_file.replace('_parts.json', '.csv')
+            bad_parts = verify_tracking_parts(tracking_week_csv)
+            n_bad += len(bad_parts)
+            print(f"{tracking_week_csv}: {'OK' if not bad_parts else 'bad parts ' + ', '.join(bad_parts)}")
+        return 1 if n_bad else 0
+    return 0
 
 
-# combine_tracking_data()
-split_tracking_data()
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+import pandas as pd
+import os
+from functools import lru_cache
+
+tracking_store_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data', 'store'))
+event_index_path = os.path.join(tracking_store_path, 'event_index.csv')
+
+EVENT_INDEX_COLUMNS = ['week', 'gameId', 'playId', 'frameId', 'event']
+
+
+def extract_game_events(game_df, week):
+    """
+    Returns the event index rows of a game: one row per frame of a play that has an event.
+    Args:
+        game_df: Tracking rows of the game
+        week: Week of the season
+    Returns:
+        pandas.DataFrame with EVENT_INDEX_COLUMNS
+    """
+    events_df = game_df.loc[game_df['event'].notna(), ['gameId', 'playId', 'frameId', 'event']]
+    events_df = events_df.drop_duplicates(subset=['gameId', 'playId', 'frameId', 'event'])
+    events_df = events_df.astype({'gameId': 'int64', 'playId': 'int64', 'frameId': 'int64', 'event': str})
+    events_df.insert(0, 'week', int(week))
+    return events_df[EVENT_INDEX_COLUMNS].reset_index(drop=True)
+
+
+def read_event_index_file():
+    """
+    Reads the event index of the tracking store. Returns an empty index if it has not been built.
+    """
+    if not os.path.exists(event_index_path):
+        return pd.DataFrame({column: pd.Series(dtype='object' if column == 'event' else 'int64')
+                             for column in EVENT_INDEX_COLUMNS})
+    return pd.read_csv(event_index_path, dtype={'week': 'int64', 'gameId': 'int64', 'playId': 'int64',
+                                                'frameId': 'int64', 'event': str})
+
+
+def write_event_index(week_event_dfs, weeks):
+    """
+    Replaces the events of some weeks in the event index.
+    Args:
+        week_event_dfs: Event index DataFrames of the weeks, e.g. from extract_game_events()
+        weeks: Weeks whose previous events are dropped, including weeks that no longer exist
+    Returns:
+        pandas.DataFrame: The full event index
+    """
+    event_index_df = read_event_index_file()
+    event_index_df = event_index_df[~event_index_df['week'].isin(list(weeks))]
+    event_index_df = pd.concat([event_index_df] + list(week_event_dfs), ignore_index=True)
+    event_index_df = event_index_df.sort_values(by=['week', 'gameId', 'playId', 'frameId'], kind='mergesort')
+
+    os.makedirs(tracking_store_path, exist_ok=True)
+    event_index_df.to_csv(event_index_path + '.tmp', index=False)
+    os.replace(event_index_path + '.tmp', event_index_path)
+    invalidate_event_index()
+    return event_index_df.reset_index(drop=True)
+
+
+@lru_cache(maxsize=1)
+def get_event_index():
+    """
+    Returns the event index as a DataFrame and a dictionary for constant time lookups of a play's events.
+    Key: (week, gameId, playId), Value: list of (event, frameId) tuples in chronological order
+    """
+    event_index_df = read_event_index_file()
+    play_events = {}
+    for week, game_id, play_id, frame_id, event in event_index_df[EVENT_INDEX_COLUMNS].itertuples(index=False):
+        play_events.setdefault((week, game_id, play_id), []).append((event, frame_id))
+    return event_index_df, play_events
+
+
+def invalidate_event_index():
+    get_event_index.cache_clear()
+
+
+def get_play_events(gameId, playId, week):
+    """
+    Returns every event of a play from the event index, without reading its tracking rows.
+    Returns:
+        List of (event, frameId) tuples in chronological order, or None if the play is not in the event index
+    """
+    return get_event_index()[1].get((int(week), int(gameId), int(playId)))
+
+
+def get_play_event_frames(gameId, playId, week, events=None):
+    """
+    Returns the first frameId of each event of a play from the event index. Same output as
+    playTimelineUtils.get_zoom_event_frames(), e.g. get_play_event_frames(gameId, playId, week, ZOOMABLE_EVENTS).
+    Args:
+        events: Only these events. Default is every event of the play
+    Returns:
+        List of (event, frameId) tuples in chronological order, or None if the play is not in the event index
+    """
+    play_events = get_play_events(gameId, playId, week)
+    if play_events is None:
+        return None
+
+    first_frames = {}
+    for event, frame_id in play_events:
+        if events is None or event in events:
+            first_frames.setdefault(event, frame_id)
+    return sorted(first_frames.items(), key=lambda event_frame: event_frame[1])
+
+
+def find_plays_with_events(events, week=None, ordered=True):
+    """
+    Selects the plays containing every given event, e.g. find_plays_with_events(['handoff', 'first_contact', 'tackle']).
+    Args:
+        events: Event names
+        week: Only plays of this week (or list of weeks). Default is every week
+        ordered: Only plays where the first frame of each event comes after the previous event's, in the given order
+    Returns:
+        pandas.DataFrame with week, gameId, playId and the first frameId of each event as one column per event
+    """
+    if len(set(events)) != len(events):
+        raise ValueError(f'Events must be distinct: {events}')
+
+    event_index_df = get_event_index()[0]
+    if week is not None:
+        weeks = week if isinstance(week, (list, tuple, set)) else [week]
+        event_index_df = event_index_df[event_index_df['week'].isin(weeks)]
+
+    event_index_df = event_index_df[event_index_df['event'].isin(events)]
+    event_frames_df = event_index_df.groupby(['week', 'gameId', 'playId', 'event'])['frameId'].min().unstack('event')
+    event_frames_df = event_frames_df.reindex(columns=list(events)).dropna()
+
+    if ordered and len(events) > 1:
+        event_frames_df = event_frames_df[(event_frames_df.diff(axis=1).iloc[:, 1:] > 0).all(axis=1)]
+
+    event_frames_df = event_frames_df.astype('int64').reset_index()
+    event_frames_df.columns.name = None
+    return event_frames_df
+
+
+# find_plays_with_events(['handoff', 'tackle'], week=1)
+# get_play_event_frames(2022090800, 343, 1)
@@ -3,10 +3,21 @@ import os
 import numpy as np
 import time
 import dateutil
+from CastleDefense.utils.trackingStoreUtils import load_play_from_store, load_game_from_store, \
+    load_games_from_store, get_tracking_week_csv_path, update_tracking_store, release_preloaded_weeks
+from CastleDefense.utils.metadataUtils import get_metadata_repository
+from CastleDefense.utils.schemaUtils import read_tracking_csv
+from CastleDefense.utils.seasonArrayUtils import update_season_arrays, season_arrays_path, get_season_arrays, \
+    SEASON_NUMERIC_COLUMNS, SEASON_CATEGORICAL_COLUMNS
+from CastleDefense.utils.playTimelineUtils import build_play_timeline, get_zoom_event_frames, apply_timeline
+from CastleDefense.utils.kinematicsUtils import velocity_components, normalize_play_direction, rotate_field
+from CastleDefense.utils.profilingUtils import timed_stage
 
 INITIAL_ZOOM_OUT_WINDOW = 45
+BLOCKING_POSITIONS = ['TE', 'G', 'C', 'T']
 
 
+@timed_stage()
 def load_play(playId, gameId, week=1):
     """
     Uses facade method to call other loading methods for a play
@@ -30,19 +41,27 @@ def rotate_field_orientation(df):
         df: The play dataframe
     Returns: The flipped play dataframe with x and y coordinates flipped
     """
-    x, y = df['x'], df['y']
-    df['x'] = 53.3 - y
-    df['y'] = x
+    df['x'], df['y'], df['dir'], df['o'] = rotate_field(df['x'], df['y'], df['dir'], df['o'])
+    return df
 
-    df['dir'] = (df['dir'] - 90) % 360
-    df['o'] = (df['o'] - 90) % 360
 
+def normalize_field_direction(df):
+    """
+    Flips plays moving left so the play moves left to right, and sets playDirection to 'right'
+    Args:
+        df: The play dataframe
+    Returns: The play dataframe with x, y, dir and o flipped for left moving plays
+    """
+    df['x'], df['y'], df['dir'], df['o'] = normalize_play_direction(df['x'], df['y'], df['dir'], df['o'],
+                                                                    df['playDirection'])
+    df['playDirection'] = 'right'
     return df
 
 
 def load_play_data(play_id, game_id, week=1):
     """
-    Loads tracking data for a specific play.
+    Loads tracking data for a specific play. Reads only the play's rows from the tracking store when it has been built
+    (see trackingStoreUtils.build_tracking_store), otherwise scans the week's tracking csv.
 
     Args:
         play_id (int): Play identifier.
@@ -54,47 +73,112 @@ def load_play_data(play_id, game_id, week=1):
 
     Example usage: play_data = load_play_data(12345, game_id=2022090801, week=2)
     """
-    data_path = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data')), 'tracking_week_' + str(week) + '.csv')
-    week_df = pd.read_csv(data_path)
+    play_df = load_play_from_store(play_id, game_id, week)
+    if play_df is not None:
+        return play_df
+
+    week_df = read_tracking_csv(get_tracking_week_csv_path(week))
     play_df = week_df.query(f'gameId == {game_id} and playId == {play_id}')
     return play_df
 
 
+def refresh_tracking_data(chunksize=None):
+    """
+    Brings the loaders up to date after tracking csvs are added, replaced or removed in tracking_data. Only the weeks
+    whose csv changed since the last ingest are converted again (see trackingStoreUtils.update_tracking_store), the
+    season arrays are rebuilt only if one of their games changed, and in memory caches are dropped.
+    Derived feature tables (playFeatureUtils) re-extract only the changed games on their next run.
+    Args:
+        chunksize: Streams each changed csv in chunks of this many rows
+    Returns:
+        Dictionary with the changed 'weeks', the 'removed_weeks' and the changed gameIds per week under 'games'
+    """
+    from CastleDefense.utils.playCacheUtils import invalidate_play_cache  # playCacheUtils imports this module
+
+    changes = update_tracking_store(chunksize=chunksize)
+    if changes['weeks'] or changes['removed_weeks']:
+        release_preloaded_weeks()
+        invalidate_play_cache(set(changes['weeks']) | set(changes['removed_weeks']))
+        if os.path.exists(os.path.join(season_arrays_path, 'meta.json')):
+            update_season_arrays()
+
+    get_metadata_repository().refresh_if_changed()
+    return changes
+
+
+def load_play_columns(play_id, game_id, week=1, columns=None):
+    """
+    Loads a play's tracking columns as numpy arrays, for season wide sweeps that do not need a DataFrame per play.
+    Numeric columns are zero copy views of the memory mapped season arrays when they have been built and hold the play
+    (see seasonArrayUtils.build_season_arrays), otherwise the play is read with load_play_data.
+    Args:
+        play_id (int): Play identifier.
+        game_id (int): Game identifier.
+        week (int, optional): Week of the season. Default is 1.
+        columns: Columns of seasonArrayUtils.SEASON_NUMERIC_COLUMNS or SEASON_CATEGORICAL_COLUMNS. Default is all of them
+    Returns:
+        Dictionary of column name to numpy array. Numeric columns have the dtypes of SEASON_NUMERIC_COLUMNS with
+        missing ids as -1, categorical columns are object arrays with missing values as NaN. Both sources return the
+        same arrays
+    Example usage: x, y = load_play_columns(56, 2022090800, columns=['x', 'y']).values()
+    """
+    columns = columns or list(SEASON_NUMERIC_COLUMNS) + SEASON_CATEGORICAL_COLUMNS
+
+    if os.path.exists(os.path.join(season_arrays_path, 'meta.json')):
+        season_arrays = get_season_arrays()
+        arrays = season_arrays.load_play(game_id, play_id, columns=columns)
+        if arrays is not None:
+            # Code -1 picks the NaN appended after the categories
+            return {column: np.append(np.asarray(season_arrays.categories[column], dtype=object), np.nan)[values]
+                    if column in SEASON_CATEGORICAL_COLUMNS else values for column, values in arrays.items()}
+
+    play_df = load_play_data(play_id, game_id, week)
+    play_arrays = {}
+    for column in columns:
+        if column in SEASON_CATEGORICAL_COLUMNS:
+            play_arrays[column] = play_df[column].to_numpy(dtype=object, na_value=np.nan)
+        else:
+            dtype = np.dtype(SEASON_NUMERIC_COLUMNS[column])
+            play_arrays[column] = play_df[column].to_numpy(dtype=dtype, na_value=-1 if dtype.kind == 'i' else np.nan)
+    return play_arrays
+
+
 def load_all_plays_by_game(game_id, week):
     """
-    Loads tracking data for all plays in a game.
+    Loads tracking data for all plays in a game. Reads the game's partition from the tracking store when available.
     Args:
         game_id:
     Returns:
         pandas.DataFrame: Tracking data for the plays.
     """
-    data_path = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data')), 'tracking_week_' + str(week) + '.csv')
-    week_df = pd.read_csv(data_path)
+    plays_df = load_game_from_store(game_id, week)
+    if plays_df is not None:
+        return plays_df
+
+    week_df = read_tracking_csv(get_tracking_week_csv_path(week))
     plays_df = week_df.query(f'gameId == {game_id}')
     return plays_df
 
 
 def load_game(game_id):
     """
-    Loads the game row from games.csv
+    Loads the game row from games.csv. Served from the process wide metadata cache (see metadataUtils).
     Args:
         game_id:
     Returns:
         pandas.DataFrame: Information on the game specified
 
     """
-    path_to_games = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'overview_data')), 'games.csv')
-    games_df = pd.read_csv(path_to_games)
-    game_df = games_df.query(f'gameId == {game_id}')
-    return game_df
+    return get_metadata_repository().get_game(game_id)
 
 
-def load_teams_from_play(play_df, play, gameId, vertical_field=True):
+def load_teams_from_play(play_df, play, gameId, vertical_field=True, left_to_right=False):
     """
     Extracts team data from a play DataFrame.
 
     Args:
         play_df (pandas.DataFrame): DataFrame with team data.
+        left_to_right (bool): Flips plays moving left so all plays face the same direction
 
     Returns:
         tuple: DataFrames for team_1, team_2, and football.
@@ -104,16 +188,33 @@ def load_teams_from_play(play_df, play, gameId, vertical_field=True):
 
     Note: Assumes non-null team names and 'football' label in the 'club' column.
     """
-    game = load_game(gameId)
-
-    home_team = game['homeTeamAbbr'].iloc[0]
-    away_team = game['visitorTeamAbbr'].iloc[0]
     offense_team = play['possessionTeam'].iloc[0]
     defense_team = play['defensiveTeam'].iloc[0]
 
-    ft_df = play_df[play_df['club'] == 'football']
-    off_df = play_df[play_df['club'] == offense_team]
-    def_df = play_df[play_df['club'] == defense_team]
+    return split_play_teams(play_df, offense_team, defense_team, vertical_field=vertical_field,
+                            left_to_right=left_to_right)
+
+
+def split_play_teams(play_df, offense_team, defense_team, vertical_field=True, left_to_right=False):
+    """
+    Splits a play's tracking rows into offense, defense and football DataFrames sorted by frameId, rotated for the
+    vertical field and optionally flipped so every play moves left to right.
+    Args:
+        play_df: Tracking rows of one play
+        offense_team: Club of the offense, plays.csv possessionTeam
+        defense_team: Club of the defense, plays.csv defensiveTeam
+    Returns:
+        tuple: DataFrames for offense, defense, and football.
+    """
+    # Copies, so the orientation changes below write to the team DataFrames and not to views of play_df
+    ft_df = play_df[play_df['club'] == 'football'].copy()
+    off_df = play_df[play_df['club'] == offense_team].copy()
+    def_df = play_df[play_df['club'] == defense_team].copy()
+
+    if left_to_right:
+        off_df = normalize_field_direction(off_df)
+        def_df = normalize_field_direction(def_df)
+        ft_df = normalize_field_direction(ft_df)
 
     if vertical_field:
         off_df = rotate_field_orientation(off_df)
@@ -125,35 +226,97 @@ def load_teams_from_play(play_df, play, gameId, vertical_field=True):
     off_df = off_df.sort_values(by='frameId', ascending=True)
     def_df = def_df.sort_values(by='frameId', ascending=True)
 
-    #  TODO: Add Helper method to use here so all plays are facing the same direction (Left to Right)
-
     return off_df, def_df, ft_df
 
 
+def _resolve_play_keys(keys):
+    """
+    Joins requested plays with their plays.csv teams and, unless given, the week of their game from games.csv.
+    Args:
+        keys: (gameId, playId) or (gameId, playId, week) tuples
+    Returns:
+        pandas.DataFrame with gameId, playId, week, possessionTeam and defensiveTeam, in request order
+    """
+    keys = [tuple(int(value) for value in key) for key in keys]
+    has_week = bool(keys) and len(keys[0]) == 3
+    requests_df = pd.DataFrame(keys, columns=['gameId', 'playId', 'week'] if has_week else ['gameId', 'playId'],
+                               dtype='int64')
+
+    repository = get_metadata_repository()
+    metadata_df = repository.plays[['gameId', 'playId', 'possessionTeam', 'defensiveTeam']].astype(
+        {'gameId': 'int64', 'playId': 'int64'})
+    if not has_week:
+        metadata_df = metadata_df.merge(repository.games[['gameId', 'week']].astype('int64'), on='gameId', how='inner')
+
+    requests_df = requests_df.merge(metadata_df, on=['gameId', 'playId'], how='left', sort=False)
+    unknown = requests_df['possessionTeam'].isna() | requests_df['week'].isna()
+    if unknown.any():
+        unknown_keys = list(zip(requests_df.loc[unknown, 'gameId'], requests_df.loc[unknown, 'playId']))
+        raise ValueError(f'Unknown plays (gameId, playId): {unknown_keys[:10]}'
+                         + (' ...' if len(unknown_keys) > 10 else ''))
+    return requests_df.astype({'week': 'int64'})
+
+
+def load_plays(keys, vertical_field=True, left_to_right=False):
+    """
+    Bulk counterpart of load_play(). Resolves the teams and weeks of every requested play with one metadata merge, then
+    reads the data of each week once (preloaded week, tracking store partitions, or a single scan of the week's csv)
+    instead of once per play.
+    Args:
+        keys: (gameId, playId) or (gameId, playId, week) tuples, e.g. from batchAnimateUtils.select_play_keys()
+        vertical_field: See load_teams_from_play()
+        left_to_right: See load_teams_from_play()
+    Yields:
+        ((gameId, playId, week), (offense, defense, football)) per play. Plays are not yielded in the order of keys
+        but grouped by week in ascending order, then by game in the order of each game's first request within the week,
+        then in request order within the game. Use the yielded key to map plays back to their request. Plays without
+        tracking rows yield empty DataFrames
+    Example usage:
+        for (gameId, playId, week), (offense, defense, football) in load_plays([(2022090800, 56), (2022090800, 80)]):
+    """
+    requests_df = _resolve_play_keys(keys)
+
+    for week, week_requests_df in requests_df.groupby('week', sort=True):
+        game_ids = week_requests_df['gameId'].unique().tolist()
+        game_dfs = load_games_from_store(game_ids, week)
+
+        missing_game_ids = [game_id for game_id in game_ids if game_id not in game_dfs]
+        if missing_game_ids:
+            # One scan of the week's csv for every game missing from the tracking store
+            week_df = read_tracking_csv(get_tracking_week_csv_path(week))
+            week_df = week_df[week_df['gameId'].isin(missing_game_ids)]
+            game_rows = week_df.groupby('gameId', sort=False).indices
+            game_dfs.update({game_id: week_df.iloc[game_rows.get(game_id, [])] for game_id in missing_game_ids})
+
+        for game_id, game_requests_df in week_requests_df.groupby('gameId', sort=False):
+            game_df = game_dfs[game_id]
+            play_rows = game_df.groupby('playId', sort=False).indices
+            for play_id, offense_team, defense_team in zip(game_requests_df['playId'],
+                                                           game_requests_df['possessionTeam'],
+                                                           game_requests_df['defensiveTeam']):
+                play_df = game_df.iloc[play_rows.get(play_id, [])]
+                yield (int(game_id), int(play_id), int(week)), split_play_teams(
+                    play_df, offense_team, defense_team, vertical_field=vertical_field, left_to_right=left_to_right)
+
+
 def get_play_by_id(gameId, playId):
     """
-    Returns a play DataFrame given a gameId and playId.
+    Returns a play DataFrame given a gameId and playId. Served from the process wide metadata cache.
     Args:
         gameId: identifiers to the play
         playId:
     Returns: Pandas DataFrame with the play
     """
-    path_to_plays = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'overview_data')), 'plays.csv')
-    plays_df = pd.read_csv(path_to_plays)
-    play = plays_df[(plays_df['gameId'] == gameId) & (plays_df['playId'] == playId)]
-    return play
+    return get_metadata_repository().get_play(gameId, playId)
 
 
 def get_players_by_ids(player_ids):
     """
-    Returns a DataFrame with player information given a list of player ids.
+    Returns a DataFrame with player information given a list of player ids. Served from the process wide metadata cache.
     Args:
         player_ids: List of player ids
     """
-    path_to_players = os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'overview_data')), 'players.csv')
-    players_df = pd.read_csv(path_to_players)
-    player_ids_df = players_df[(players_df['nflId'].isin(player_ids))]
-    return player_ids_df
+    return get_metadata_repository().get_players(player_ids)
 
 
 def get_los_details(play, play_df):
@@ -212,45 +375,25 @@ def get_blocking_players(offense_df):
     """
     offense_player_ids = offense_df['nflId'].unique()
     players_df = get_players_by_ids(offense_player_ids)
-    blocking_players_df = players_df[players_df['position'].isin(['TE', 'G', 'C', 'T'])]
+    blocking_players_df = players_df[players_df['position'].isin(BLOCKING_POSITIONS)]
     blocking_player_df = offense_df[offense_df['nflId'].isin(blocking_players_df['nflId'])]
     return blocking_player_df
 
 
 def calculate_dx_dy(speed, angle):
     """
-    Calculates the seperate x and y vectors for the speed from the player's direction
+    Calculates the seperate x and y vectors for the speed from the player's direction. See kinematicsUtils for the
+    vectorized versions used on whole plays or weeks.
     :param angle:
     :param speed:
     :return:
     """
-    # angle -= 90  # Flip the angle to account for the direction of the play
-    # angle = angle % 360  # Ensure angle is within [0, 360)
-    # angle = np.radians(angle % 360)  # Ensure angle is within [0, 360) and convert to radians
-
-    angle = np.radians(angle)  # Convert to radians
-
-    dx = np.sin(angle) * speed  # Uses simple trigonometric identities
-    dy = np.cos(angle) * speed
-
-    if 90 < angle <= 270:
-        dy = -dy
-
-    if 180 < angle <= 360:
-        dx = -dx
-
-    # dy = np.sin(angle) * speed  # Switched roles of dx and dy
-    # dx = np.cos(angle) * speed  # Switched roles of dx and dy
-    #
-    # if 0 <= angle <= 180:
-    #     dy = -dy
-    #
-    # if 90 <= angle <= 270:
-    #     dx = -dx
+    dx, dy = velocity_components(speed, angle)  # Uses simple trigonometric identities, also on whole arrays
 
     return dx, dy
 
 
+@timed_stage()
 def assign_player_display_identifier(offense, defense, display_position):
     """
     Assigns playerDisplayIdentifier based on the chosen display mode (jersey number or position).
@@ -277,36 +420,25 @@ def assign_player_display_identifier(offense, defense, display_position):
     return offense, defense
 
 
-def bump_up_frameIds(df, frame_id, increment=10):
+def set_event_at_frameId(df, frame_id, event):
     """
-    Bumps up all frameIds after a specific frameId by a given increment.
+    Writes an event to every row of a frameId. Adds the event to the categories of a categorical event column.
     Args:
         df:
         frame_id:
-        increment:
-    """
-    df.loc[df['frameId'] > frame_id, 'frameId'] += increment
-
-
-def add_rows_with_incremented_frameId(original_df, frame_id, new_frame_id):
+        event:
     """
-    Adds spacing rows to a DataFrame with an incremented frameId.
-    Args:
-        df:
-        original_df:
-        frame_id: Original frame_Id when event occurs
-        new_frame_id: New frameId to space rows for zoom effects
-    Returns: The new dataframe with the added rows
-    """
-    spacing_row = original_df[original_df['frameId'] == frame_id].iloc[0]
-    spacing_row['frameId'] = new_frame_id
-    updated_df = pd.concat([original_df, pd.DataFrame([spacing_row])], ignore_index=True)
-    return updated_df
+    if df['event'].dtype.name == 'category' and event not in df['event'].cat.categories:
+        df['event'] = df['event'].cat.add_categories([event])
+    df.loc[df['frameId'] == frame_id, 'event'] = event
+    return df
 
 
+@timed_stage()
 def adjust_frameIds_for_initial_zoom(offense, defense, football, event_frameIds):
     """
         Adjusts the frameIds for the offense, defense, and football DataFrames to allow for a zoom effect.
+        The first frame is held for 20 frames through a PlayTimeline, so all rows are duplicated in one pass.
         Args:
             offense:
             defense:
@@ -320,30 +452,21 @@ def adjust_frameIds_for_initial_zoom(offense, defense, football, event_frameIds)
     event = 'start'
 
     # Write the event to this first frameId in each dataframe
-    offense.loc[offense['frameId'] == frame_id, 'event'] = event
-    defense.loc[defense['frameId'] == frame_id, 'event'] = event
-    football.loc[football['frameId'] == frame_id, 'event'] = event
-
-    # Bump up all later frameIds by 20
-    [bump_up_frameIds(df, frame_id, 20) for df in [offense, defense, football]]
-
-    # Add 10 rows with consecutive frameIds to offense, defense, football
-    zoom_out_increases = [INITIAL_ZOOM_OUT_WINDOW, 45, 45, 45, 39.5, 33.5, 28.0, 23.0, 18.5, 14.5, 11.0, 8.0, 5.5, 3.5, 2.0, 1.0, 0.5, 0.25, 0, 0]
-    for i in range(1, 21):  # Uses 1 index to offset so zoom effect begins immediately AFTER the event
-        new_frame_id = frame_id + i
-        event_frameIds[new_frame_id] = (zoom_out_increases[i-1], event)
+    offense, defense, football = [set_event_at_frameId(df, frame_id, event) for df in [offense, defense, football]]
 
-        # Duplicate rows of event timestep to offense, defense, football with incremented frameId value
-        offense = add_rows_with_incremented_frameId(offense, frame_id, new_frame_id)
-        defense = add_rows_with_incremented_frameId(defense, frame_id, new_frame_id)
-        football = add_rows_with_incremented_frameId(football, frame_id, new_frame_id)
+    # Hold the first frame for 20 frames and bump up all later frameIds by 20
+    timeline = build_play_timeline(offense['frameId'], initial_zoom=True)
+    offense, defense, football = [apply_timeline(df, timeline) for df in [offense, defense, football]]
+    event_frameIds.update(timeline.event_frameIds)
 
     return offense, defense, football, event_frameIds
 
 
+@timed_stage()
 def adjust_frameIds_for_zoom_effect(offense, defense, football, event_frameIds):
     """event_frameIds
     Adjusts the frameIds for the offense, defense, and football DataFrames to allow for a zoom effect.
+    Every zoomable event is held for 10 frames through a PlayTimeline, so all rows are duplicated in one pass.
     Args:
         offense:
         defense:
@@ -352,26 +475,12 @@ def adjust_frameIds_for_zoom_effect(offense, defense, football, event_frameIds):
     Returns:
         The altered offense, defense, and football DataFrames and dictionaries
     """
-    zoomable_events = ['handoff', 'pass_arrived', 'tackle', 'touchdown']
-    events = offense['event'].unique()
-
-    for event in events:
-        if event in zoomable_events:
-            frame_id = offense[offense['event'] == event]['frameId'].iloc[0]
-
-            # Bump up all later frameIds by 10
-            [bump_up_frameIds(df, frame_id) for df in [offense, defense, football]]
-
-            # Add 10 rows with consecutive frameIds to offense, defense, football
-            zoom_out_increases = [5, 10, 13, 14, 15, 15, 14, 13, 10, 5]
-            for i in range(1, 11):  # Uses 1 index to offset so zoom effect begins immediately AFTER the event
-                new_frame_id = frame_id + i
-                event_frameIds[new_frame_id] = (zoom_out_increases[i - 1], event)
+    event_frames = get_zoom_event_frames(offense['frameId'], offense['event'])
 
-                # Duplicate rows of event timestep to offense, defense, football with incremented frameId value
-                offense = add_rows_with_incremented_frameId(offense, frame_id, new_frame_id)
-                defense = add_rows_with_incremented_frameId(defense, frame_id, new_frame_id)
-                football = add_rows_with_incremented_frameId(football, frame_id, new_frame_id)
+    # Hold each event frame for 10 frames and bump up all later frameIds by 10 per event
+    timeline = build_play_timeline(offense['frameId'], event_frames, initial_zoom=False)
+    offense, defense, football = [apply_timeline(df, timeline) for df in [offense, defense, football]]
+    event_frameIds.update(timeline.event_frameIds)
 
     return offense, defense, football, event_frameIds
 
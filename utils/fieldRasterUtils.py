@@ -0,0 +1,61 @@
+import numpy as np
+from matplotlib import artist as martist
+from matplotlib import image as mimage
+
+# Imported lazily by visualizeFieldUtils, like matplotlib itself, the first time a field is drawn
+
+
+class FieldRasterImage(martist.Artist):
+    """
+    Draws a field raster rendered for the exact pixel size of its axes (see visualizeFieldUtils.render_field_background)
+    by copying its pixels to the canvas. Unlike imshow() it skips the masking and resampling of the whole image on every
+    draw, so redrawing the static field costs one pixel copy per frame.
+    When the axes size in pixels no longer matches the raster (e.g. savefig at another dpi or a vector format), the
+    raster is resampled to the view like imshow() would.
+    """
+
+    def __init__(self, ax, raster, extent, zorder=0):
+        """
+        Args:
+            ax: Matplotlib axis showing the view the raster was rendered for
+            raster: (rows, columns, 4) uint8 image with the top of the view in the first row
+            extent: (left, right, bottom, top) data coordinates covered by the raster
+        """
+        super().__init__()
+        self.raster = raster
+        self._canvas_rows = np.ascontiguousarray(raster[::-1])  # draw_image() takes the bottom row first
+        self.set_zorder(zorder)
+        self._resampled_image = mimage.AxesImage(ax, extent=extent, interpolation='antialiased')
+        self._resampled_image.set_data(raster)
+        self._resampled_image.set_transform(ax.transData)
+        self._resampled_image.set_clip_path(ax.patch)
+
+    def set_figure(self, fig):
+        super().set_figure(fig)
+        self._resampled_image.set_figure(fig)
+
+    @martist.allow_rasterization
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        bbox = self.axes.bbox
+        rows, columns = self.raster.shape[:2]
+        if renderer.get_image_magnification() != 1 or abs(bbox.height - rows) > 1 or abs(bbox.width - columns) > 1:
+            self._resampled_image.draw(renderer)
+        else:
+            gc = renderer.new_gc()
+            gc.set_clip_rectangle(bbox)
+            renderer.draw_image(gc, int(round(bbox.x0)), int(round(bbox.y0)), self._canvas_rows)
+            gc.restore()
+        self.stale = False
+
+
+def add_field_raster(ax, raster, extent, zorder=0):
+    """
+    Adds a FieldRasterImage to an axis.
+    Returns:
+        FieldRasterImage
+    """
+    field_raster = FieldRasterImage(ax, raster, extent, zorder=zorder)
+    ax.add_artist(field_raster)
+    return field_raster
@@ -0,0 +1,190 @@
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from CastleDefense.utils.lazyImportUtils import lazy_import
+from CastleDefense.utils.profilingUtils import timed_stage, stage_timer, count
+
+matplotlib = lazy_import('matplotlib')
+backend_agg = lazy_import('matplotlib.backends.backend_agg')
+Image = lazy_import('PIL.Image')  # Pillow is a dependency of matplotlib
+
+VIDEO_EXTENSIONS = ['.mp4', '.mkv', '.mov', '.avi', '.webm']
+GIF_EXTENSIONS = ['.gif']
+IMAGE_SEQUENCE_PATTERN = 'frame_{:05d}.png'
+
+# Rendered frames waiting to be encoded. Bounds the memory used when drawing is faster than encoding
+FRAME_QUEUE_SIZE = 8
+
+
+class FFmpegPipeEncoder:
+    """
+    Encodes raw RGBA frames into a video by piping them to the stdin of an ffmpeg subprocess.
+    Uses the ffmpeg of matplotlib's animation.ffmpeg_path setting, like animation.FFMpegWriter.
+    """
+
+    def __init__(self, path, width, height, fps=10, codec='h264', ffmpeg_path=None):
+        self.path = path
+        ffmpeg_path = ffmpeg_path or matplotlib.rcParams['animation.ffmpeg_path']
+        command = [ffmpeg_path, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-vcodec', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+                   '-r', str(fps), '-i', 'pipe:',
+                   # yuv420p needs even dimensions
+                   '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', codec, '-pix_fmt', 'yuv420p', path]
+        self._stderr = tempfile.TemporaryFile()  # A pipe could fill up and block ffmpeg
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr)
+
+    def _error(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors='replace').strip()
+
+    def write_frame(self, frame):
+        try:
+            self.process.stdin.write(frame)
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(f'ffmpeg stopped while encoding {self.path}: {self._error()}')
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        error = self._error()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f'ffmpeg failed with exit code {returncode} while encoding {self.path}: {error}')
+
+
+class GifEncoder:
+    """
+    Encodes raw RGBA frames into an animated GIF in process with Pillow.
+    Frames are kept as palette images until close().
+    """
+
+    def __init__(self, path, width, height, fps=10):
+        self.path = path
+        self.size = (width, height)
+        self.duration = int(round(1000 / fps))
+        self.frames = []
+
+    def write_frame(self, frame):
+        image = Image.frombuffer('RGBA', self.size, frame, 'raw', 'RGBA', 0, 1).convert('RGB')
+        self.frames.append(image.quantize(colors=256))
+
+    def close(self):
+        if self.frames:
+            self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:], duration=self.duration, loop=0)
+        self.frames = []
+
+
+class ImageSequenceEncoder:
+    """
+    Writes raw RGBA frames as numbered PNG files in a directory: frame_00000.png, frame_00001.png, ...
+    """
+
+    def __init__(self, path, width, height, fps=10):
+        self.path = path
+        self.size = (width, height)
+        self.n_frames = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write_frame(self, frame):
+        image = Image.frombuffer('RGBA', self.size, frame, 'raw', 'RGBA', 0, 1)
+        image.save(os.path.join(self.path, IMAGE_SEQUENCE_PATTERN.format(self.n_frames)))
+        self.n_frames += 1
+
+    def close(self):
+        pass
+
+
+def get_frame_encoder(path, width, height, fps=10):
+    """
+    Returns the encoder for an output path: an ffmpeg pipe for video files, Pillow for .gif files and a PNG image
+    sequence for paths without extension, which are used as a directory.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in VIDEO_EXTENSIONS:
+        return FFmpegPipeEncoder(path, width, height, fps=fps)
+    if extension in GIF_EXTENSIONS:
+        return GifEncoder(path, width, height, fps=fps)
+    if extension == '':
+        return ImageSequenceEncoder(path, width, height, fps=fps)
+    raise ValueError(f'Unsupported animation format {extension!r}. Use one of {VIDEO_EXTENSIONS + GIF_EXTENSIONS} '
+                     f'or a directory for an image sequence')
+
+
+def _encode_queued_frames(encoder, frame_queue, errors):
+    """
+    Consumer thread: writes the frames of the queue to the encoder until the None sentinel. After an error, the
+    remaining frames are discarded so the producer never blocks on a full queue.
+    """
+    while True:
+        frame = frame_queue.get()
+        if frame is None:
+            return
+        if errors:
+            continue
+        try:
+            with stage_timer('encode_frame'):
+                encoder.write_frame(frame)
+        except Exception as error:
+            errors.append(error)
+
+
+@timed_stage()
+def encode_frames(fig, render_frame, frames, path, fps=10, draw=None, queue_size=FRAME_QUEUE_SIZE):
+    """
+    Renders the frames of an animation on the Agg canvas of a figure and encodes them, without FuncAnimation.
+    Drawing runs in the calling thread (matplotlib is not thread safe) while a consumer thread encodes the previous
+    frames from a bounded queue, so the two overlap.
+    Args:
+        fig: Matplotlib figure
+        render_frame: Function updating the figure for a frame, called with each element of frames
+        frames: Iterable of frames, e.g. range(n_frames)
+        path: Output video file (.mp4, ...), .gif file or directory for a PNG image sequence
+        fps: Frames per second
+        draw: Optional function rendering the canvas, e.g. to blit only the animated artists. Default redraws the figure
+        queue_size: Maximum number of rendered frames waiting to be encoded
+    Returns:
+        path
+    """
+    canvas = fig.canvas
+    if not isinstance(canvas, backend_agg.FigureCanvasAgg):
+        canvas = backend_agg.FigureCanvasAgg(fig)
+    draw = draw or canvas.draw
+
+    canvas.draw()
+    height, width = np.asarray(canvas.buffer_rgba()).shape[:2]
+    encoder = get_frame_encoder(path, width, height, fps=fps)
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    consumer = threading.Thread(target=_encode_queued_frames, args=(encoder, frame_queue, errors), daemon=True)
+    consumer.start()
+
+    try:
+        for frame in frames:
+            if errors:
+                break
+            render_frame(frame)
+            with stage_timer('draw_frame'):
+                draw()
+                frame_bytes = bytes(canvas.buffer_rgba())  # Copy, the canvas reuses its buffer for the next frame
+            with stage_timer('queue_wait'):
+                frame_queue.put(frame_bytes)
+            count('encoded_frames')
+    finally:
+        frame_queue.put(None)
+        consumer.join()
+        try:
+            encoder.close()
+        except Exception as error:
+            errors.append(error)
+
+    if errors:
+        raise errors[0]
+    return path
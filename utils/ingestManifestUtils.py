@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+
+tracking_data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data'))
+manifest_path = os.path.join(tracking_data_path, 'manifest.json')
+
+# Sections of the manifest. Each maps a key (a week, or a csv file name) to the fingerprint of the input it was built
+# from: file size, mtime, sha256 and, for tracking weeks, the row count and content hash of every game
+TRACKING_WEEKS_SECTION = 'tracking_weeks'
+SPLIT_FILES_SECTION = 'split_files'
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """
+    Returns the sha256 hex digest of a file, read in blocks.
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def file_fingerprint(path):
+    """
+    Returns the size, mtime and sha256 of a file.
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+
+def game_content_hash(game_df):
+    """
+    Returns a hex digest of a game's tracking rows read with schemaUtils.TRACKING_DTYPES. Equal for equal rows in the
+    same order. Categorical columns are hashed by value, so chunks with different categories hash the same.
+    """
+    import pandas as pd  # Only needed at ingest, keeps the split/combine cli free of pandas
+
+    row_hashes = pd.util.hash_pandas_object(game_df, index=False)
+    return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()
+
+
+def describe_game(game_df):
+    """
+    Returns the manifest entry of a game: its row count and content hash.
+    """
+    return {'rows': len(game_df), 'hash': game_content_hash(game_df)}
+
+
+def read_manifest(path=manifest_path):
+    """
+    Reads the ingestion manifest. Returns an empty manifest if none has been written yet.
+    """
+    if not os.path.exists(path):
+        return {TRACKING_WEEKS_SECTION: {}, SPLIT_FILES_SECTION: {}}
+
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest.setdefault(TRACKING_WEEKS_SECTION, {})
+    manifest.setdefault(SPLIT_FILES_SECTION, {})
+    return manifest
+
+
+def write_manifest(manifest, path=manifest_path):
+    """
+    Writes the ingestion manifest. A temporary file is replaced so an interrupted write keeps the previous manifest.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def is_file_unchanged(entry, path):
+    """
+    Compares a file with its manifest entry. Size and mtime are checked first; the content hash is only computed when
+    the size matches but the mtime differs, so touched but identical files are not rebuilt.
+    Args:
+        entry: Manifest entry of the file, or None
+        path: Path of the file
+    """
+    if entry is None or not os.path.exists(path):
+        return False
+
+    stat = os.stat(path)
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime_ns == entry['mtime']:
+        return True
+    return file_sha256(path) == entry['sha256']
+
+
+def find_changed_entries(manifest, section, paths):
+    """
+    Compares input files with a manifest section.
+    Args:
+        manifest: Manifest from read_manifest()
+        section: TRACKING_WEEKS_SECTION or SPLIT_FILES_SECTION
+        paths: Dictionary of key to the current path of each input
+    Returns:
+        Tuple of (changed keys, removed keys). Changed keys include inputs missing from the manifest
+    """
+    entries = manifest[section]
+    changed = [key for key, path in paths.items() if not is_file_unchanged(entries.get(str(key)), path)]
+    removed = [key for key in entries if key not in {str(key) for key in paths}]
+    return changed, removed
+
+
+def record_file(manifest, section, key, path, **details):
+    """
+    Stores the fingerprint of an input file and any extra details (e.g. row counts) in a manifest section.
+    """
+    manifest[section][str(key)] = dict(file_fingerprint(path), path=os.path.basename(path), **details)
+    return manifest
+
+
+def find_changed_games(old_entry, new_entry):
+    """
+    Compares the games of two manifest entries of a tracking week.
+    Returns:
+        Sorted list of gameIds that were added, removed or whose rows changed
+    """
+    old_games = (old_entry or {}).get('games', {})
+    new_games = (new_entry or {}).get('games', {})
+    return sorted(int(game_id) for game_id in set(old_games) | set(new_games)
+                  if old_games.get(game_id) != new_games.get(game_id))
+
+
+def get_game_input_hash(week, game_id, manifest=None):
+    """
+    Returns the content hash of a game's tracking rows recorded at ingest, or None if the game has not been ingested.
+    Derived outputs (feature checkpoints, season arrays) store it to detect stale results.
+    """
+    manifest = read_manifest() if manifest is None else manifest
+    week_entry = manifest[TRACKING_WEEKS_SECTION].get(str(week), {})
+    return week_entry.get('games', {}).get(str(game_id), {}).get('hash')
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+NFL_FIELD_LENGTH = 120
+NFL_FIELD_WIDTH = 53.3
+
+
+def velocity_components(speed, direction):
+    """
+    Splits speed into x and y components from the direction of motion. Works on scalars or whole arrays.
+    Tracking angles are in degrees, clockwise from the +y axis, so 0 moves along +y and 90 along +x.
+    Args:
+        speed: Speed in yards/second (column 's')
+        direction: Direction of motion in degrees (column 'dir')
+    Returns:
+        Tuple of (dx, dy) arrays
+    """
+    radians = np.radians(direction)
+    return np.sin(radians) * speed, np.cos(radians) * speed
+
+
+def acceleration_components(acceleration, direction):
+    """
+    Splits acceleration into x and y components along the direction of motion.
+    Args:
+        acceleration: Acceleration in yards/second^2 (column 'a')
+        direction: Direction of motion in degrees (column 'dir')
+    Returns:
+        Tuple of (ax, ay) arrays
+    """
+    return velocity_components(acceleration, direction)
+
+
+def orientation_vectors(orientation):
+    """
+    Returns the unit vectors of the players' orientation.
+    Args:
+        orientation: Orientation in degrees (column 'o')
+    Returns:
+        Tuple of (ox, oy) arrays
+    """
+    return velocity_components(1.0, orientation)
+
+
+def normalize_play_direction(x, y, direction, orientation, play_direction):
+    """
+    Flips plays moving left so every play moves left to right. Only rows whose play_direction is 'left' change.
+    Args:
+        x, y: Coordinates in yards
+        direction: Direction of motion in degrees
+        orientation: Orientation in degrees
+        play_direction: 'left' or 'right' for each row (column 'playDirection')
+    Returns:
+        Tuple of new (x, y, direction, orientation) arrays
+    """
+    is_left = np.asarray(play_direction) == 'left'
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    direction, orientation = np.asarray(direction, dtype=float), np.asarray(orientation, dtype=float)
+
+    return (np.where(is_left, NFL_FIELD_LENGTH - x, x),
+            np.where(is_left, NFL_FIELD_WIDTH - y, y),
+            np.where(is_left, (direction + 180) % 360, direction),
+            np.where(is_left, (orientation + 180) % 360, orientation))
+
+
+def rotate_field(x, y, direction, orientation):
+    """
+    Rotates coordinates and angles from the horizontal tracking field to the vertical field used by the plots.
+    Args:
+        x, y: Coordinates in yards
+        direction: Direction of motion in degrees
+        orientation: Orientation in degrees
+    Returns:
+        Tuple of new (x, y, direction, orientation) arrays
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    return (NFL_FIELD_WIDTH - y,
+            x,
+            (np.asarray(direction, dtype=float) - 90) % 360,
+            (np.asarray(orientation, dtype=float) - 90) % 360)
+
+
+def compute_kinematics(df):
+    """
+    Computes velocity, acceleration and orientation components for every row of a tracking DataFrame at once.
+    Can be used on a single play or a whole week.
+    Args:
+        df: Tracking DataFrame with 's', 'a', 'dir' and 'o' columns
+    Returns:
+        pandas.DataFrame: Only the new columns (vx, vy, ax, ay, ox, oy), indexed like df
+    """
+    direction = df['dir'].to_numpy(dtype=float)
+    vx, vy = velocity_components(df['s'].to_numpy(dtype=float), direction)
+    ax, ay = acceleration_components(df['a'].to_numpy(dtype=float), direction)
+    ox, oy = orientation_vectors(df['o'].to_numpy(dtype=float))
+
+    return pd.DataFrame({'vx': vx, 'vy': vy, 'ax': ax, 'ay': ay, 'ox': ox, 'oy': oy}, index=df.index)
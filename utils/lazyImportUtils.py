@@ -0,0 +1,35 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stands in for a module that is only imported the first time one of its attributes is used.
+    Lets the plotting utils be imported (e.g. by data only workers through wildcard imports) without paying for
+    matplotlib until something is drawn.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name):
+    """
+    Returns a LazyModule for name, e.g. plt = lazy_import('matplotlib.pyplot')
+    """
+    return LazyModule(name)
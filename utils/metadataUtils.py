@@ -0,0 +1,153 @@
+import pandas as pd
+import os
+from CastleDefense.utils.schemaUtils import read_overview_csv
+
+overview_data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'overview_data'))
+
+OVERVIEW_TABLES = {
+    'games': 'games.csv',
+    'plays': 'plays.csv',
+    'players': 'players.csv',
+    'tackles': 'tackles.csv',
+}
+
+
+class MetadataRepository:
+    """
+    Loads the overview_data tables once with the compact dtypes of schemaUtils and keeps key indexed lookups for games
+    (gameId), plays (gameId, playId), players (nflId) and tackles (gameId, playId).
+    Tables are read lazily on first use. Call invalidate() or reload() when the csv files change, or
+    refresh_if_changed() to reload only the tables whose files were modified.
+    """
+
+    def __init__(self, data_path=overview_data_path):
+        self.data_path = data_path
+        self._tables = {}
+        self._positions = {}
+        self._mtimes = {}
+
+    def _table_path(self, name):
+        return os.path.join(self.data_path, OVERVIEW_TABLES[name])
+
+    def _load_table(self, name):
+        path = self._table_path(name)
+        df = read_overview_csv(path, name)
+
+        if name == 'games':
+            positions = {game_id: i for i, game_id in enumerate(df['gameId'])}
+        elif name == 'plays':
+            positions = {key: i for i, key in enumerate(zip(df['gameId'], df['playId']))}
+        elif name == 'players':
+            positions = {nfl_id: i for i, nfl_id in enumerate(df['nflId'])}
+        else:
+            positions = {}
+            for i, key in enumerate(zip(df['gameId'], df['playId'])):
+                positions.setdefault(key, []).append(i)
+
+        self._tables[name] = df
+        self._positions[name] = positions
+        self._mtimes[name] = os.path.getmtime(path)
+
+    def _table(self, name):
+        if name not in self._tables:
+            self._load_table(name)
+        return self._tables[name], self._positions[name]
+
+    @property
+    def games(self):
+        return self._table('games')[0]
+
+    @property
+    def plays(self):
+        return self._table('plays')[0]
+
+    @property
+    def players(self):
+        return self._table('players')[0]
+
+    @property
+    def tackles(self):
+        return self._table('tackles')[0]
+
+    def get_game(self, game_id):
+        """
+        Returns a one row DataFrame for the game, or an empty DataFrame if the game is unknown.
+        """
+        games_df, positions = self._table('games')
+        position = positions.get(int(game_id))
+        return games_df.iloc[[] if position is None else [position]]
+
+    def get_play(self, game_id, play_id):
+        """
+        Returns a one row DataFrame for the play, or an empty DataFrame if the play is unknown.
+        """
+        plays_df, positions = self._table('plays')
+        position = positions.get((int(game_id), int(play_id)))
+        return plays_df.iloc[[] if position is None else [position]]
+
+    def get_players(self, player_ids):
+        """
+        Returns a DataFrame with a row for each known player id. Unknown and missing (NaN) ids are skipped.
+        """
+        players_df, positions = self._table('players')
+        player_positions = sorted({positions[int(nfl_id)] for nfl_id in player_ids
+                                   if not pd.isna(nfl_id) and int(nfl_id) in positions})
+        return players_df.iloc[player_positions]
+
+    def get_tackles(self, game_id, play_id):
+        """
+        Returns the tackles.csv rows for a play.
+        """
+        tackles_df, positions = self._table('tackles')
+        return tackles_df.iloc[positions.get((int(game_id), int(play_id)), [])]
+
+    def invalidate(self, names=None):
+        """
+        Drops cached tables so they are re-read from disk on next use.
+        Args:
+            names: Table names to drop. Default is every table
+        """
+        for name in (OVERVIEW_TABLES if names is None else names):
+            self._tables.pop(name, None)
+            self._positions.pop(name, None)
+            self._mtimes.pop(name, None)
+
+    def reload(self, names=None):
+        """
+        Immediately re-reads tables from disk.
+        Args:
+            names: Table names to reload. Default is every table
+        """
+        for name in (OVERVIEW_TABLES if names is None else names):
+            self._load_table(name)
+
+    def refresh_if_changed(self):
+        """
+        Invalidates every loaded table whose csv file was modified since it was read.
+        Returns: List of invalidated table names
+        """
+        changed = [name for name, mtime in self._mtimes.items() if os.path.getmtime(self._table_path(name)) != mtime]
+        self.invalidate(changed)
+        return changed
+
+
+_metadata_repository = None
+
+
+def get_metadata_repository():
+    """
+    Returns the process wide MetadataRepository shared by all loaders.
+    """
+    global _metadata_repository
+    if _metadata_repository is None:
+        _metadata_repository = MetadataRepository()
+    return _metadata_repository
+
+
+def invalidate_metadata(names=None):
+    """
+    Drops the cached overview tables of the process wide repository. Use when the overview_data files change.
+    Args:
+        names: Table names to drop ('games', 'plays', 'players', 'tackles'). Default is every table
+    """
+    get_metadata_repository().invalidate(names)
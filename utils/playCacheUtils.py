@@ -0,0 +1,228 @@
+import os
+import pickle
+from collections import OrderedDict
+from CastleDefense.utils.extractPlayDataUtils import load_play, get_play_by_id, get_los_details, \
+    assign_player_display_identifier
+from CastleDefense.utils.ingestManifestUtils import read_manifest, get_game_input_hash
+from CastleDefense.utils.profilingUtils import timed_stage
+
+play_cache_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'output', 'play_cache'))
+
+DEFAULT_MAX_PLAYS = 32
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2
+
+
+class PreparedPlay:
+    """
+    A play ready to be plotted or animated: the offense, defense and football DataFrames from load_play() with their
+    playerDisplayIdentifier assigned, the play's plays.csv row and its line of scrimmage details.
+    """
+
+    def __init__(self, offense, defense, football, play, line_of_scrimmage, yards_to_go):
+        self.offense = offense
+        self.defense = defense
+        self.football = football
+        self.play = play
+        self.line_of_scrimmage = line_of_scrimmage
+        self.yards_to_go = yards_to_go
+
+    @property
+    def nbytes(self):
+        return int(sum(df.memory_usage(deep=True).sum() for df in [self.offense, self.defense, self.football, self.play]))
+
+    def copy(self):
+        """
+        Returns a copy whose DataFrames can be modified without changing the cached play.
+        """
+        return PreparedPlay(self.offense.copy(), self.defense.copy(), self.football.copy(), self.play.copy(),
+                            self.line_of_scrimmage, self.yards_to_go)
+
+
+def prepare_play(playId, gameId, week, display_position=False):
+    """
+    Loads a play and runs the preparation shared by the plotting and animation entry points.
+    Args:
+        playId:
+        gameId:
+        week:
+        display_position: Identifies players by position instead of jersey number
+    Returns:
+        PreparedPlay
+    """
+    offense, defense, football = load_play(playId, gameId, week)
+    play = get_play_by_id(gameId, playId)
+    line_of_scrimmage, yards_to_go = get_los_details(play, offense)
+    offense, defense = assign_player_display_identifier(offense, defense, display_position=display_position)
+    return PreparedPlay(offense, defense, football, play, line_of_scrimmage, yards_to_go)
+
+
+def make_play_cache_key(gameId, playId, week, **options):
+    """
+    Returns the cache key of a prepared play: (gameId, playId, week, sorted options).
+    """
+    return int(gameId), int(playId), int(week), tuple(sorted(options.items()))
+
+
+class PlayCache:
+    """
+    LRU cache of prepared plays, bounded by a number of plays and by the memory used by their DataFrames.
+    With a disk_path, every prepared play is also pickled there and evicted plays are read back from disk instead of
+    being loaded again. Disk entries store the game's content hash from the ingestion manifest and are ignored once the
+    game's tracking data changes.
+    """
+
+    def __init__(self, max_plays=DEFAULT_MAX_PLAYS, max_bytes=DEFAULT_MAX_BYTES, disk_path=None):
+        self.max_plays = max_plays
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self._entries = OrderedDict()  # Key: cache key, Value: (PreparedPlay, nbytes)
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _disk_file(self, key):
+        gameId, playId, week, options = key
+        options_name = '_'.join(f'{name}-{value}' for name, value in options)
+        return os.path.join(self.disk_path, f'{gameId}_{playId}_week{week}' + (f'_{options_name}' if options else '') +
+                            '.pkl')
+
+    def _read_disk(self, key):
+        if self.disk_path is None or not os.path.exists(self._disk_file(key)):
+            return None
+        with open(self._disk_file(key), 'rb') as cache_file:
+            entry = pickle.load(cache_file)
+        gameId, _, week, _ = key
+        if entry['input_hash'] != get_game_input_hash(week, gameId, read_manifest()):
+            return None
+        return entry['prepared']
+
+    def _write_disk(self, key, prepared):
+        gameId, _, week, _ = key
+        os.makedirs(self.disk_path, exist_ok=True)
+        path = self._disk_file(key)
+        with open(path + '.tmp', 'wb') as cache_file:
+            pickle.dump({'input_hash': get_game_input_hash(week, gameId, read_manifest()), 'prepared': prepared},
+                        cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_plays or self.bytes > self.max_bytes):
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.bytes -= nbytes
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        Returns the cached PreparedPlay of a key, from memory or from disk, or None. Do not modify it, use copy().
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        prepared = self._read_disk(key)
+        if prepared is not None:
+            self.disk_hits += 1
+            self._add(key, prepared)
+            return prepared
+
+        self.misses += 1
+        return None
+
+    def _add(self, key, prepared):
+        nbytes = prepared.nbytes
+        if nbytes > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (prepared, nbytes)
+        self.bytes += nbytes
+        self._evict()
+
+    def put(self, key, prepared):
+        self._add(key, prepared)
+        if self.disk_path is not None:
+            self._write_disk(key, prepared)
+
+    def invalidate(self, weeks=None):
+        """
+        Drops the plays of some weeks from memory, or every play. Disk entries are checked against the manifest on read.
+        """
+        for key in [key for key in self._entries if weeks is None or key[2] in weeks]:
+            self.bytes -= self._entries.pop(key)[1]
+
+    def get_stats(self):
+        return {'plays': len(self._entries), 'bytes': self.bytes, 'max_plays': self.max_plays,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+
+_play_cache = None
+
+
+def get_play_cache():
+    """
+    Returns the process wide PlayCache shared by the plotting and animation entry points.
+    """
+    global _play_cache
+    if _play_cache is None:
+        _play_cache = PlayCache()
+    return _play_cache
+
+
+def configure_play_cache(max_plays=DEFAULT_MAX_PLAYS, max_bytes=DEFAULT_MAX_BYTES, disk_path=None):
+    """
+    Replaces the process wide PlayCache, e.g. configure_play_cache(disk_path=play_cache_path) to keep prepared plays
+    across sessions.
+    """
+    global _play_cache
+    _play_cache = PlayCache(max_plays=max_plays, max_bytes=max_bytes, disk_path=disk_path)
+    return _play_cache
+
+
+def invalidate_play_cache(weeks=None):
+    """
+    Drops cached plays of some weeks, or every cached play, from the process wide PlayCache.
+    """
+    if _play_cache is not None:
+        _play_cache.invalidate(weeks)
+
+
+@timed_stage()
+def load_prepared_play(playId, gameId, week, display_position=False, use_cache=True):
+    """
+    Returns a play prepared for plotting, served from the process wide PlayCache when it was already prepared with the
+    same options.
+    Args:
+        playId:
+        gameId:
+        week:
+        display_position: Identifies players by position instead of jersey number
+        use_cache: Set to False to always load the play again
+    Returns:
+        PreparedPlay, a copy that callers may modify
+    """
+    if not use_cache:
+        return prepare_play(playId, gameId, week, display_position=display_position)
+
+    cache = get_play_cache()
+    key = make_play_cache_key(gameId, playId, week, display_position=bool(display_position))
+    prepared = cache.get(key)
+    if prepared is None:
+        prepared = prepare_play(playId, gameId, week, display_position=display_position)
+        cache.put(key, prepared)
+    return prepared.copy()
+
+
+# configure_play_cache(max_plays=64, disk_path=play_cache_path)
+# prepared = load_prepared_play(343, 2022090800, 1)
+# print(get_play_cache().get_stats())
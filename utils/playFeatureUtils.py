@@ -0,0 +1,242 @@
+import numpy as np
+import pandas as pd
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from CastleDefense.utils.extractPlayDataUtils import load_play_data, load_teams_from_play, get_play_by_id, \
+    get_los_details, get_blocking_players
+from CastleDefense.utils.playTensorUtils import build_play_tensor, build_blocker_index
+from CastleDefense.utils.playTimelineUtils import get_zoom_event_frames
+from CastleDefense.utils.trackingStoreUtils import preload_tracking_week, release_preloaded_weeks, \
+    get_tracking_week_csv_path, is_week_preloaded, has_stored_game
+from CastleDefense.utils.batchAnimateUtils import output_path, select_play_keys
+from CastleDefense.utils.ingestManifestUtils import read_manifest, get_game_input_hash
+
+play_features_path = os.path.join(output_path, 'play_features')
+
+# Defender distances to the ball carrier are measured at the first frame of each of these events
+DEFENDER_DISTANCE_EVENTS = ['handoff', 'pass_arrived', 'tackle']
+DEFENDER_RADIUS = 5
+
+# Events that end the ball carrier's run, for the distance gained after contact
+PLAY_END_EVENTS = ['tackle', 'out_of_bounds', 'touchdown', 'fumble', 'qb_slide', 'safety']
+
+FEATURE_EVENTS = ['ball_snap', 'first_contact'] + DEFENDER_DISTANCE_EVENTS + PLAY_END_EVENTS
+
+
+def _frame_rows(team_df, frame_id):
+    return team_df[team_df['frameId'] == frame_id]
+
+
+def extract_play_features(play_df, play, gameId):
+    """
+    Computes the features of one play. Plays are normalized to move left to right on the horizontal field, so x is
+    the downfield position and y the lateral position.
+    Args:
+        play_df: Tracking data of the play, from load_play_data()
+        play: plays.csv row of the play, from get_play_by_id()
+        gameId: Game identifier
+    Returns:
+        Dictionary of feature name to value. Features of events missing from the play are NaN
+    """
+    offense, defense, football = load_teams_from_play(play_df, play, gameId, vertical_field=False, left_to_right=True)
+    # get_los_details() flips yards to go with the play direction, the features are already normalized left to right.
+    # Its line of scrimmage is in yards from the left goal line of the raw frame, so it is mirrored like x
+    los, _ = get_los_details(play, play_df)
+    if play_df['playDirection'].iloc[0] == 'left':
+        los = 100 - los
+    event_frames = dict(get_zoom_event_frames(play_df['frameId'], play_df['event'], zoomable_events=FEATURE_EVENTS))
+
+    ball_carrier_id = int(play['ballCarrierId'].iloc[0])
+    ball_carrier = offense[offense['nflId'] == ball_carrier_id]
+
+    features = {
+        'line_of_scrimmage': los,
+        'yards_to_go': play['yardsToGo'].iloc[0],
+        'n_frames': play_df['frameId'].nunique(),
+        'max_ball_carrier_speed': ball_carrier['s'].max() if len(ball_carrier) else np.nan,
+    }
+
+    # Distances from the ball carrier to every defender at each event
+    for event in DEFENDER_DISTANCE_EVENTS:
+        distances = np.array([])
+        if event in event_frames:
+            carrier_xy = _frame_rows(ball_carrier, event_frames[event])[['x', 'y']].to_numpy(dtype=float)
+            defender_xy = _frame_rows(defense, event_frames[event])[['x', 'y']].to_numpy(dtype=float)
+            if len(carrier_xy):
+                distances = np.hypot(*(defender_xy - carrier_xy[0]).T)
+
+        features['closest_defender_' + event] = distances.min() if len(distances) else np.nan
+        features['defenders_within_' + str(DEFENDER_RADIUS) + '_' + event] = \
+            (distances <= DEFENDER_RADIUS).sum() if len(distances) else np.nan
+
+    # Lateral spacing between adjacent blockers at the snap, or the first frame when the snap is missing
+    blocker_ids = get_blocking_players(offense)['nflId'].unique()
+    blocker_index = build_blocker_index(build_play_tensor(offense), blocker_ids, lateral_axis=1)
+    snap_frame = event_frames.get('ball_snap', offense['frameId'].min())
+    snap_segments = blocker_index.segments_at(snap_frame)
+    gaps = np.abs(snap_segments[:, 1, 1] - snap_segments[:, 0, 1])
+    features['blocker_count'] = _frame_rows(offense, snap_frame)['nflId'].isin(blocker_ids).sum()
+    features['blocker_spacing_mean'] = gaps.mean() if len(gaps) else np.nan
+    features['blocker_spacing_max'] = gaps.max() if len(gaps) else np.nan
+
+    # Downfield distance gained by the ball carrier between first contact and the end of the run
+    features['yards_after_contact'] = np.nan
+    if 'first_contact' in event_frames and len(ball_carrier):
+        end_frames = [event_frames[event] for event in PLAY_END_EVENTS if event in event_frames]
+        end_frame = min(end_frames) if end_frames else ball_carrier['frameId'].max()
+        contact_x = _frame_rows(ball_carrier, event_frames['first_contact'])['x']
+        end_x = _frame_rows(ball_carrier, end_frame)['x']
+        if len(contact_x) and len(end_x):
+            features['yards_after_contact'] = end_x.iloc[0] - contact_x.iloc[0]
+
+    return features
+
+
+def extract_game_features(gameId, week, playIds):
+    """
+    Extracts the features of the plays of one game. Errors are reported per play and do not stop the game.
+    Returns:
+        pandas.DataFrame: One row per play with gameId, playId, week, the features and the error traceback of failed
+        plays
+    """
+    feature_rows = []
+    for playId in playIds:
+        feature_row = {'gameId': gameId, 'playId': playId, 'week': week}
+        try:
+            play_df = load_play_data(playId, gameId, week)
+            if play_df.empty:
+                raise ValueError(f'No tracking data for Game # {gameId} Play # {playId} in week {week}')
+            feature_row.update(extract_play_features(play_df, get_play_by_id(gameId, playId), gameId))
+            feature_row['error'] = ''
+        except Exception:
+            feature_row['error'] = traceback.format_exc()
+        feature_rows.append(feature_row)
+
+    return pd.DataFrame(feature_rows)
+
+
+def get_feature_checkpoint_path(output_dir, gameId):
+    """
+    Returns the path of a game's checkpoint: <output_dir>/parts/game_<gameId>.pkl
+    """
+    return os.path.join(output_dir, 'parts', 'game_' + str(gameId) + '.pkl')
+
+
+def _is_checkpoint_complete(checkpoint_path, playIds, input_hash):
+    """
+    True when the checkpoint exists, has a row for every requested play of the game and was extracted from the game's
+    current tracking rows (see ingestManifestUtils).
+    """
+    if not os.path.exists(checkpoint_path):
+        return False
+    features_df = pd.read_pickle(checkpoint_path)
+    return features_df.attrs.get('input_hash') == input_hash and set(playIds) <= set(features_df['playId'])
+
+
+def _extract_game_checkpoint(gameId, week, playIds, checkpoint_path, input_hash):
+    """
+    Runs in a worker process. Games in the tracking store are read play by play from their partitions. Otherwise only the
+    game's week is kept in memory, so each worker reads a week's csv once while it processes that week's games. The
+    game's features are then written to its checkpoint file.
+    """
+    if not has_stored_game(gameId, week) and os.path.exists(get_tracking_week_csv_path(week)) \
+            and not is_week_preloaded(week):
+        release_preloaded_weeks()
+        preload_tracking_week(week)
+
+    start = time.perf_counter()
+    features_df = extract_game_features(gameId, week, playIds)
+    features_df.attrs['input_hash'] = input_hash
+
+    # Written to a temporary file first so an interrupted run never leaves a partial checkpoint
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    features_df.to_pickle(checkpoint_path + '.tmp')
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+    return gameId, len(features_df), (features_df['error'] != '').sum(), time.perf_counter() - start
+
+
+def write_feature_table(features_df, path):
+    """
+    Writes the features to a columnar file. '.parquet' paths use DataFrame.to_parquet (needs pyarrow or fastparquet),
+    any other path is written as a numpy .npz archive with one array per column.
+    """
+    if path.endswith('.parquet'):
+        features_df.to_parquet(path, index=False)
+    else:
+        np.savez(path, **{column: features_df[column].to_numpy() if pd.api.types.is_numeric_dtype(features_df[column])
+                          else features_df[column].astype(str).to_numpy(dtype=str) for column in features_df.columns})
+
+
+def read_feature_table(path, columns=None):
+    """
+    Reads a file written by write_feature_table(). Only the requested columns are read.
+    Args:
+        path: '.parquet' or '.npz' path
+        columns: Columns to read. Default is every column
+    """
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+
+    with np.load(path) as feature_arrays:
+        return pd.DataFrame({column: feature_arrays[column] for column in (columns or feature_arrays.files)})
+
+
+def extract_season_features(play_keys=None, output_dir=play_features_path, output_file='play_features.npz',
+                            max_workers=None, resume=True, verbose=True):
+    """
+    Extracts the features of many plays with a process pool, one game per task. Each finished game is checkpointed to
+    <output_dir>/parts, and resumed runs skip games that already have a checkpoint. The checkpoints are finally combined
+    into one columnar feature table, restricted to the requested plays.
+    Args:
+        play_keys: List of (gameId, playId, week) tuples. Default is every play of plays.csv (see select_play_keys)
+        output_dir: Directory of the checkpoints and the feature table
+        output_file: File name of the feature table, '.npz' or '.parquet'
+        max_workers: Number of worker processes. Default is the number of cores
+        resume: Skips games whose checkpoint already has every requested play and whose tracking rows did not change
+            since. False extracts every game again
+        verbose: Prints one line per finished game
+    Returns:
+        pandas.DataFrame: One row per play with its features
+    """
+    if play_keys is None:
+        play_keys = select_play_keys()
+
+    game_plays = {}
+    for gameId, playId, week in play_keys:
+        game_plays.setdefault((int(week), int(gameId)), []).append(int(playId))
+
+    # Games are submitted week by week so workers switch weeks as rarely as possible
+    manifest = read_manifest()
+    pending_games = []
+    for (week, gameId), playIds in sorted(game_plays.items()):
+        checkpoint_path = get_feature_checkpoint_path(output_dir, gameId)
+        input_hash = get_game_input_hash(week, gameId, manifest)
+        if not (resume and _is_checkpoint_complete(checkpoint_path, playIds, input_hash)):
+            pending_games.append((gameId, week, playIds, checkpoint_path, input_hash))
+
+    if verbose:
+        print(f'Extracting features of {len(pending_games)}/{len(game_plays)} games')
+
+    if pending_games:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_extract_game_checkpoint, *pending_game) for pending_game in pending_games]
+            for future in as_completed(futures):
+                gameId, n_plays, n_failed, seconds = future.result()
+                if verbose:
+                    print(f'Game # {gameId}: {n_plays - n_failed}/{n_plays} plays ({seconds:.1f}s)')
+
+    features_df = pd.concat([pd.read_pickle(get_feature_checkpoint_path(output_dir, gameId))
+                             for _, gameId in sorted(game_plays)], ignore_index=True)
+    requested_keys = pd.DataFrame(play_keys, columns=['gameId', 'playId', 'week'])
+    features_df = features_df.merge(requested_keys, on=['gameId', 'playId', 'week'], how='inner')
+    features_df = features_df.sort_values(by=['week', 'gameId', 'playId']).reset_index(drop=True)
+
+    write_feature_table(features_df, os.path.join(output_dir, output_file))
+    return features_df
+
+
+# features_df = extract_season_features(select_play_keys(week=1))
+# read_feature_table(os.path.join(play_features_path, 'play_features.npz'), columns=['gameId', 'playId', 'yards_after_contact'])
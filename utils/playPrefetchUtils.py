@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from CastleDefense.utils.metadataUtils import get_metadata_repository
+from CastleDefense.utils.playCacheUtils import prepare_play, get_play_cache, make_play_cache_key
+
+DEFAULT_PREFETCH_DEPTH = 3
+
+BROWSE_ORDERS = ['game', 'drive']
+
+
+def get_game_play_keys(gameId, week=None):
+    """
+    Returns the (gameId, playId, week) keys of every play of a game in playId order.
+    Args:
+        gameId:
+        week: Week of the game. Default is looked up in games.csv
+    """
+    repository = get_metadata_repository()
+    week = int(repository.get_game(gameId)['week'].iloc[0]) if week is None else int(week)
+    plays_df = repository.plays[repository.plays['gameId'] == int(gameId)].sort_values(by='playId')
+    return [(int(gameId), int(playId), week) for playId in plays_df['playId']]
+
+
+def get_browse_order(gameId, playId, week=None, order='game'):
+    """
+    Returns the plays to step through from a play, starting with the play itself.
+    Args:
+        gameId:
+        playId:
+        week: Week of the game. Default is looked up in games.csv
+        order: 'game' for every following play of the game, 'drive' for the following plays of the same possession.
+            plays.csv has no drive id, so a drive is the run of consecutive plays with the same possessionTeam
+    Returns:
+        List of (gameId, playId, week) keys
+    """
+    if order not in BROWSE_ORDERS:
+        raise ValueError(f'Unknown browse order {order!r}. Use one of {BROWSE_ORDERS} or pass the keys directly')
+
+    play_keys = get_game_play_keys(gameId, week)
+    play_ids = [key[1] for key in play_keys]
+    position = play_ids.index(int(playId))
+    play_keys = play_keys[position:]
+
+    if order == 'drive':
+        repository = get_metadata_repository()
+        possession_teams = [repository.get_play(gameId, key[1])['possessionTeam'].iloc[0] for key in play_keys]
+        drive_length = next((i for i, team in enumerate(possession_teams) if team != possession_teams[0]),
+                            len(possession_teams))
+        play_keys = play_keys[:drive_length]
+
+    return play_keys
+
+
+class PlayPrefetcher:
+    """
+    Steps through a list of plays while the next plays are loaded and prepared (see playCacheUtils.prepare_play) by
+    background threads, so moving to the next play does not wait on load_play.
+    Only the `depth` plays after the current one are queued. Moving elsewhere cancels the queued plays that left that
+    window. Plays handed out are stored in the process wide play cache, so animate_func_play and plot_play_events called
+    on them next do not load them again.
+    Example, in a notebook:
+        prefetcher = PlayPrefetcher(get_browse_order(2022090800, 56, order='drive'))
+        key, prepared = prefetcher.next()  # First play, the next 3 are loaded meanwhile
+        animate_func_play(key[1], key[0], key[2], show_animation=False)
+    """
+
+    def __init__(self, play_keys, depth=DEFAULT_PREFETCH_DEPTH, display_position=False, max_workers=1):
+        """
+        Args:
+            play_keys: Ordered (gameId, playId, week) keys, e.g. from get_browse_order(), select_play_keys() or a filter
+            depth: Number of plays loaded ahead of the current one
+            display_position: Identifies players by position instead of jersey number
+            max_workers: Number of loading threads
+        """
+        self.play_keys = [tuple(int(value) for value in key) for key in play_keys]
+        self.depth = depth
+        self.display_position = display_position
+        self.position = -1
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='play-prefetch')
+        self._futures = OrderedDict()  # Key: (gameId, playId, week), Value: Future of a PreparedPlay
+        self.ready_hits = 0  # Plays already prepared when requested
+        self.waits = 0  # Plays still loading when requested
+        self.misses = 0  # Plays that were not prefetched
+        self.cancelled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def __len__(self):
+        return len(self.play_keys)
+
+    @property
+    def current_key(self):
+        return self.play_keys[self.position] if 0 <= self.position < len(self.play_keys) else None
+
+    def _cache_key(self, key):
+        gameId, playId, week = key
+        return make_play_cache_key(gameId, playId, week, display_position=bool(self.display_position))
+
+    def _schedule(self):
+        """
+        Queues the plays of the window after the current position and cancels queued plays outside of it. The current
+        play keeps its prefetch.
+        """
+        window = self.play_keys[self.position:self.position + 1 + self.depth]
+        for key in [key for key in self._futures if key not in window]:
+            if self._futures.pop(key).cancel():
+                self.cancelled += 1
+
+        cache = get_play_cache()
+        for key in window[1:]:
+            if key not in self._futures and self._cache_key(key) not in cache:
+                gameId, playId, week = key
+                self._futures[key] = self._executor.submit(prepare_play, playId, gameId, week, self.display_position)
+
+    def _take(self, key):
+        """
+        Returns the prepared play of a key from the play cache, its prefetch, or by loading it now.
+        """
+        cache = get_play_cache()
+        prepared = cache.get(self._cache_key(key))
+        if prepared is not None:
+            self.ready_hits += 1
+            return prepared.copy()
+
+        future = self._futures.pop(key, None)
+        if future is not None:
+            if future.done():
+                self.ready_hits += 1
+            else:
+                self.waits += 1
+            try:
+                prepared = future.result()
+            except CancelledError:
+                prepared = None
+        if prepared is None:
+            self.misses += 1
+            gameId, playId, week = key
+            prepared = prepare_play(playId, gameId, week, display_position=self.display_position)
+
+        cache.put(self._cache_key(key), prepared)
+        return prepared.copy()
+
+    def move_to(self, position):
+        """
+        Moves to a play, by its position in play_keys or its (gameId, playId, week) key, and prefetches the next plays.
+        Returns:
+            ((gameId, playId, week), PreparedPlay)
+        """
+        if isinstance(position, tuple):
+            position = self.play_keys.index(tuple(int(value) for value in position))
+        if not 0 <= position < len(self.play_keys):
+            raise IndexError(f'Play position {position} outside of the {len(self.play_keys)} plays')
+
+        self.position = position
+        key = self.play_keys[position]
+        self._schedule()  # Queue the next plays before waiting on the current one
+        return key, self._take(key)
+
+    def next(self):
+        """
+        Moves to the next play. Raises IndexError after the last play.
+        """
+        return self.move_to(self.position + 1)
+
+    def previous(self):
+        """
+        Moves to the previous play. Raises IndexError before the first play.
+        """
+        return self.move_to(self.position - 1)
+
+    def cancel(self):
+        """
+        Cancels every queued prefetch. Plays already loading finish in the background and are discarded.
+        """
+        for future in self._futures.values():
+            if future.cancel():
+                self.cancelled += 1
+        self._futures.clear()
+
+    def close(self):
+        """
+        Cancels the queued prefetches and stops the loading threads.
+        """
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self):
+        return {'position': self.position, 'plays': len(self.play_keys), 'queued': len(self._futures),
+                'ready_hits': self.ready_hits, 'waits': self.waits, 'misses': self.misses, 'cancelled': self.cancelled}
+
+
+# with PlayPrefetcher(get_browse_order(2022090800, 343, order='game')) as prefetcher:
+#     (gameId, playId, week), prepared = prefetcher.next()
+#     plot_play_events(playId, gameId, week)
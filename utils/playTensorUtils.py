@@ -0,0 +1,144 @@
+import numpy as np
+
+TENSOR_FEATURES = ['x', 'y', 's', 'dir', 'o']
+
+
+class PlayTensor:
+    """
+    Compact frame indexed representation of one team (or the football) for a play.
+    Built once per play so the animation can index player coordinates by frame instead of querying a DataFrame.
+
+    Attributes:
+        frame_ids: (frames,) sorted frameIds
+        nfl_ids: (players,) player ids in column order. The football uses -1
+        features: (frames, players, len(TENSOR_FEATURES)) float array, NaN where a player is missing from a frame
+        labels: (players,) display identifier of each player
+        club: Team abbreviation or 'football'
+        play_direction: 'left' or 'right'
+    """
+
+    def __init__(self, frame_ids, nfl_ids, features, labels, club=None, play_direction=None):
+        self.frame_ids = frame_ids
+        self.nfl_ids = nfl_ids
+        self.features = features
+        self.labels = labels
+        self.club = club
+        self.play_direction = play_direction
+        self._frame_positions = {frame_id: i for i, frame_id in enumerate(frame_ids.tolist())}
+
+    @property
+    def n_frames(self):
+        return len(self.frame_ids)
+
+    @property
+    def n_players(self):
+        return len(self.nfl_ids)
+
+    def feature(self, name):
+        """
+        Returns a (frames, players) array for one feature, e.g. tensor.feature('x')
+        """
+        return self.features[:, :, TENSOR_FEATURES.index(name)]
+
+    def frame_position(self, frame_id):
+        """
+        Returns the row of the tensor for a frameId, or None if the frameId is not in the play
+        """
+        return self._frame_positions.get(int(frame_id))
+
+    def at_frame(self, frame_id):
+        """
+        Returns the (players, features) array at a frameId, restricted to players present in that frame, and their labels
+        """
+        position = self.frame_position(frame_id)
+        if position is None:
+            return np.empty((0, len(TENSOR_FEATURES))), self.labels[:0]
+
+        frame_features = self.features[position]
+        present = ~np.isnan(frame_features[:, 0])
+        return frame_features[present], self.labels[present]
+
+    def select_players(self, nfl_ids):
+        """
+        Returns a new PlayTensor with only the given players
+        """
+        columns = np.flatnonzero(np.isin(self.nfl_ids, np.asarray(nfl_ids, dtype=float)))
+        return PlayTensor(self.frame_ids, self.nfl_ids[columns], self.features[:, columns], self.labels[columns],
+                          club=self.club, play_direction=self.play_direction)
+
+
+def build_play_tensor(team_df, label_column='playerDisplayIdentifier'):
+    """
+    Builds a PlayTensor from a team (or football) DataFrame.
+    Args:
+        team_df: DataFrame for one team of a play, as returned by load_play
+        label_column: Column used for the player labels. Falls back to jerseyNumber when missing
+    Returns:
+        PlayTensor
+    """
+    frame_ids, frame_positions = np.unique(team_df['frameId'].to_numpy(dtype=np.int64), return_inverse=True)
+    nfl_ids, player_positions = np.unique(team_df['nflId'].fillna(-1).to_numpy(dtype=float), return_inverse=True)
+
+    features = np.full((len(frame_ids), len(nfl_ids), len(TENSOR_FEATURES)), np.nan)
+    features[frame_positions, player_positions] = team_df[TENSOR_FEATURES].to_numpy(dtype=float)
+
+    if label_column not in team_df.columns:
+        label_column = 'jerseyNumber'
+    labels = np.empty(len(nfl_ids), dtype=object)
+    labels[player_positions] = team_df[label_column].to_numpy()
+
+    club = team_df['club'].iloc[0] if len(team_df) else None
+    play_direction = team_df['playDirection'].iloc[0] if len(team_df) else None
+
+    return PlayTensor(frame_ids, nfl_ids, features, labels, club=club, play_direction=play_direction)
+
+
+class BlockerIndex:
+    """
+    Blocking players of a play with their coordinates at every frame, sorted by lateral position.
+    Built once per play so drawing the blocking formation is a single lookup per frame.
+
+    Attributes:
+        frame_ids: (frames,) sorted frameIds
+        nfl_ids: (frames, blockers) blocker ids in lateral order at each frame. Blockers missing from a frame come last
+        coordinates: (frames, blockers, 2) x and y of the blockers in lateral order, NaN where missing
+        segments: (frames, blockers - 1, 2, 2) line segments between laterally adjacent blockers
+        segment_counts: (frames,) number of valid segments at each frame
+    """
+
+    def __init__(self, frame_ids, nfl_ids, coordinates):
+        self.frame_ids = frame_ids
+        self.nfl_ids = nfl_ids
+        self.coordinates = coordinates
+        self.segments = np.stack([coordinates[:, :-1], coordinates[:, 1:]], axis=2)
+        self.segment_counts = np.maximum((~np.isnan(coordinates[:, :, 0])).sum(axis=1) - 1, 0)
+        self._frame_positions = {frame_id: i for i, frame_id in enumerate(frame_ids.tolist())}
+
+    def segments_at(self, frame_id):
+        """
+        Returns the (segments, 2, 2) line segments of the blocking formation at a frameId
+        """
+        position = self._frame_positions.get(int(frame_id))
+        if position is None:
+            return self.segments[:0, 0]
+        return self.segments[position, :self.segment_counts[position]]
+
+
+def build_blocker_index(team_tensor, blocker_ids, lateral_axis=0):
+    """
+    Builds the BlockerIndex of a play.
+    Args:
+        team_tensor: PlayTensor of the offense
+        blocker_ids: nflIds of the blocking players
+        lateral_axis: Coordinate across the field, 0 (x) on the vertical field used by the plots
+    Returns:
+        BlockerIndex
+    """
+    blockers = team_tensor.select_players(blocker_ids)
+    coordinates = blockers.features[:, :, :2]
+
+    # argsort places missing (NaN) blockers last in each frame
+    order = np.argsort(coordinates[:, :, lateral_axis], axis=1, kind='stable')
+    sorted_coordinates = np.take_along_axis(coordinates, order[:, :, None], axis=1)
+
+    return BlockerIndex(blockers.frame_ids, blockers.nfl_ids[order], sorted_coordinates)
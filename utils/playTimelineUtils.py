@@ -0,0 +1,138 @@
+import numpy as np
+
+ZOOMABLE_EVENTS = ['handoff', 'pass_arrived', 'tackle', 'touchdown']
+
+# Zoom out amount of each held frame. The first list starts the play, the second follows each zoomable event
+INITIAL_ZOOM_OUT_INCREASES = [45, 45, 45, 45, 39.5, 33.5, 28.0, 23.0, 18.5, 14.5, 11.0, 8.0, 5.5, 3.5, 2.0, 1.0, 0.5, 0.25, 0, 0]
+EVENT_ZOOM_OUT_INCREASES = [5, 10, 13, 14, 15, 15, 14, 13, 10, 5]
+
+
+class PlayTimeline:
+    """
+    Maps the output frames of an animation to the source frames of a play. Zoom effects hold a source frame for several
+    output frames while the view zooms out and back in, so the tracking data never has to be duplicated.
+
+    Attributes:
+        output_frame_ids: (output frames,) consecutive frameIds starting at the first source frameId
+        source_frame_ids: (output frames,) source frameId displayed at each output frame
+        zoom_out: (output frames,) window size increase of held frames, 0 otherwise
+        events: (output frames,) event name that caused the hold, None otherwise
+        is_hold: (output frames,) True for held frames
+    """
+
+    def __init__(self, source_frame_ids, zoom_out, events, is_hold):
+        self.source_frame_ids = source_frame_ids
+        self.zoom_out = zoom_out
+        self.events = events
+        self.is_hold = is_hold
+        first_frame_id = source_frame_ids[0] if len(source_frame_ids) else 0
+        self.output_frame_ids = first_frame_id + np.arange(len(source_frame_ids))
+
+    def __len__(self):
+        return len(self.source_frame_ids)
+
+    def source_frame(self, frameId):
+        """
+        Returns the source frameId displayed at an output frameId
+        """
+        return self.source_frame_ids[int(frameId) - self.output_frame_ids[0]]
+
+    @property
+    def event_frameIds(self):
+        """
+        Dictionary with the held output frameIds as the key and (zoom out amount, event name) as the value
+        """
+        return {int(frame_id): (zoom_out, event) for frame_id, zoom_out, event
+                in zip(self.output_frame_ids[self.is_hold], self.zoom_out[self.is_hold], self.events[self.is_hold])}
+
+
+def get_zoom_event_frames(frame_ids, events, zoomable_events=ZOOMABLE_EVENTS):
+    """
+    Returns the first frameId of each zoomable event in chronological order.
+    Args:
+        frame_ids: frameId of each tracking row
+        events: event of each tracking row
+        zoomable_events: Events that trigger a zoom effect
+    Returns:
+        List of (event, frameId) tuples
+    """
+    frame_ids = np.asarray(frame_ids)
+    events = np.asarray(events, dtype=object)
+
+    event_frames = []
+    for event in zoomable_events:
+        event_rows = events == event
+        if event_rows.any():
+            event_frames.append((event, int(frame_ids[event_rows].min())))
+    return sorted(event_frames, key=lambda event_frame: event_frame[1])
+
+
+def build_play_timeline(frame_ids, event_frames=(), initial_zoom=True):
+    """
+    Builds the timeline of a play with all zoom holds in one pass.
+    Args:
+        frame_ids: Source frameIds of the play. Duplicates are ignored
+        event_frames: (event, frameId) tuples to hold after, e.g. from get_zoom_event_frames()
+        initial_zoom: Holds the first frame to zoom in at the start of the play
+    Returns:
+        PlayTimeline
+    """
+    frame_ids = np.unique(np.asarray(frame_ids, dtype=np.int64))
+
+    holds = [(frame_ids[0], 'start', INITIAL_ZOOM_OUT_INCREASES)] if initial_zoom and len(frame_ids) else []
+    holds.extend((frame_id, event, EVENT_ZOOM_OUT_INCREASES) for event, frame_id in event_frames)
+
+    # Each source frame is shown once plus the number of frames it is held for
+    repeats = np.ones(len(frame_ids), dtype=np.int64)
+    for frame_id, _, zoom_out_increases in holds:
+        repeats[np.searchsorted(frame_ids, frame_id)] += len(zoom_out_increases)
+
+    source_frame_ids = np.repeat(frame_ids, repeats)
+    zoom_out = np.zeros(len(source_frame_ids))
+    events = np.full(len(source_frame_ids), None, dtype=object)
+    is_hold = np.zeros(len(source_frame_ids), dtype=bool)
+
+    # Held frames follow the first output frame of their source frame. Several holds on one frame are stacked
+    first_output_positions = np.concatenate([[0], np.cumsum(repeats)[:-1]])
+    next_hold_positions = {}
+    for frame_id, event, zoom_out_increases in holds:
+        source_position = np.searchsorted(frame_ids, frame_id)
+        start = next_hold_positions.get(source_position, first_output_positions[source_position] + 1)
+        stop = start + len(zoom_out_increases)
+        zoom_out[start:stop] = zoom_out_increases
+        events[start:stop] = event
+        is_hold[start:stop] = True
+        next_hold_positions[source_position] = stop
+
+    return PlayTimeline(source_frame_ids, zoom_out, events, is_hold)
+
+
+def apply_timeline(df, timeline):
+    """
+    Builds a DataFrame with the rows of each source frame repeated at every output frame of the timeline, with frameId
+    set to the output frameId. All rows are gathered with one positional take.
+    Args:
+        df: Tracking DataFrame of a team or football
+        timeline: PlayTimeline
+    Returns:
+        New DataFrame sorted by output frameId
+    """
+    frame_values = df['frameId'].to_numpy()
+    order = np.argsort(frame_values, kind='stable')
+    frames, first_rows, row_counts = np.unique(frame_values[order], return_index=True, return_counts=True)
+
+    if len(frames) == 0:
+        return df.iloc[[]].copy()
+
+    # Source frames missing from df contribute no rows
+    source_positions = np.searchsorted(frames, timeline.source_frame_ids).clip(max=len(frames) - 1)
+    present = frames[source_positions] == timeline.source_frame_ids
+    counts = np.where(present, row_counts[source_positions], 0)
+    starts = first_rows[source_positions]
+
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    rows = order[offsets + np.arange(counts.sum())]
+
+    timeline_df = df.iloc[rows].copy()
+    timeline_df['frameId'] = np.repeat(timeline.output_frame_ids, counts)
+    return timeline_df.reset_index(drop=True)
@@ -0,0 +1,187 @@
+import cProfile
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Profile collecting the stage timings, None when profiling is disabled. Set by profile_play()
+_active_profile = None
+
+
+class PlayProfile:
+    """
+    Timings and counters collected while rendering a play.
+    stages maps a stage name (e.g. 'load_play', 'animate_frameId', 'save_animation') to its number of calls and total
+    seconds. counters holds counts such as the number of frames and of artists drawn.
+    """
+
+    def __init__(self, label=None):
+        self.label = label
+        self.stages = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def add_time(self, stage, seconds):
+        calls, total = self.stages.get(stage, (0, 0.0))
+        self.stages[stage] = (calls + 1, total + seconds)
+
+    def add_count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def stop(self):
+        self.seconds = time.perf_counter() - self.start
+
+    def summary(self):
+        """
+        Returns:
+            Dictionary with the total seconds, the calls/seconds/share of every stage, the counters, frames per second
+            of the whole render and artists per frame
+        """
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.start
+        frames = self.counters.get('frames', 0)
+        return {
+            'label': self.label,
+            'seconds': seconds,
+            'stages': {stage: {'calls': calls, 'seconds': total, 'share': total / seconds if seconds else 0.0}
+                       for stage, (calls, total) in sorted(self.stages.items(), key=lambda item: -item[1][1])},
+            'counters': dict(self.counters),
+            'frames_per_second': frames / seconds if seconds and frames else None,
+            'artists_per_frame': self.counters.get('artists', 0) / frames if frames else None,
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as json_file:
+            json.dump(self.summary(), json_file, indent=1)
+        return path
+
+    def __repr__(self):
+        summary = self.summary()
+        stages = ', '.join(f"{stage}={stage_summary['seconds']:.3f}s"
+                           for stage, stage_summary in summary['stages'].items())
+        return f"PlayProfile({summary['label']!r}, {summary['seconds']:.3f}s: {stages})"
+
+
+class _StageTimer:
+    """
+    Context manager adding the time of its block to a stage of the active profile.
+    """
+    __slots__ = ('profile', 'stage', 'start')
+
+    def __init__(self, profile, stage):
+        self.profile = profile
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add_time(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    """
+    Context manager doing nothing, returned by stage_timer() when profiling is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def is_profiling():
+    return _active_profile is not None
+
+
+def stage_timer(stage):
+    """
+    Times a block as a stage of the active profile, e.g.
+        with stage_timer('draw'):
+            fig.canvas.draw()
+    Costs one global lookup when profiling is disabled.
+    """
+    if _active_profile is None:
+        return _NULL_TIMER
+    return _StageTimer(_active_profile, stage)
+
+
+def count(counter, n=1):
+    """
+    Adds n to a counter of the active profile, e.g. count('artists', len(patch)).
+    Does nothing when profiling is disabled.
+    """
+    if _active_profile is not None:
+        _active_profile.add_count(counter, n)
+
+
+def timed_stage(stage=None):
+    """
+    Decorator timing every call of a function as a stage of the active profile. The stage defaults to the function name.
+    When profiling is disabled, the wrapper only checks the active profile and calls the function.
+    """
+    def decorator(function):
+        stage_name = stage or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = _active_profile
+            if profile is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.add_time(stage_name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile_play(label=None, json_path=None, cprofile_path=None):
+    """
+    Enables profiling of the hot paths for the block, e.g.
+        with profile_play('2022090800_343', json_path='profile.json') as profile:
+            animate_func_play(343, 2022090800, 1, show_animation=False)
+        print(profile.summary()['stages'])
+    Args:
+        label: Name stored in the summary, e.g. the play
+        json_path: Optional path to write the timing summary to as json
+        cprofile_path: Optional path to write cProfile stats to, readable with pstats or snakeviz
+    Returns:
+        The PlayProfile collecting the timings
+    """
+    global _active_profile
+    profile = PlayProfile(label)
+    previous_profile = _active_profile
+    profiler = cProfile.Profile() if cprofile_path is not None else None
+
+    _active_profile = profile
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+        _active_profile = previous_profile
+
+    if json_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+        profile.write_json(json_path)
+
+
+# from CastleDefense.utils.animatePlayUtils import animate_func_play
+# with profile_play('2022090800_343', json_path='profile.json', cprofile_path='profile.prof') as profile:
+#     animate_func_play(343, 2022090800, 1, show_animation=False)
+# print(profile)
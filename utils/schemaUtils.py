@@ -0,0 +1,177 @@
+import pandas as pd
+
+# Compact per column dtypes for every csv of the competition data. Ids fit in int32, frameIds and yard values in int16,
+# tracking coordinates and angles need no more than float32 and repeated strings are stored as categories.
+# Nullable integer dtypes (Int32, Int8) keep missing values such as the football's nflId.
+
+TRACKING_DTYPES = {
+    'gameId': 'int32',
+    'playId': 'int32',
+    'nflId': 'Int32',
+    'displayName': 'category',
+    'frameId': 'int16',
+    'jerseyNumber': 'Int8',
+    'club': 'category',
+    'playDirection': 'category',
+    'x': 'float32',
+    'y': 'float32',
+    's': 'float32',
+    'a': 'float32',
+    'dis': 'float32',
+    'o': 'float32',
+    'dir': 'float32',
+    'event': 'category',
+}
+
+GAMES_DTYPES = {
+    'gameId': 'int32',
+    'season': 'int16',
+    'week': 'int8',
+    'gameDate': 'category',
+    'gameTimeEastern': 'category',
+    'homeTeamAbbr': 'category',
+    'visitorTeamAbbr': 'category',
+    'homeFinalScore': 'int16',
+    'visitorFinalScore': 'int16',
+}
+
+PLAYS_DTYPES = {
+    'gameId': 'int32',
+    'playId': 'int32',
+    'ballCarrierId': 'int32',
+    'ballCarrierDisplayName': 'category',
+    'quarter': 'int8',
+    'down': 'int8',
+    'yardsToGo': 'int16',
+    'possessionTeam': 'category',
+    'defensiveTeam': 'category',
+    'yardlineSide': 'category',
+    'yardlineNumber': 'int16',
+    'gameClock': 'category',
+    'preSnapHomeScore': 'int16',
+    'preSnapVisitorScore': 'int16',
+    'passResult': 'category',
+    'passLength': 'float32',
+    'penaltyYards': 'float32',
+    'prePenaltyPlayResult': 'int16',
+    'playResult': 'int16',
+    'playNullifiedByPenalty': 'category',
+    'absoluteYardlineNumber': 'int16',
+    'offenseFormation': 'category',
+    'defendersInTheBox': 'float32',
+    'passProbability': 'float32',
+    'preSnapHomeTeamWinProbability': 'float32',
+    'preSnapVisitorTeamWinProbability': 'float32',
+    'homeTeamWinProbabilityAdded': 'float32',
+    'visitorTeamWinProbilityAdded': 'float32',
+    'expectedPoints': 'float32',
+    'expectedPointsAdded': 'float32',
+    'foulName1': 'category',
+    'foulName2': 'category',
+    'foulNFLId1': 'Int32',
+    'foulNFLId2': 'Int32',
+}
+
+PLAYERS_DTYPES = {
+    'nflId': 'int32',
+    'height': 'category',
+    'weight': 'int16',
+    'collegeName': 'category',
+    'position': 'category',
+}
+
+TACKLES_DTYPES = {
+    'gameId': 'int32',
+    'playId': 'int32',
+    'nflId': 'int32',
+    'tackle': 'int8',
+    'assist': 'int8',
+    'forcedFumble': 'int8',
+    'pff_missedTackle': 'int8',
+}
+
+OVERVIEW_DTYPES = {
+    'games': GAMES_DTYPES,
+    'plays': PLAYS_DTYPES,
+    'players': PLAYERS_DTYPES,
+    'tackles': TACKLES_DTYPES,
+}
+
+
+def read_tracking_csv(path, **kwargs):
+    """
+    Reads a tracking csv with the compact TRACKING_DTYPES.
+    Args:
+        path: Path to a tracking_week_N.csv (or a part of one)
+        **kwargs: Forwarded to pandas.read_csv, e.g. chunksize
+    """
+    return pd.read_csv(path, dtype=TRACKING_DTYPES, **kwargs)
+
+
+def read_overview_csv(path, table):
+    """
+    Reads an overview_data csv with its compact dtypes.
+    Args:
+        path: Path to the csv
+        table: 'games', 'plays', 'players' or 'tackles'
+    """
+    return pd.read_csv(path, dtype=OVERVIEW_DTYPES[table])
+
+
+def restore_categoricals(df, dtypes=TRACKING_DTYPES):
+    """
+    Casts categorical columns back to category after concatenating chunks whose categories differ.
+    """
+    for column, dtype in dtypes.items():
+        if dtype == 'category' and column in df.columns and df[column].dtype.name != 'category':
+            df[column] = df[column].astype('category')
+    return df
+
+
+def memory_usage_report(tables):
+    """
+    Reports the in memory size of DataFrames, including the contents of string and categorical columns.
+    Args:
+        tables: Dictionary of name to DataFrame
+    Returns:
+        pandas.DataFrame: One row per table with its rows, columns, size in MB and bytes per row, plus a total row
+    """
+    report_rows = []
+    for name, df in tables.items():
+        memory_bytes = int(df.memory_usage(deep=True).sum())
+        report_rows.append({'table': name, 'rows': len(df), 'columns': len(df.columns),
+                            'memory_mb': memory_bytes / 1024 ** 2,
+                            'bytes_per_row': memory_bytes / len(df) if len(df) else 0.0})
+
+    report_df = pd.DataFrame(report_rows, columns=['table', 'rows', 'columns', 'memory_mb', 'bytes_per_row'])
+    total_rows = report_df['rows'].sum()
+    total_mb = report_df['memory_mb'].sum()
+    total_row = pd.DataFrame([{'table': 'total', 'rows': total_rows, 'columns': report_df['columns'].sum(),
+                               'memory_mb': total_mb,
+                               'bytes_per_row': total_mb * 1024 ** 2 / total_rows if total_rows else 0.0}])
+    return pd.concat([report_df, total_row], ignore_index=True)
+
+
+def column_memory_usage(df):
+    """
+    Reports the in memory size of each column of a DataFrame, largest first.
+    Returns:
+        pandas.DataFrame: One row per column with its dtype and size in MB
+    """
+    memory_bytes = df.memory_usage(deep=True, index=False)
+    return pd.DataFrame({'column': memory_bytes.index,
+                         'dtype': [str(df[column].dtype) for column in memory_bytes.index],
+                         'memory_mb': memory_bytes.to_numpy() / 1024 ** 2}).sort_values(by='memory_mb', ascending=False)
+
+
+def compare_tracking_memory_usage(path, nrows=None):
+    """
+    Compares the memory of a tracking csv read with inferred dtypes against TRACKING_DTYPES.
+    Args:
+        path: Path to a tracking_week_N.csv
+        nrows: Only read the first nrows rows
+    Returns:
+        pandas.DataFrame: memory_usage_report() of both reads
+    """
+    return memory_usage_report({'inferred': pd.read_csv(path, nrows=nrows),
+                                'compact': read_tracking_csv(path, nrows=nrows)}).iloc[:-1]
@@ -0,0 +1,272 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+from CastleDefense.utils.trackingStoreUtils import tracking_data_path, read_play_index_file, read_game_partition, \
+    build_tracking_store
+from CastleDefense.utils.ingestManifestUtils import read_manifest, get_game_input_hash
+
+season_arrays_path = os.path.join(tracking_data_path, 'season')
+
+# Numeric columns written as one raw binary file each. Missing ids are stored as -1
+SEASON_NUMERIC_COLUMNS = {
+    'gameId': 'int32',
+    'playId': 'int32',
+    'nflId': 'int32',
+    'frameId': 'int16',
+    'jerseyNumber': 'int8',
+    'x': 'float32',
+    'y': 'float32',
+    's': 'float32',
+    'a': 'float32',
+    'dis': 'float32',
+    'o': 'float32',
+    'dir': 'float32',
+}
+
+# Categorical columns written as int16 codes into the categories saved in meta.json. Missing values are -1
+SEASON_CATEGORICAL_COLUMNS = ['club', 'playDirection', 'event']
+
+PLAY_INDEX_DTYPE = np.dtype([('gameId', 'int32'), ('playId', 'int32'), ('week', 'int16'), ('start', 'int64'),
+                             ('stop', 'int64')])
+FRAME_INDEX_DTYPE = np.dtype([('gameId', 'int32'), ('playId', 'int32'), ('frameId', 'int16'), ('start', 'int64'),
+                              ('stop', 'int64')])
+
+
+def get_season_column_path(column, path=season_arrays_path):
+    return os.path.join(path, column + '.bin')
+
+
+def _encode_categories(values, categories):
+    """
+    Returns int16 codes of values into categories, appending unseen values to categories.
+    """
+    values = values.astype(object)
+    known = set(categories)
+    categories.extend(sorted(value for value in values.dropna().unique() if value not in known))
+    return pd.Categorical(values, categories=categories).codes.astype('int16')
+
+
+def _get_season_inputs(play_index_df):
+    """
+    Returns the content hash of every game in a play index, recorded in meta.json so stale arrays can be detected.
+    """
+    manifest = read_manifest()
+    return {str(week) + '/' + str(game_id): get_game_input_hash(week, game_id, manifest)
+            for week, game_id in play_index_df[['week', 'gameId']].drop_duplicates().itertuples(index=False)}
+
+
+def build_season_arrays(weeks=None, path=season_arrays_path):
+    """
+    Writes every tracking week into memory mappable arrays: one raw binary file per column, plus play and frame offset
+    tables sorted by (gameId, playId) and (gameId, playId, frameId). Games are read one at a time from the tracking
+    store, which is built first for weeks missing from it.
+    Args:
+        weeks: Weeks to include. Default is every week in the tracking store
+        path: Output directory
+    Returns:
+        Number of rows written
+    """
+    play_index_df = read_play_index_file()
+    if weeks is None and play_index_df.empty:
+        play_index_df = build_tracking_store()
+    elif weeks is not None:
+        missing_weeks = sorted(set(weeks) - set(play_index_df['week']))
+        if missing_weeks:
+            play_index_df = build_tracking_store(missing_weeks)
+        play_index_df = play_index_df[play_index_df['week'].isin(weeks)]
+
+    # Every file is written next to its final path and swapped in with os.replace() once complete. Processes that have
+    # the previous arrays memory mapped keep reading the old files instead of a truncated one
+    os.makedirs(path, exist_ok=True)
+    column_paths = {column: get_season_column_path(column, path)
+                    for column in list(SEASON_NUMERIC_COLUMNS) + SEASON_CATEGORICAL_COLUMNS}
+    output_paths = list(column_paths.values()) + [os.path.join(path, name)
+                                                  for name in ['play_index.npy', 'frame_index.npy', 'meta.json']]
+    column_files = {column: open(column_path + '.tmp', 'wb') for column, column_path in column_paths.items()}
+    categories = {column: [] for column in SEASON_CATEGORICAL_COLUMNS}
+    play_rows = []
+    frame_rows = []
+    n_rows = 0
+
+    try:
+        for (week, game_id), game_plays_df in play_index_df.groupby(['week', 'gameId'], sort=True):
+            game_df = read_game_partition(int(game_id), int(week))
+
+            for column, dtype in SEASON_NUMERIC_COLUMNS.items():
+                values = game_df[column]
+                if column in ['nflId', 'jerseyNumber']:
+                    values = values.astype('float64').fillna(-1)
+                values.to_numpy(dtype=dtype).tofile(column_files[column])
+            for column in SEASON_CATEGORICAL_COLUMNS:
+                _encode_categories(game_df[column], categories[column]).tofile(column_files[column])
+
+            for play_id, start, stop in game_plays_df[['playId', 'start', 'stop']].itertuples(index=False):
+                play_rows.append((game_id, play_id, week, n_rows + start, n_rows + stop))
+
+            # Rows of a play are sorted by frameId so each frame is one contiguous row range
+            play_ids = game_df['playId'].to_numpy()
+            frame_ids = game_df['frameId'].to_numpy()
+            is_new_frame = (play_ids[1:] != play_ids[:-1]) | (frame_ids[1:] != frame_ids[:-1])
+            frame_starts = np.flatnonzero(np.r_[True, is_new_frame])
+            frame_stops = np.r_[frame_starts[1:], len(frame_ids)]
+            frame_rows.extend(zip(np.full(len(frame_starts), game_id), play_ids[frame_starts], frame_ids[frame_starts],
+                                  n_rows + frame_starts, n_rows + frame_stops))
+
+            n_rows += len(game_df)
+
+        play_index = np.sort(np.array(play_rows, dtype=PLAY_INDEX_DTYPE), order=['gameId', 'playId'])
+        frame_index = np.sort(np.array(frame_rows, dtype=FRAME_INDEX_DTYPE), order=['gameId', 'playId', 'frameId'])
+        with open(os.path.join(path, 'play_index.npy.tmp'), 'wb') as index_file:
+            np.save(index_file, play_index)
+        with open(os.path.join(path, 'frame_index.npy.tmp'), 'wb') as index_file:
+            np.save(index_file, frame_index)
+
+        meta = {'n_rows': n_rows,
+                'columns': dict(SEASON_NUMERIC_COLUMNS, **{column: 'int16' for column in SEASON_CATEGORICAL_COLUMNS}),
+                'categories': categories,
+                'weeks': None if weeks is None else sorted(int(week) for week in weeks),
+                'inputs': _get_season_inputs(play_index_df)}
+        with open(os.path.join(path, 'meta.json.tmp'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+    except BaseException:
+        [column_file.close() for column_file in column_files.values()]
+        [os.remove(output_path + '.tmp') for output_path in output_paths if os.path.exists(output_path + '.tmp')]
+        raise
+
+    [column_file.close() for column_file in column_files.values()]
+    for output_path in output_paths:  # meta.json last, it describes the other files
+        os.replace(output_path + '.tmp', output_path)
+
+    return n_rows
+
+
+def update_season_arrays(path=season_arrays_path):
+    """
+    Rebuilds the season arrays only when the games they were built from changed in the tracking store (see
+    trackingStoreUtils.update_tracking_store), or when they have not been built yet.
+    Returns:
+        True if the arrays were rebuilt
+    """
+    global _season_arrays
+    meta_path = os.path.join(path, 'meta.json')
+    weeks = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        weeks = meta.get('weeks')
+
+        play_index_df = read_play_index_file()
+        if weeks is not None:
+            play_index_df = play_index_df[play_index_df['week'].isin(weeks)]
+        if _get_season_inputs(play_index_df) == meta.get('inputs'):
+            return False
+
+    build_season_arrays(weeks, path)
+    _season_arrays = None
+    return True
+
+
+class SeasonTrackingArrays:
+    """
+    Read only, memory mapped view of the season arrays written by build_season_arrays().
+    Every process opening the same files shares the operating system's page cache, and play lookups return zero copy
+    slices of the mapped columns.
+    """
+
+    def __init__(self, path=season_arrays_path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+
+        self.n_rows = meta['n_rows']
+        self.categories = meta['categories']
+        self.columns = {column: np.memmap(get_season_column_path(column, path), dtype=dtype, mode='r',
+                                          shape=(self.n_rows,))
+                        for column, dtype in meta['columns'].items()} if self.n_rows else {}
+
+        self.play_index = np.load(os.path.join(path, 'play_index.npy'), mmap_mode='r')
+        self.frame_index = np.load(os.path.join(path, 'frame_index.npy'), mmap_mode='r')
+        self._play_keys = self.play_index['gameId'].astype('int64') * 100000 + self.play_index['playId']
+        self._frame_keys = None
+
+    def play_rows(self, game_id, play_id):
+        """
+        Returns the row slice of a play, or None if the play is not in the arrays.
+        """
+        key = int(game_id) * 100000 + int(play_id)
+        position = np.searchsorted(self._play_keys, key)
+        if position == len(self._play_keys) or self._play_keys[position] != key:
+            return None
+        return slice(int(self.play_index['start'][position]), int(self.play_index['stop'][position]))
+
+    def frame_rows(self, game_id, play_id, frame_id):
+        """
+        Returns the row slice of one frame of a play, or None if the frame is not in the arrays.
+        """
+        if self._frame_keys is None:
+            self._frame_keys = (self.frame_index['gameId'].astype('int64') * 100000 + self.frame_index['playId']) \
+                * 10000 + self.frame_index['frameId']
+        key = (int(game_id) * 100000 + int(play_id)) * 10000 + int(frame_id)
+        position = np.searchsorted(self._frame_keys, key)
+        if position == len(self._frame_keys) or self._frame_keys[position] != key:
+            return None
+        return slice(int(self.frame_index['start'][position]), int(self.frame_index['stop'][position]))
+
+    def load_play(self, game_id, play_id, columns=None):
+        """
+        Returns zero copy views of a play's columns.
+        Args:
+            game_id: Game identifier
+            play_id: Play identifier
+            columns: Columns to return. Default is every column
+        Returns:
+            Dictionary of column name to numpy array view, or None if the play is not in the arrays
+        """
+        rows = self.play_rows(game_id, play_id)
+        if rows is None:
+            return None
+        return {column: self.columns[column][rows] for column in (columns or self.columns)}
+
+    def to_dataframe(self, arrays):
+        """
+        Copies arrays returned by load_play() into a DataFrame, decoding categorical columns and missing ids.
+        """
+        df = pd.DataFrame({column: np.asarray(values) for column, values in arrays.items()})
+        for column in SEASON_CATEGORICAL_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.Categorical.from_codes(df[column], categories=self.categories[column])
+        for column, dtype in [('nflId', 'Int32'), ('jerseyNumber', 'Int8')]:
+            if column in df.columns:
+                df[column] = df[column].astype(dtype).replace(-1, pd.NA)
+        return df
+
+
+_season_arrays = None
+
+
+def get_season_arrays():
+    """
+    Returns the process wide SeasonTrackingArrays, opening the memory maps on first use.
+    """
+    global _season_arrays
+    if _season_arrays is None:
+        _season_arrays = SeasonTrackingArrays()
+    return _season_arrays
+
+
+def load_play_arrays(play_id, game_id, columns=None):
+    """
+    Returns zero copy numpy views of a play's tracking columns from the memory mapped season arrays.
+    Args:
+        play_id (int): Play identifier.
+        game_id (int): Game identifier.
+        columns: Columns to return. Default is every column
+    Returns:
+        Dictionary of column name to numpy array, or None if the play is not in the season arrays
+    """
+    return get_season_arrays().load_play(game_id, play_id, columns=columns)
+
+
+# build_season_arrays()
+# update_season_arrays()
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+from CastleDefense.utils.extractPlayDataUtils import load_play_data, load_teams_from_play, get_play_by_id, \
+    get_blocking_players
+from CastleDefense.utils.metadataUtils import get_metadata_repository
+from CastleDefense.utils.playTensorUtils import build_play_tensor
+
+# Batches with more points than this use a KD-tree for radius queries when scipy is installed
+KD_TREE_MIN_POINTS = 20000
+
+TACKLE_LABEL_COLUMNS = ['tackle', 'assist', 'forcedFumble', 'pff_missedTackle']
+
+
+def align_frames(team_tensor, frame_ids):
+    """
+    Returns the (frames, players, 2) x and y of a PlayTensor at the given frameIds, NaN where a frame is missing.
+    """
+    coordinates = np.full((len(frame_ids), team_tensor.n_players, 2), np.nan)
+    positions = np.searchsorted(team_tensor.frame_ids, frame_ids).clip(max=max(team_tensor.n_frames - 1, 0))
+    present = team_tensor.frame_ids[positions] == frame_ids if team_tensor.n_frames else np.zeros(len(frame_ids), bool)
+    coordinates[present] = team_tensor.features[positions[present], :, :2]
+    return coordinates
+
+
+def pairwise_distances(a_xy, b_xy):
+    """
+    Distances between every pair of points of two groups, for all frames at once.
+    Args:
+        a_xy: (frames, A, 2) coordinates
+        b_xy: (frames, B, 2) coordinates
+    Returns:
+        (frames, A, B) distances, NaN where either player is missing from a frame
+    """
+    deltas = a_xy[:, :, None, :] - b_xy[:, None, :, :]
+    return np.hypot(deltas[..., 0], deltas[..., 1])
+
+
+def k_nearest(distances, k=1):
+    """
+    Finds the k nearest points of group B for every point of group A at every frame.
+    Args:
+        distances: (frames, A, B) distances from pairwise_distances()
+        k: Number of neighbours
+    Returns:
+        Tuple of (frames, A, k) column indices into group B and their distances. Missing neighbours come last with a
+        NaN distance
+    """
+    k = min(k, distances.shape[-1])
+    order = np.argsort(distances, axis=-1, kind='stable')[..., :k]
+    return order, np.take_along_axis(distances, order, axis=-1)
+
+
+def _import_kd_tree():
+    """
+    Returns scipy's cKDTree, or None when scipy is not installed. Imported on first use since scipy is slow to import.
+    """
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    return cKDTree
+
+
+def radius_pairs(frame_ids_a, a_xy, frame_ids_b, b_xy, radius):
+    """
+    Finds every pair of points of group A and group B within radius of each other in the same frame, for a batch of
+    flattened points (any number of frames and plays). Uses a KD-tree for large batches when scipy is installed,
+    otherwise per frame distance matrices.
+    Args:
+        frame_ids_a, frame_ids_b: (points,) integer frame key of each point. Points only pair within the same key
+        a_xy, b_xy: (points, 2) coordinates
+        radius: Distance in yards
+    Returns:
+        Tuple of (pairs,) row positions into A, row positions into B and their distances
+    """
+    frame_ids_a, frame_ids_b = np.asarray(frame_ids_a, dtype=np.int64), np.asarray(frame_ids_b, dtype=np.int64)
+    a_xy, b_xy = np.asarray(a_xy, dtype=float), np.asarray(b_xy, dtype=float)
+    valid_a = np.flatnonzero(~np.isnan(a_xy).any(axis=1))
+    valid_b = np.flatnonzero(~np.isnan(b_xy).any(axis=1))
+
+    cKDTree = _import_kd_tree() if len(valid_a) + len(valid_b) >= KD_TREE_MIN_POINTS else None
+    if cKDTree is not None:
+        # Frames are laid out side by side, far enough apart that points of different frames are never within radius.
+        # Keys are replaced by their dense rank first: shifting by large keys (e.g. gameId, playId and frameId packed in
+        # one integer) would exceed the float64 precision of the coordinates
+        _, key_ranks = np.unique(np.r_[frame_ids_a[valid_a], frame_ids_b[valid_b]], return_inverse=True)
+        key_ranks = key_ranks.reshape(-1)
+        extent = max(np.abs(a_xy[valid_a]).max(initial=0), np.abs(b_xy[valid_b]).max(initial=0))
+        spacing = 2 * extent + 2 * radius + 1
+        shifted_a = a_xy[valid_a] + np.c_[key_ranks[:len(valid_a)] * spacing, np.zeros(len(valid_a))]
+        shifted_b = b_xy[valid_b] + np.c_[key_ranks[len(valid_a):] * spacing, np.zeros(len(valid_b))]
+        pairs = cKDTree(shifted_a).sparse_distance_matrix(cKDTree(shifted_b), radius, output_type='ndarray')
+        rows_a, rows_b = valid_a[pairs['i']], valid_b[pairs['j']]
+        return rows_a, rows_b, pairs['v']
+
+    rows_a, rows_b, pair_distances = [], [], []
+    b_order = valid_b[np.argsort(frame_ids_b[valid_b], kind='stable')]
+    b_frames = frame_ids_b[b_order]
+    for frame_id in np.unique(frame_ids_a[valid_a]):
+        frame_a = valid_a[frame_ids_a[valid_a] == frame_id]
+        frame_b = b_order[np.searchsorted(b_frames, frame_id, 'left'):np.searchsorted(b_frames, frame_id, 'right')]
+        distances = pairwise_distances(a_xy[None, frame_a], b_xy[None, frame_b])[0]
+        close_a, close_b = np.nonzero(distances <= radius)
+        rows_a.append(frame_a[close_a])
+        rows_b.append(frame_b[close_b])
+        pair_distances.append(distances[close_a, close_b])
+
+    if not rows_a:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    return np.concatenate(rows_a), np.concatenate(rows_b), np.concatenate(pair_distances)
+
+
+class PlaySpatialIndex:
+    """
+    Offense to defense distances of one play at every frame, computed once as a (frames, offense, defense) matrix so
+    nearest defender and radius queries for a whole play are array lookups.
+
+    Attributes:
+        frame_ids: (frames,) sorted frameIds
+        offense_ids: (offense,) offense nflIds in column order
+        defense_ids: (defense,) defense nflIds in column order
+        distances: (frames, offense, defense) distances, NaN where a player is missing from a frame
+    """
+
+    def __init__(self, offense_tensor, defense_tensor):
+        self.frame_ids = np.union1d(offense_tensor.frame_ids, defense_tensor.frame_ids)
+        self.offense_ids = offense_tensor.nfl_ids
+        self.defense_ids = defense_tensor.nfl_ids
+        self.distances = pairwise_distances(align_frames(offense_tensor, self.frame_ids),
+                                            align_frames(defense_tensor, self.frame_ids))
+
+    def _offense_columns(self, nfl_ids):
+        nfl_ids = np.atleast_1d(np.asarray(nfl_ids, dtype=float))
+        nfl_ids = nfl_ids[np.isin(nfl_ids, self.offense_ids)]
+        return nfl_ids, np.searchsorted(self.offense_ids, nfl_ids)
+
+    def defender_distances(self, nfl_id):
+        """
+        Returns the (frames, defense) distances from one offensive player to every defender
+        """
+        _, columns = self._offense_columns(nfl_id)
+        if not len(columns):
+            return np.full((len(self.frame_ids), len(self.defense_ids)), np.nan)
+        return self.distances[:, columns[0]]
+
+    def nearest_defenders(self, nfl_ids, k=1):
+        """
+        Finds the k closest defenders of offensive players at every frame, e.g. the closest defender to each blocker.
+        Args:
+            nfl_ids: Offensive nflIds
+            k: Number of defenders per player and frame
+        Returns:
+            pandas.DataFrame: frameId, nflId, rank (1 is closest), defenderId and distance
+        """
+        nfl_ids, columns = self._offense_columns(nfl_ids)
+        order, distances = k_nearest(self.distances[:, columns], k)
+
+        n_frames, n_players, n_neighbours = order.shape
+        nearest_df = pd.DataFrame({
+            'frameId': np.repeat(self.frame_ids, n_players * n_neighbours),
+            'nflId': np.tile(np.repeat(nfl_ids, n_neighbours), n_frames).astype('int64'),
+            'rank': np.tile(np.arange(1, n_neighbours + 1), n_frames * n_players),
+            'defenderId': self.defense_ids[order.ravel()].astype('int64') if order.size else np.array([], 'int64'),
+            'distance': distances.ravel(),
+        })
+        return nearest_df.dropna(subset=['distance']).reset_index(drop=True)
+
+    def defenders_within(self, nfl_id, radius):
+        """
+        Finds the defenders within radius of an offensive player at every frame, e.g. the ball carrier.
+        Returns:
+            pandas.DataFrame: frameId, defenderId and distance of every defender within radius
+        """
+        distances = self.defender_distances(nfl_id)
+        frame_positions, defense_columns = np.nonzero(distances <= radius)
+        return pd.DataFrame({'frameId': self.frame_ids[frame_positions],
+                             'defenderId': self.defense_ids[defense_columns].astype('int64'),
+                             'distance': distances[frame_positions, defense_columns]})
+
+
+def build_play_spatial_index(offense, defense):
+    """
+    Builds the PlaySpatialIndex of a play from the offense and defense DataFrames of load_teams_from_play()
+    """
+    return PlaySpatialIndex(build_play_tensor(offense, label_column='nflId'),
+                            build_play_tensor(defense, label_column='nflId'))
+
+
+def load_play_spatial_index(gameId, playId, week=1):
+    """
+    Loads a play and builds its PlaySpatialIndex.
+    Returns:
+        Tuple of the PlaySpatialIndex, the plays.csv row, and the offense and defense DataFrames
+    """
+    play = get_play_by_id(gameId, playId)
+    offense, defense, _ = load_teams_from_play(load_play_data(playId, gameId, week), play, gameId)
+    return build_play_spatial_index(offense, defense), play, offense, defense
+
+
+def ball_carrier_pursuit(gameId, playId, week=1, radius=5):
+    """
+    Summarizes how each defender pursued the ball carrier over a play, joined with the tackles.csv labels.
+    Args:
+        gameId: Game identifier
+        playId: Play identifier
+        week: Week of the season
+        radius: Distance in yards that counts as being close to the ball carrier
+    Returns:
+        pandas.DataFrame: One row per defender with the closest distance, the first frameId and number of frames
+        within radius, the number of frames as the closest defender, and the tackle, assist, forcedFumble and
+        pff_missedTackle labels (0 for defenders missing from tackles.csv)
+    """
+    spatial_index, play, _, _ = load_play_spatial_index(gameId, playId, week)
+    ball_carrier_id = play['ballCarrierId'].iloc[0]
+    distances = spatial_index.defender_distances(ball_carrier_id)
+    within_radius = distances <= radius
+
+    closest_columns = np.argsort(distances, axis=1, kind='stable')[:, 0]
+    has_distances = ~np.isnan(distances).all(axis=1)
+    min_distances = np.where(np.isnan(distances), np.inf, distances).min(axis=0, initial=np.inf)
+    first_frames = np.where(within_radius.any(axis=0), spatial_index.frame_ids[within_radius.argmax(axis=0)], -1)
+
+    pursuit_df = pd.DataFrame({
+        'gameId': gameId,
+        'playId': playId,
+        'nflId': spatial_index.defense_ids.astype('int64'),
+        'min_distance': np.where(np.isinf(min_distances), np.nan, min_distances),
+        'first_frameId_within_radius': first_frames,
+        'frames_within_radius': within_radius.sum(axis=0),
+        'frames_as_closest': np.bincount(closest_columns[has_distances], minlength=len(spatial_index.defense_ids)),
+    })
+
+    tackles_df = get_metadata_repository().get_tackles(gameId, playId)[['nflId'] + TACKLE_LABEL_COLUMNS]
+    pursuit_df = pursuit_df.merge(tackles_df.astype({'nflId': 'int64'}), on='nflId', how='left')
+    pursuit_df[TACKLE_LABEL_COLUMNS] = pursuit_df[TACKLE_LABEL_COLUMNS].fillna(0).astype('int8')
+    return pursuit_df.sort_values(by='min_distance').reset_index(drop=True)
+
+
+def blocker_nearest_defenders(gameId, playId, week=1, k=1):
+    """
+    Finds the k closest defenders to each blocker (TE, G, C, T) at every frame of a play.
+    Returns:
+        pandas.DataFrame: See PlaySpatialIndex.nearest_defenders()
+    """
+    spatial_index, _, offense, _ = load_play_spatial_index(gameId, playId, week)
+    return spatial_index.nearest_defenders(get_blocking_players(offense)['nflId'].unique(), k=k)
+
+
+# ball_carrier_pursuit(2022090800, 343, week=1, radius=5)
+# blocker_nearest_defenders(2022090800, 343, week=1, k=2)
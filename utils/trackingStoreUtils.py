@@ -0,0 +1,524 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import shutil
+from functools import lru_cache
+from CastleDefense.utils.schemaUtils import read_tracking_csv, restore_categoricals
+from CastleDefense.utils.ingestManifestUtils import read_manifest, write_manifest, record_file, describe_game, \
+    find_changed_entries, find_changed_games, TRACKING_WEEKS_SECTION
+from CastleDefense.utils.eventIndexUtils import extract_game_events, write_event_index
+
+tracking_data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tracking_data'))
+tracking_store_path = os.path.join(tracking_data_path, 'store')
+play_index_path = os.path.join(tracking_store_path, 'play_index.csv')
+
+PLAY_INDEX_COLUMNS = ['week', 'gameId', 'playId', 'start', 'stop']
+
+DEFAULT_CHUNKSIZE = 250000
+
+# Each game partition is a directory holding one .npy file per column, described by its meta.json
+PARTITION_META_FILE = 'meta.json'
+
+# Key: week, Value: (week DataFrame sorted by gameId/playId/frameId, {(gameId, playId): (start, stop)})
+_preloaded_weeks = {}
+
+
+def get_tracking_week_csv_path(week):
+    """
+    Returns the path to the raw tracking csv for a week.
+    Args:
+        week: Week of the season
+    """
+    return os.path.join(tracking_data_path, 'tracking_week_' + str(week) + '.csv')
+
+
+def get_game_partition_path(game_id, week):
+    """
+    Returns the path to the stored partition directory holding every tracking row of a game.
+    Args:
+        game_id: Game identifier
+        week: Week of the season
+    """
+    return os.path.join(tracking_store_path, 'week_' + str(week), 'game_' + str(game_id))
+
+
+def list_tracking_weeks():
+    """
+    Returns the sorted week numbers of the raw tracking_week_N.csv files found in tracking_data.
+    """
+    if not os.path.isdir(tracking_data_path):
+        return []
+
+    weeks = []
+    for f in os.listdir(tracking_data_path):
+        if f.startswith('tracking_week_') and f.endswith('.csv'):
+            week = f[len('tracking_week_'):-len('.csv')]
+            if week.isdigit():
+                weeks.append(int(week))
+    return sorted(weeks)
+
+
+def write_partition_columns(df, partition_path):
+    """
+    Writes every column of a DataFrame as its own .npy file so any row range can later be read through a memory map
+    without loading the rest of the game (see read_game_partition_rows).
+    Categorical and string columns are written as integer codes into the categories saved in meta.json (missing
+    values are -1). Nullable integer columns are written as their values plus a boolean mask of the missing rows.
+    Args:
+        df: DataFrame to write
+        partition_path: Directory receiving the column files
+    """
+    os.makedirs(partition_path, exist_ok=True)
+    columns = []
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        column_meta = {'name': column, 'dtype': str(values.dtype)}
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            column_meta.update(kind='category', categories=values.cat.categories.tolist())
+            data = values.cat.codes.to_numpy()
+        elif pd.api.types.is_string_dtype(values.dtype) or values.dtype == object:
+            codes, categories = pd.factorize(values)
+            column_meta.update(kind='string', categories=categories.tolist())
+            data = codes.astype(np.int32)
+        elif pd.api.types.is_extension_array_dtype(values.dtype):
+            column_meta.update(kind='nullable')
+            data = values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)
+            np.save(os.path.join(partition_path, 'column_' + str(i) + '_mask.npy'), values.isna().to_numpy())
+        else:
+            column_meta.update(kind='numeric')
+            data = values.to_numpy()
+        np.save(os.path.join(partition_path, 'column_' + str(i) + '.npy'), data)
+        columns.append(column_meta)
+
+    # meta.json last, a partition without it is incomplete
+    with open(os.path.join(partition_path, PARTITION_META_FILE), 'w') as meta_file:
+        json.dump({'rows': len(df), 'columns': columns}, meta_file)
+
+
+def write_game_partition(game_df, game_id, week, game_manifest=None, week_events=None):
+    """
+    Sorts a game's tracking rows by playId and frameId and writes them as the game partition.
+    Args:
+        game_df: Every tracking row of the game
+        game_id: Game identifier
+        week: Week of the season
+        game_manifest: Optional dictionary receiving the game's row count and content hash, keyed by gameId
+        week_events: Optional list receiving the game's event index rows (see eventIndexUtils)
+    Returns:
+        List of play index rows (week, gameId, playId, start, stop) for the game
+    """
+    game_df = game_df.sort_values(by=['playId', 'frameId'], kind='mergesort').reset_index(drop=True)
+    write_partition_columns(game_df, get_game_partition_path(game_id, week))
+    if game_manifest is not None:
+        game_manifest[str(game_id)] = describe_game(game_df)
+    if week_events is not None:
+        week_events.append(extract_game_events(game_df, week))
+
+    # Rows are sorted by playId so each play is one contiguous row range
+    play_ids = game_df['playId'].to_numpy()
+    starts = [0] + [i for i in range(1, len(play_ids)) if play_ids[i] != play_ids[i - 1]]
+    stops = starts[1:] + [len(play_ids)]
+    return [(week, game_id, play_ids[start], start, stop) for start, stop in zip(starts, stops)]
+
+
+def ingest_tracking_week(week, game_manifest=None, week_events=None):
+    """
+    Converts one tracking_week_N.csv into per game partitions sorted by playId and frameId.
+    Args:
+        week: Week of the season
+        game_manifest: Optional dictionary receiving the row count and content hash of every game
+        week_events: Optional list receiving the event index rows of every game
+    Returns:
+        pandas.DataFrame: Play index rows (week, gameId, playId, start, stop) for the week. start/stop are the row range
+        of the play inside its game partition.
+    """
+    week_df = read_tracking_csv(get_tracking_week_csv_path(week))
+    os.makedirs(os.path.join(tracking_store_path, 'week_' + str(week)), exist_ok=True)
+
+    index_rows = []
+    for game_id, game_df in week_df.groupby('gameId', sort=True):
+        index_rows.extend(write_game_partition(game_df, game_id, week, game_manifest, week_events))
+
+    return pd.DataFrame(index_rows, columns=PLAY_INDEX_COLUMNS)
+
+
+def stream_tracking_week(week, chunksize=DEFAULT_CHUNKSIZE, game_manifest=None, week_events=None):
+    """
+    Converts one tracking_week_N.csv into per game partitions without loading the whole week.
+    The csv is read in chunks with the compact schemaUtils.TRACKING_DTYPES and each chunk's rows are routed to per game
+    spill files on the fly. Each game is then assembled on its own, so peak memory is bounded by max(chunk, one game).
+    Args:
+        week: Week of the season
+        chunksize: Number of csv rows read at a time
+        game_manifest: Optional dictionary receiving the row count and content hash of every game
+        week_events: Optional list receiving the event index rows of every game
+    Returns:
+        pandas.DataFrame: Play index rows (week, gameId, playId, start, stop) for the week
+    """
+    week_path = os.path.join(tracking_store_path, 'week_' + str(week))
+    spill_path = os.path.join(week_path, '_spill')
+    os.makedirs(spill_path, exist_ok=True)
+
+    game_parts = {}  # Key: gameId, Value: list of spill file paths
+    for chunk in read_tracking_csv(get_tracking_week_csv_path(week), chunksize=chunksize):
+        for game_id, game_chunk in chunk.groupby('gameId', sort=False):
+            parts = game_parts.setdefault(game_id, [])
+            part_path = os.path.join(spill_path, 'game_' + str(game_id) + '_part' + str(len(parts)) + '.pkl')
+            game_chunk.to_pickle(part_path)
+            parts.append(part_path)
+
+    index_rows = []
+    for game_id in sorted(game_parts):
+        game_df = pd.concat([pd.read_pickle(part_path) for part_path in game_parts[game_id]], ignore_index=True)
+        index_rows.extend(write_game_partition(restore_categoricals(game_df), game_id, week, game_manifest,
+                                               week_events))
+        [os.remove(part_path) for part_path in game_parts[game_id]]
+
+    os.rmdir(spill_path)
+    return pd.DataFrame(index_rows, columns=PLAY_INDEX_COLUMNS)
+
+
+def build_tracking_store(weeks=None, chunksize=None):
+    """
+    One time ingest step converting the raw tracking csvs into the partitioned tracking store, with the play index and
+    the event index (see eventIndexUtils) of every play.
+    Args:
+        weeks: Weeks to ingest. Default is every tracking_week_N.csv in tracking_data
+        chunksize: Streams each csv in chunks of this many rows (see stream_tracking_week) so weeks
+            that do not fit in memory can be ingested. Default reads each week at once
+    Returns:
+        pandas.DataFrame: The full play index
+    """
+    weeks = list_tracking_weeks() if weeks is None else list(weeks)
+
+    play_index_df = read_play_index_file()
+    play_index_df = play_index_df[~play_index_df['week'].isin(weeks)]
+
+    manifest = read_manifest()
+    week_index_dfs = []
+    week_events = []
+    for week in weeks:
+        # Partitions of games no longer in the csv must not outlive the rebuild
+        remove_week_partitions(week)
+
+        game_manifest = {}
+        if chunksize is None:
+            week_index_dfs.append(ingest_tracking_week(week, game_manifest, week_events))
+        else:
+            week_index_dfs.append(stream_tracking_week(week, chunksize=chunksize, game_manifest=game_manifest,
+                                                       week_events=week_events))
+        record_file(manifest, TRACKING_WEEKS_SECTION, week, get_tracking_week_csv_path(week),
+                    rows=sum(game['rows'] for game in game_manifest.values()), games=game_manifest)
+
+    play_index_df = pd.concat([play_index_df] + week_index_dfs, ignore_index=True)
+    play_index_df = play_index_df.sort_values(by=['week', 'gameId', 'playId']).reset_index(drop=True)
+
+    os.makedirs(tracking_store_path, exist_ok=True)
+    play_index_df.to_csv(play_index_path, index=False)
+    write_event_index(week_events, weeks)
+
+    write_manifest(manifest)
+    invalidate_tracking_store()
+    return play_index_df
+
+
+def remove_week_partitions(week):
+    """
+    Deletes the stored game partitions of a week, including the single file .pkl partitions of older stores.
+    """
+    week_path = os.path.join(tracking_store_path, 'week_' + str(week))
+    if os.path.isdir(week_path):
+        for f in os.listdir(week_path):
+            if f.startswith('game_') and os.path.isdir(os.path.join(week_path, f)):
+                shutil.rmtree(os.path.join(week_path, f))
+            elif f.endswith('.pkl'):
+                os.remove(os.path.join(week_path, f))
+
+
+def update_tracking_store(chunksize=None):
+    """
+    Incremental ingest. Compares the tracking csvs with the manifest written by build_tracking_store() and re-ingests only
+    the weeks whose file is new or changed. Weeks whose csv was removed are dropped from the store.
+    Args:
+        chunksize: Streams each csv in chunks of this many rows (see build_tracking_store)
+    Returns:
+        Dictionary with the changed 'weeks', the 'removed_weeks' and, per changed or removed week, the gameIds whose
+        rows changed under 'games'
+    """
+    manifest = read_manifest()
+    old_entries = manifest[TRACKING_WEEKS_SECTION]
+    changed_weeks, removed_weeks = find_changed_entries(
+        manifest, TRACKING_WEEKS_SECTION, {week: get_tracking_week_csv_path(week) for week in list_tracking_weeks()})
+    removed_weeks = [int(week) for week in removed_weeks]
+
+    if changed_weeks:
+        build_tracking_store(changed_weeks, chunksize=chunksize)
+
+    if removed_weeks:
+        for week in removed_weeks:
+            remove_week_partitions(week)
+        play_index_df = read_play_index_file()
+        play_index_df[~play_index_df['week'].isin(removed_weeks)].to_csv(play_index_path, index=False)
+        write_event_index([], removed_weeks)
+
+        updated_manifest = read_manifest()
+        [updated_manifest[TRACKING_WEEKS_SECTION].pop(str(week), None) for week in removed_weeks]
+        write_manifest(updated_manifest)
+        invalidate_tracking_store()
+
+    new_entries = read_manifest()[TRACKING_WEEKS_SECTION]
+    changed_games = {week: find_changed_games(old_entries.get(str(week)), new_entries.get(str(week)))
+                     for week in changed_weeks + removed_weeks}
+
+    return {'weeks': changed_weeks, 'removed_weeks': removed_weeks,
+            'games': {week: game_ids for week, game_ids in changed_games.items() if game_ids}}
+
+
+def rebuild_event_index():
+    """
+    Builds the event index from the stored game partitions, for stores ingested before the event index existed.
+    Returns:
+        pandas.DataFrame: The full event index
+    """
+    play_index_df = read_play_index_file()
+    games = play_index_df[['week', 'gameId']].drop_duplicates().itertuples(index=False)
+    week_events = [extract_game_events(read_game_partition(int(game_id), int(week)), week) for week, game_id in games]
+    return write_event_index(week_events, play_index_df['week'].unique().tolist())
+
+
+def read_play_index_file():
+    """
+    Reads the play index of the tracking store. Returns an empty index if the store has not been built.
+    """
+    if not os.path.exists(play_index_path):
+        return pd.DataFrame(columns=PLAY_INDEX_COLUMNS, dtype='int64')
+    return pd.read_csv(play_index_path, dtype='int64')
+
+
+@lru_cache(maxsize=1)
+def get_play_index():
+    """
+    Returns the play index as a dictionary for constant time lookups.
+    Key: (week, gameId, playId), Value: (start, stop) row range in the game partition
+    """
+    play_index_df = read_play_index_file()
+    return {(week, game_id, play_id): (start, stop)
+            for week, game_id, play_id, start, stop in play_index_df[PLAY_INDEX_COLUMNS].itertuples(index=False)}
+
+
+@lru_cache(maxsize=8)
+def open_game_partition(game_id, week):
+    """
+    Opens the column files of a game partition as read only memory maps. Nothing is read from disk until rows are
+    sliced, and the most recently used games are kept open so consecutive plays from the same game skip the opening.
+    Args:
+        game_id: Game identifier
+        week: Week of the season
+    Returns:
+        (meta, list of (values, mask) memory maps in column order, mask is None unless the column is nullable)
+    """
+    partition_path = get_game_partition_path(game_id, week)
+    with open(os.path.join(partition_path, PARTITION_META_FILE)) as meta_file:
+        meta = json.load(meta_file)
+
+    column_maps = []
+    for i, column_meta in enumerate(meta['columns']):
+        values = np.load(os.path.join(partition_path, 'column_' + str(i) + '.npy'), mmap_mode='r')
+        mask = None
+        if column_meta['kind'] == 'nullable':
+            mask = np.load(os.path.join(partition_path, 'column_' + str(i) + '_mask.npy'), mmap_mode='r')
+        column_maps.append((values, mask))
+    return meta, column_maps
+
+
+def read_game_partition_rows(game_id, week, start=0, stop=None):
+    """
+    Reads a row range of a game partition from the tracking store. Only the bytes of those rows are read from disk.
+    Args:
+        game_id: Game identifier
+        week: Week of the season
+        start: First row
+        stop: Row after the last one. Default is the end of the game
+    Returns:
+        pandas.DataFrame: The rows, indexed by their position in the game partition
+    """
+    meta, column_maps = open_game_partition(game_id, week)
+    stop = meta['rows'] if stop is None else stop
+
+    data = {}
+    for column_meta, (values, mask) in zip(meta['columns'], column_maps):
+        rows = np.array(values[start:stop])
+        if column_meta['kind'] in ('category', 'string'):
+            column = pd.Categorical.from_codes(rows, categories=column_meta['categories'])
+            data[column_meta['name']] = column if column_meta['kind'] == 'category' else \
+                pd.Series(column).astype(column_meta['dtype']).to_numpy()
+        elif column_meta['kind'] == 'nullable':
+            data[column_meta['name']] = pd.array(rows, dtype=column_meta['dtype'])
+            data[column_meta['name']][np.array(mask[start:stop])] = pd.NA
+        else:
+            data[column_meta['name']] = rows
+    return pd.DataFrame(data, index=pd.RangeIndex(start, stop))
+
+
+@lru_cache(maxsize=8)
+def read_game_partition(game_id, week):
+    """
+    Reads a whole game partition from the tracking store. The most recently used games are kept in memory so games
+    read again, e.g. by load_game_from_store, are read from disk once.
+    Args:
+        game_id: Game identifier
+        week: Week of the season
+    """
+    return read_game_partition_rows(game_id, week)
+
+
+def invalidate_tracking_store():
+    """
+    Clears the in memory play index and game partitions. Call after the tracking store is rebuilt.
+    """
+    get_play_index.cache_clear()
+    open_game_partition.cache_clear()
+    read_game_partition.cache_clear()
+
+
+def has_stored_game(game_id, week):
+    """
+    Returns True if the game has been ingested into the tracking store.
+    """
+    return os.path.exists(os.path.join(get_game_partition_path(int(game_id), int(week)), PARTITION_META_FILE))
+
+
+def preload_tracking_week(week):
+    """
+    Holds a whole week of tracking data in memory so load_play_data() serves its plays without touching disk.
+    Used by batch jobs: a week preloaded before a process pool forks is shared with every worker.
+    Args:
+        week: Week of the season
+    """
+    week = int(week)
+    if week in _preloaded_weeks:
+        return
+
+    preload_tracking_dataframe(week, read_tracking_csv(get_tracking_week_csv_path(week)))
+
+
+def preload_tracking_dataframe(week, week_df):
+    """
+    Holds tracking rows already in memory as a preloaded week, e.g. synthetic data for benchmarks. Replaces the week if
+    it was preloaded before.
+    Args:
+        week: Week number the rows are served under
+        week_df: Tracking rows with the tracking csv columns
+    """
+    week = int(week)
+    week_df = week_df.sort_values(by=['gameId', 'playId', 'frameId'], kind='mergesort').reset_index(drop=True)
+
+    keys = list(zip(week_df['gameId'], week_df['playId']))
+    starts = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]]
+    stops = starts[1:] + [len(keys)]
+    _preloaded_weeks[week] = (week_df, {keys[start]: (start, stop) for start, stop in zip(starts, stops)})
+
+
+def is_week_preloaded(week):
+    """
+    Returns True if the week is held in memory by preload_tracking_week() or preload_tracking_dataframe().
+    """
+    return int(week) in _preloaded_weeks
+
+
+def release_preloaded_weeks(weeks=None):
+    """
+    Drops weeks held in memory by preload_tracking_week().
+    Args:
+        weeks: Weeks to drop. Default is every week
+    """
+    if weeks is None:
+        _preloaded_weeks.clear()
+    for week in weeks or []:
+        _preloaded_weeks.pop(int(week), None)
+
+
+def load_play_from_preloaded_week(play_id, game_id, week=1):
+    """
+    Loads tracking data for a play from a week preloaded in memory.
+    Returns:
+        pandas.DataFrame: Tracking data for the play, or None if the week has not been preloaded or does not hold the
+        play, so the caller falls back to the tracking store or the csv.
+    """
+    preloaded_week = _preloaded_weeks.get(int(week))
+    if preloaded_week is None:
+        return None
+
+    week_df, play_rows = preloaded_week
+    row_range = play_rows.get((int(game_id), int(play_id)))
+    if row_range is None:
+        return None
+
+    start, stop = row_range
+    return week_df.iloc[start:stop].copy()
+
+
+def load_play_from_store(play_id, game_id, week=1):
+    """
+    Loads tracking data for a play by reading only its row range from the game partition. Weeks preloaded in memory
+    are served first.
+    Args:
+        play_id (int): Play identifier.
+        game_id (int): Game identifier.
+        week (int, optional): Week of the season. Default is 1.
+    Returns:
+        pandas.DataFrame: Tracking data for the play, or None if the play is not in the tracking store.
+    """
+    play_df = load_play_from_preloaded_week(play_id, game_id, week)
+    if play_df is not None:
+        return play_df
+
+    row_range = get_play_index().get((int(week), int(game_id), int(play_id)))
+    if row_range is None:
+        return None
+
+    start, stop = row_range
+    return read_game_partition_rows(int(game_id), int(week), start, stop)
+
+
+def load_game_from_store(game_id, week):
+    """
+    Loads tracking data for every play of a game from the tracking store.
+    Args:
+        game_id (int): Game identifier.
+        week (int): Week of the season.
+    Returns:
+        pandas.DataFrame: Tracking data for the game, or None if the game is not in the tracking store.
+    """
+    if not has_stored_game(game_id, week):
+        return None
+    return read_game_partition(int(game_id), int(week)).copy()
+
+
+def load_games_from_store(game_ids, week):
+    """
+    Loads tracking data for several games of a week at once, from the preloaded week or from the game partitions.
+    Args:
+        game_ids: Game identifiers
+        week (int): Week of the season.
+    Returns:
+        Dictionary of gameId to its tracking DataFrame. Games that are neither preloaded nor stored are left out
+    """
+    game_ids = {int(game_id) for game_id in game_ids}
+    preloaded_week = _preloaded_weeks.get(int(week))
+    if preloaded_week is not None:
+        # The preloaded week is sorted by gameId, so a game's plays are one contiguous row range
+        week_df, play_rows = preloaded_week
+        game_rows = {}
+        for (game_id, _), (start, stop) in play_rows.items():
+            if game_id in game_ids:
+                game_start, game_stop = game_rows.get(game_id, (start, stop))
+                game_rows[game_id] = (min(start, game_start), max(stop, game_stop))
+        return {game_id: week_df.iloc[start:stop] for game_id, (start, stop) in game_rows.items()}
+
+    return {game_id: read_game_partition(game_id, int(week)) for game_id in game_ids if has_stored_game(game_id, week)}
+
+
+# build_tracking_store()
+# update_tracking_store()
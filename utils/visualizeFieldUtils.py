@@ -1,13 +1,26 @@
 from CastleDefense.utils.extractPlayDataUtils import *
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import warnings
-warnings.filterwarnings('ignore')
+from CastleDefense.utils.lazyImportUtils import lazy_import
+from CastleDefense.utils.playCacheUtils import load_prepared_play
+from CastleDefense.utils.eventIndexUtils import get_play_events, get_play_event_frames
+from functools import lru_cache
+
+# matplotlib is imported the first time something is drawn
+plt = lazy_import('matplotlib.pyplot')
+patches = lazy_import('matplotlib.patches')
+mcollections = lazy_import('matplotlib.collections')
+mfigure = lazy_import('matplotlib.figure')
+backend_agg = lazy_import('matplotlib.backends.backend_agg')
+field_raster = lazy_import('CastleDefense.utils.fieldRasterUtils')
 
 # Constants for NFL field dimensions
 NFL_FIELD_HEIGHT = 120
 NFL_FIELD_WIDTH = 53.3
 
+# Small multiples: panel width in inches, yards shown around the football in zoomed panels, field raster resolution
+GRID_PANEL_WIDTH = 2.5
+GRID_WINDOW_YARDS = 40
+GRID_BACKGROUND_DPI = 60
+
 
 def plot_field_lines(ax, line_color='white'):
     """
@@ -70,14 +83,14 @@ def plot_hashmarks(ax, line_color='white'):
         ax: subplot to plot on
     """
     field_height = NFL_FIELD_HEIGHT
-    hash_range = range(11, int(field_height) - 10) if field_height == 120 else range(11, int(field_height))
-
-    for x in hash_range:
-        # At each eligible yard line, plot hash marks going vertically up the field.
-        ax.plot([0.4, 0.7], [x, x], color=line_color)
-        ax.plot([53.0, 52.5], [x, x], color=line_color)
-        ax.plot([22.91, 23.57], [x, x], color=line_color)
-        ax.plot([29.73, 30.39], [x, x], color=line_color)
+    hash_range = np.arange(11, int(field_height) - 10) if field_height == 120 else np.arange(11, int(field_height))
+
+    # At each eligible yard line, hash marks go vertically up the field. All segments are drawn as one LineCollection.
+    hash_x = np.array([[0.4, 0.7], [53.0, 52.5], [22.91, 23.57], [29.73, 30.39]])
+    segments = np.empty((len(hash_range), len(hash_x), 2, 2))
+    segments[:, :, :, 0] = hash_x
+    segments[:, :, :, 1] = hash_range[:, None, None]
+    ax.add_collection(mcollections.LineCollection(segments.reshape(-1, 2, 2), colors=line_color))
     return ax
 
 
@@ -106,13 +119,121 @@ def plot_linenumbers(ax, line_color='white'):
     return ax
 
 
+def plot_field_markings(ax, line_color='white'):
+    """
+    Plots the static markings of the field: field lines, endzones, line numbers and hashmarks.
+    Args:
+        ax: subplot to plot on
+        line_color: default white
+    """
+    plot_field_lines(ax, line_color=line_color)
+    plot_endzones(ax)
+    plot_linenumbers(ax, line_color=line_color)
+    plot_hashmarks(ax, line_color=line_color)
+    return ax
+
+
+def plot_field_background(ax, field_bounds, v_padding=0, h_padding=0, field_color='darkgreen', line_color='white'):
+    """
+    Plots the static part of a field view: the padded boundary, the field and its markings, then sets the view limits.
+    Args:
+        ax: subplot to plot on
+        field_bounds: (x_min, y_min, x_max, y_max) of the field being displayed
+        v_padding: Adds vertical padding to the view
+        h_padding: Adds horizontal padding to the view
+        field_color: Default darkgreen
+        line_color: Default white
+    """
+    x_min, y_min, x_max, y_max = field_bounds
+    field_width, field_height = x_max - x_min, y_max - y_min
+    padded_field_boundary = patches.Rectangle((x_min-h_padding, y_min-v_padding),
+                                              field_width + (2*h_padding), field_height + (2*v_padding), linewidth=0.1,
+                                              edgecolor='r', facecolor='darkblue', alpha=0.2, zorder=0)
+    ax.add_patch(padded_field_boundary)
+
+    out_of_bounds_boundary = patches.Rectangle((x_min, y_min), field_width, field_height,
+                                               linewidth=0.1, edgecolor='r', facecolor=field_color, zorder=0)
+    ax.add_patch(out_of_bounds_boundary)
+    plot_field_markings(ax, line_color=line_color)
+
+    ax.set_xlim(x_min - h_padding, x_max + h_padding)
+    ax.set_ylim(y_min - v_padding, y_max + v_padding)
+    ax.axis('off')
+    return ax
+
+
+@lru_cache(maxsize=16)
+def render_field_background(figsize, field_bounds, v_padding=0, h_padding=0, field_color='darkgreen',
+                            line_color='white', dpi=100):
+    """
+    Renders the static part of a field view (see plot_field_background) once per figure size, view, colors and dpi.
+    The raster has the pixel size of the view's axes, so create_football_field(cached_background=True) copies it to the
+    canvas without resampling (see fieldRasterUtils.FieldRasterImage) instead of drawing every marking.
+    Args:
+        figsize: Figure size in inches, as in create_football_field()
+        field_bounds: (x_min, y_min, x_max, y_max) of the field being displayed
+        v_padding: Adds vertical padding to the view
+        h_padding: Adds horizontal padding to the view
+        field_color: Default darkgreen
+        line_color: Default white
+        dpi: Resolution of the figure the raster is displayed in
+    Returns:
+        numpy.ndarray: (rows, columns, 4) uint8 image of the axes with the top of the view in the first row
+    """
+    fig = mfigure.Figure(figsize=figsize, dpi=dpi)
+    canvas = backend_agg.FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    plot_field_background(ax, field_bounds, v_padding=v_padding, h_padding=h_padding, field_color=field_color,
+                          line_color=line_color)
+    canvas.draw()
+
+    # Crop the axes out of the figure. Markings drawn outside of the axes (e.g. line numbers) are left out
+    image = np.asarray(canvas.buffer_rgba())
+    bbox = ax.get_window_extent()
+    row_start, row_end = int(round(image.shape[0] - bbox.y1)), int(round(image.shape[0] - bbox.y0))
+    column_start, column_end = int(round(bbox.x0)), int(round(bbox.x1))
+    return image[row_start:row_end, column_start:column_end].copy()
+
+
+@lru_cache(maxsize=8)
+def render_full_field_background(field_color='darkgreen', line_color='white', dpi=None):
+    """
+    Renders the full field with its markings to an RGBA array once per color scheme, for the panels of
+    plot_play_grid() which all show the same small raster cropped to their view with the axis limits.
+    The raster is sized like the axes of a full field figure so line numbers keep their usual proportions.
+    Args:
+        field_color: Default darkgreen
+        line_color: Default white
+        dpi: Raster resolution. Default is GRID_BACKGROUND_DPI
+    Returns:
+        numpy.ndarray: (rows, columns, 4) uint8 image with the top of the field in the first row
+    """
+    subplot_width = plt.rcParams['figure.subplot.right'] - plt.rcParams['figure.subplot.left']
+    subplot_height = plt.rcParams['figure.subplot.top'] - plt.rcParams['figure.subplot.bottom']
+    figsize = (NFL_FIELD_WIDTH / 10 * subplot_width, (NFL_FIELD_HEIGHT + 10) / 10 * subplot_height)
+
+    fig = mfigure.Figure(figsize=figsize, dpi=dpi or GRID_BACKGROUND_DPI)
+    canvas = backend_agg.FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_facecolor(field_color)
+    plot_field_markings(ax, line_color=line_color)
+    ax.set_xlim(0, NFL_FIELD_WIDTH)
+    ax.set_ylim(0, NFL_FIELD_HEIGHT)
+    ax.axis('off')
+    fig.patch.set_facecolor(field_color)
+
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
 def create_football_field(boxed_view=None,
                           line_of_scrimmage=None,
                           yards_to_go=None,
                           v_padding=0,
                           h_padding=0,
                           field_color='darkgreen',
-                          line_color='white'):
+                          line_color='white',
+                          cached_background=True):
     """
     Creates a football field using matplotlib patches.
     Args:
@@ -123,6 +244,9 @@ def create_football_field(boxed_view=None,
         h_padding: Adds horizontal padding to the view
         field_color: Default darkgreen
         line_color: Default white
+        cached_background: Displays the field and its markings as one raster rendered once per view (see
+            render_field_background) instead of redrawing every line, number and hashmark on each draw. Set to False
+            when the view limits change after creation, e.g. when the view follows the football
 
     Returns:
 
@@ -156,24 +280,19 @@ def create_football_field(boxed_view=None,
 
     figsize = (field_width / 10, (field_height + 10) / 10)  # Allow larger vertical spacing for titles in figure
     fig, ax = plt.subplots(1, figsize=figsize)
-
-    padded_field_boundary = patches.Rectangle((x_min-h_padding, y_min-v_padding),
-                                              field_width + (2*h_padding), field_height + (2*v_padding), linewidth=0.1,
-                                              edgecolor='r', facecolor='darkblue', alpha=0.2, zorder=0)
-
-    out_of_bounds_boundary = patches.Rectangle((x_min, y_min), field_width, field_height,
-                                               linewidth=0.1, edgecolor='r', facecolor=field_color, zorder=0)
-    ax.add_patch(padded_field_boundary)
-    ax.add_patch(out_of_bounds_boundary)
-
-    plt.xlim(x_min - h_padding, x_max + h_padding)
-    plt.ylim(y_min - v_padding, y_max + v_padding)
-    plt.axis('off')
-
-    plot_field_lines(ax, line_color=line_color)
-    plot_endzones(ax)
-    plot_linenumbers(ax, line_color=line_color)
-    plot_hashmarks(ax, line_color=line_color)
+    field_bounds = (float(x_min), float(y_min), float(x_max), float(y_max))
+
+    if cached_background:
+        background = render_field_background(figsize, field_bounds, v_padding=v_padding, h_padding=h_padding,
+                                             field_color=field_color, line_color=line_color, dpi=fig.dpi)
+        field_raster.add_field_raster(ax, background, (x_min - h_padding, x_max + h_padding, y_min - v_padding,
+                                                       y_max + v_padding))
+        ax.set_xlim(x_min - h_padding, x_max + h_padding)
+        ax.set_ylim(y_min - v_padding, y_max + v_padding)
+        ax.axis('off')
+    else:
+        plot_field_background(ax, field_bounds, v_padding=v_padding, h_padding=h_padding, field_color=field_color,
+                              line_color=line_color)
 
     if line_of_scrimmage:
         los = line_of_scrimmage + 10
@@ -228,7 +347,7 @@ def plot_player_locations(offense, defense, football, description=None, zoomed_v
     plt.show()
 
 
-def plot_play_events(playId, gameId, week, zoomed_view=False, plot_blockers=False):
+def plot_play_events(playId, gameId, week, zoomed_view=False, plot_blockers=False, use_cache=True):
     """
     Plots the discrete events for a single play as seperate diagrams.
     Args:
@@ -237,22 +356,27 @@ def plot_play_events(playId, gameId, week, zoomed_view=False, plot_blockers=Fals
         week:
         zoomed_view: Zooms in on the play
         plot_blockers: Displays red line connnecting eligible blockers
+        use_cache: Serves the play from the play cache shared with animate_func_play (see playCacheUtils)
     """
     # Load play dataframes
-    offense, defense, football = load_play(playId, gameId, week)
+    prepared = load_prepared_play(playId, gameId, week, use_cache=use_cache)
+    offense, defense, football = prepared.offense, prepared.defense, prepared.football
 
-    events = offense['event'].unique()
-    events = [event for event in events if not pd.isna(event)]
+    # Events and their frames come from the event index built at ingest. Plays missing from it are scanned
+    event_frames = get_play_events(gameId, playId, week)
+    if event_frames is None:
+        event_rows = offense[offense['event'].notna()].drop_duplicates(subset=['frameId', 'event'])
+        event_frames = list(zip(event_rows['event'], event_rows['frameId']))
 
-    for event in events:
-        off = offense[offense['event'] == event]
-        df = defense[defense['event'] == event]
-        ft = football[football['event'] == event]
+    for event, frameId in event_frames:
+        off = offense[offense['frameId'] == frameId]
+        df = defense[defense['frameId'] == frameId]
+        ft = football[football['frameId'] == frameId]
 
         plot_player_locations(off, df, ft, description=event, zoomed_view=zoomed_view, plot_blockers=plot_blockers)
 
 
-def plot_play_tracked_movements(playId, gameId, week, zoomed_view=False):
+def plot_play_tracked_movements(playId, gameId, week, zoomed_view=False, use_cache=True):
     """
      Plots the tracked movements from one play. This visualizes the path of each player that they travelled on a certain play.
     Args:
@@ -260,9 +384,11 @@ def plot_play_tracked_movements(playId, gameId, week, zoomed_view=False):
         gameId:
         week:
         zoomed_view: Displays zoome in window of the play
+        use_cache: Serves the play from the play cache shared with animate_func_play (see playCacheUtils)
     """
     # Load play dataframes
-    offense, defense, football = load_play(playId, gameId, week)
+    prepared = load_prepared_play(playId, gameId, week, use_cache=use_cache)
+    offense, defense, football = prepared.offense, prepared.defense, prepared.football
 
     plot_player_locations(offense, defense, football, zoomed_view=zoomed_view)
 
@@ -276,15 +402,105 @@ def plot_blocking_formation(ax, blocker_df, line_color='red'):
         line_color: Color of the line.
     """
     blocker_df = blocker_df.sort_values(by=['x'], ascending=[True])
+    coordinates = blocker_df[['x', 'y']].to_numpy(dtype=float)
 
-    for i in range(len(blocker_df) - 1):
-        blocker = blocker_df.iloc[i]
-        next_blocker = blocker_df.iloc[i + 1]
+    # Connects each blocker to the next one with a single LineCollection
+    ax.add_collection(mcollections.LineCollection(np.stack([coordinates[:-1], coordinates[1:]], axis=1), colors=line_color))
+    return ax
 
-        if next_blocker is not None:
-            ax.plot([blocker['x'], next_blocker['x']], [blocker['y'], next_blocker['y']], color=line_color)
 
-    return ax
+def get_snapshot_frame(gameId, playId, week, offense, event=None):
+    """
+    Returns the frameId of a play's snapshot: the first frame of the event from the event index (the play's rows are
+    scanned if it is not indexed), or the last frame of the play without event. None if the play has no such event.
+    """
+    if event is None:
+        return None if offense.empty else int(offense['frameId'].max())
+
+    event_frames = get_play_event_frames(gameId, playId, week, [event])
+    if event_frames is None:
+        event_rows = offense[offense['event'] == event]
+        return None if event_rows.empty else int(event_rows['frameId'].min())
+    return event_frames[0][1] if event_frames else None
+
+
+def plot_play_grid(play_keys, event='tackle', output_path='play_grid.png', n_columns=6, zoomed_view=True,
+                   plot_blockers=False, title=None, field_color='darkgreen', line_color='white', dpi=100):
+    """
+    Draws a snapshot of many plays (e.g. every play of a drive at the tackle) as small multiples of one figure and
+    writes it to a single image or PDF. Plays are loaded in bulk with load_plays(), every panel shows the same field
+    raster (see render_full_field_background) and each team is one scatter collection. Nothing is shown with plt.show().
+    Args:
+        play_keys: (gameId, playId) or (gameId, playId, week) tuples, e.g. select_play_keys(game_ids=[gameId]) or
+            playPrefetchUtils.get_browse_order(gameId, playId, order='drive')
+        event: Event of the snapshot, e.g. 'tackle' or 'ball_snap'. None uses the last frame of each play
+        output_path: .png, .pdf or any other format of matplotlib's savefig
+        n_columns: Panels per row
+        zoomed_view: Shows GRID_WINDOW_YARDS around the football instead of the full field
+        plot_blockers: Displays red line connnecting eligible blockers
+        title: Optional figure title
+        field_color: Default darkgreen
+        line_color: Default white
+        dpi: Resolution of raster outputs
+    Returns:
+        output_path
+    """
+    play_keys = list(play_keys)
+    n_rows = max(1, -(-len(play_keys) // n_columns))
+    window_height = GRID_WINDOW_YARDS if zoomed_view else NFL_FIELD_HEIGHT
+    panel_height = GRID_PANEL_WIDTH * window_height / NFL_FIELD_WIDTH + 0.3  # Room for the panel title
+    title_height = 0.5 if title else 0
+
+    fig = mfigure.Figure(figsize=(GRID_PANEL_WIDTH * n_columns, panel_height * n_rows + title_height), dpi=dpi)
+    backend_agg.FigureCanvasAgg(fig)
+    axes = fig.subplots(n_rows, n_columns, squeeze=False)
+    fig.subplots_adjust(left=0.01, right=0.99, bottom=0.01, top=1 - (0.3 + title_height) / fig.get_figheight(),
+                        wspace=0.05, hspace=0.3 / panel_height * 1.5)
+    [ax.axis('off') for ax in axes.flat]
+
+    background = render_full_field_background(field_color, line_color)
+    repository = get_metadata_repository()
+
+    # load_plays() yields grouped by week and game, each play is drawn in the panel of its position in play_keys
+    panel_positions = {}
+    for position, key in enumerate(play_keys):
+        panel_positions.setdefault((int(key[0]), int(key[1])), []).append(position)
+
+    for (gameId, playId, week), (offense, defense, football) in load_plays(play_keys):
+        ax = axes.flat[panel_positions[(gameId, playId)].pop(0)]
+        ax.imshow(background, extent=(0, NFL_FIELD_WIDTH, 0, NFL_FIELD_HEIGHT), aspect='auto', zorder=0)
+        ax.set_title(f'Game # {gameId} Play # {playId}', fontsize=7)
+        ax.set_xlim(0, NFL_FIELD_WIDTH)
+        ax.set_ylim(0, NFL_FIELD_HEIGHT)
+
+        frameId = get_snapshot_frame(gameId, playId, week, offense, event)
+        if frameId is None:
+            ax.text(NFL_FIELD_WIDTH / 2, NFL_FIELD_HEIGHT / 2, f'No {event}', ha='center', va='center', color='white')
+            continue
+
+        off, de, ft = [df[df['frameId'] == frameId] for df in [offense, defense, football]]
+        ax.scatter(off['x'], off['y'], s=8, color='orangered', zorder=2)
+        ax.scatter(de['x'], de['y'], s=8, color='blue', zorder=2)
+        ax.scatter(ft['x'], ft['y'], s=10, color='brown', marker='D', zorder=3)
+
+        # Line of scrimmage and first down lines
+        line_of_scrimmage, yards_to_go = get_los_details(repository.get_play(gameId, playId), offense)
+        lines_y = [line_of_scrimmage + 10] + ([line_of_scrimmage + 10 + yards_to_go] if yards_to_go else [])
+        ax.add_collection(mcollections.LineCollection([[(0, y), (NFL_FIELD_WIDTH, y)] for y in lines_y],
+                                                      colors='yellow', linewidths=0.8, zorder=1))
+
+        if plot_blockers:
+            plot_blocking_formation(ax, get_blocking_players(off))
+
+        if zoomed_view:
+            center_y = ft['y'].iloc[0] if not ft.empty else line_of_scrimmage + 10
+            y_min = min(max(0, center_y - GRID_WINDOW_YARDS / 2), NFL_FIELD_HEIGHT - GRID_WINDOW_YARDS)
+            ax.set_ylim(y_min, y_min + GRID_WINDOW_YARDS)
+
+    if title:
+        fig.suptitle(title)
+    fig.savefig(output_path, dpi=dpi)
+    return output_path
 
 
 gameId, playId, week = 2022090800, 343, 1
@@ -293,4 +509,5 @@ gameId, playId, week = 2022090800, 343, 1
 # plt.show()
 
 # plot_play_events(playId, gameId, week, zoomed_view=False, plot_blockers=True)
-# plot_play_tracked_movements(playId, gameId, week)
\ No newline at end of file
+# plot_play_tracked_movements(playId, gameId, week)
+# plot_play_grid([(gameId, playId, week)], event='tackle', output_path='tackles.pdf')
\ No newline at end of file